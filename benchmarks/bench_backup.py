@@ -0,0 +1,422 @@
+"""Бенчмарк бэкапов: дамп каждого движка, загрузка на резервный сервер и полный автобэкап.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_backup.py --size-mb 50 --repeat 3 --output before.json
+    python benchmarks/bench_backup.py --compare before.json after.json
+    BACKUP_COMPRESSION=gzip python benchmarks/bench_backup.py --output gzip.json
+
+Фикстуры детерминированы (--seed), поэтому результаты разных запусков сравнимы.
+PostgreSQL, MySQL и MongoDB участвуют, только если на хосте есть их бинарники.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.ssh_standin import ssh_standin
+from utils.local_instances import local_postgres, local_mysql, local_mongo, has_binaries
+from utils.artifacts import artifact_size
+
+ENGINES = ('sqlite', 'psql', 'mysql', 'mongo')
+
+# Примерный размер строки фикстуры в байтах
+ROW_SIZE = 300
+
+# Строк в одной пачке при заполнении фикстур
+BATCH_ROWS = 5000
+
+class RSSSampler:
+    """Пиковый RSS процесса за время этапа (ru_maxrss не сбрасывается между этапами)"""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+    def _current(self) -> int:
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * self._page_size
+        except (OSError, ValueError, IndexError):
+            # Не Linux: только общий максимум процесса
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self._current()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._current())
+
+class Stage:
+    """Замер одного прогона этапа: время, CPU процесса и дочерних процессов, пиковая память"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.bytes = 0
+        self.ok = True
+        self.error: Optional[str] = None
+        self.result: Dict[str, Any] = {}
+
+    async def __aenter__(self):
+        self._self = resource.getrusage(resource.RUSAGE_SELF)
+        self._children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self._sampler = RSSSampler().__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._started
+        self._sampler.__exit__()
+        usage_self = resource.getrusage(resource.RUSAGE_SELF)
+        usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        if exc is not None:
+            self.ok = False
+            self.error = f"{exc_type.__name__}: {exc}"
+
+        self.result = {
+            'ok': self.ok,
+            'error': self.error,
+            'wall_s': wall,
+            'cpu_user_s': usage_self.ru_utime - self._self.ru_utime,
+            'cpu_sys_s': usage_self.ru_stime - self._self.ru_stime,
+            'cpu_children_s': (usage_children.ru_utime - self._children.ru_utime)
+                              + (usage_children.ru_stime - self._children.ru_stime),
+            'peak_rss_mb': self._sampler.peak / 1024 / 1024,
+            # Максимум по всем завершенным дочерним процессам (pg_dump, mysqldump, ...)
+            'peak_child_rss_mb': usage_children.ru_maxrss / 1024,
+            'bytes': self.bytes,
+            'throughput_mb_s': self.bytes / wall / 1024 / 1024 if wall > 0 and self.bytes else None,
+        }
+        # Ошибка этапа попадает в отчет, а не прерывает бенчмарк
+        return True
+
+def summarize(name: str, runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Медиана по повторам; для времени - еще минимум и максимум"""
+    ok_runs = [run for run in runs if run['ok']]
+    summary = {'stage': name, 'runs': len(runs), 'failed': len(runs) - len(ok_runs)}
+    if not ok_runs:
+        summary['error'] = runs[-1]['error'] if runs else None
+        return summary
+
+    walls = [run['wall_s'] for run in ok_runs]
+    summary['wall_s'] = statistics.median(walls)
+    summary['wall_min_s'] = min(walls)
+    summary['wall_max_s'] = max(walls)
+    for key in ('cpu_user_s', 'cpu_sys_s', 'cpu_children_s', 'peak_rss_mb', 'peak_child_rss_mb', 'bytes'):
+        summary[key] = statistics.median(run[key] for run in ok_runs)
+    throughputs = [run['throughput_mb_s'] for run in ok_runs if run['throughput_mb_s']]
+    summary['throughput_mb_s'] = statistics.median(throughputs) if throughputs else None
+    return summary
+
+def make_rows(rng: random.Random, start: int, count: int) -> List[tuple]:
+    """Детерминированные строки фикстуры: (id, name, payload, value)"""
+    alphabet = 'abcdefghijklmnopqrstuvwxyz0123456789'
+    rows = []
+    for row_id in range(start, start + count):
+        name = ''.join(rng.choices(alphabet, k=16))
+        payload = ''.join(rng.choices(alphabet, k=ROW_SIZE - 40))
+        rows.append((row_id, name, payload, rng.random() * 1000))
+    return rows
+
+def row_batches(size_mb: float, seed: int):
+    rng = random.Random(seed)
+    total = max(1, int(size_mb * 1024 * 1024 / ROW_SIZE))
+    for start in range(1, total + 1, BATCH_ROWS):
+        yield make_rows(rng, start, min(BATCH_ROWS, total - start + 1))
+
+def create_sqlite_fixture(path: str, size_mb: float, seed: int):
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE bench (id INTEGER PRIMARY KEY, name TEXT, payload TEXT, value REAL)')
+    for rows in row_batches(size_mb, seed):
+        db.executemany('INSERT INTO bench VALUES (?, ?, ?, ?)', rows)
+    db.commit()
+    db.close()
+
+async def create_psql_fixture(instance: dict, size_mb: float, seed: int):
+    import asyncpg
+    conn = await asyncpg.connect(
+        host=instance['host'], port=instance['port'], user=instance['user'], database=instance['database']
+    )
+    try:
+        await conn.execute('CREATE TABLE bench (id INTEGER PRIMARY KEY, name TEXT, payload TEXT, value DOUBLE PRECISION)')
+        for rows in row_batches(size_mb, seed):
+            await conn.copy_records_to_table('bench', records=rows)
+    finally:
+        await conn.close()
+
+def create_mysql_fixture(instance: dict, size_mb: float, seed: int):
+    import pymysql
+    conn = pymysql.connect(host=instance['host'], port=instance['port'], user=instance['user'], password=instance['password'])
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('CREATE DATABASE bench')
+            cursor.execute('CREATE TABLE bench.bench (id INT PRIMARY KEY, name VARCHAR(32), payload TEXT, value DOUBLE)')
+            for rows in row_batches(size_mb, seed):
+                cursor.executemany('INSERT INTO bench.bench VALUES (%s, %s, %s, %s)', rows)
+        conn.commit()
+    finally:
+        conn.close()
+    instance['database'] = 'bench'
+
+def create_mongo_fixture(instance: dict, size_mb: float, seed: int):
+    from pymongo import MongoClient
+    client = MongoClient(host=instance['host'], port=instance['port'])
+    try:
+        collection = client['bench']['bench']
+        for rows in row_batches(size_mb, seed):
+            collection.insert_many(
+                [{'_id': row_id, 'name': name, 'payload': payload, 'value': value} for row_id, name, payload, value in rows]
+            )
+    finally:
+        client.close()
+    instance['database'] = 'bench'
+
+class FakeBot:
+    """Бот для perform_auto_backup: сообщения сохраняются, а не отправляются"""
+
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.messages.append(text)
+
+def get_git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def engine_available(engine: str) -> Optional[str]:
+    """None - движок доступен, иначе причина пропуска"""
+    binaries = {
+        'psql': ('initdb', 'postgres', 'pg_dump'),
+        'mysql': ('mysqldump',),
+        'mongo': ('mongod', 'mongodump'),
+    }
+    if engine == 'sqlite':
+        return None
+    if not has_binaries(*binaries[engine]):
+        return f"нет бинарников: {', '.join(binaries[engine])}"
+    if engine == 'mysql' and not (has_binaries('mysqld') or has_binaries('mariadbd')):
+        return "нет бинарников: mysqld"
+    if engine == 'psql' and hasattr(os, 'geteuid') and os.geteuid() == 0:
+        return "PostgreSQL нельзя запускать от root"
+    return None
+
+async def start_engine(engine: str, stack, workdir: str, args) -> dict:
+    """Экземпляр движка с фикстурой: словарь подключения в формате таблицы connections"""
+    name = f"bench_{engine}"
+    if engine == 'sqlite':
+        path = os.path.join(workdir, 'fixture.db')
+        await asyncio.to_thread(create_sqlite_fixture, path, args.size_mb, args.seed)
+        return {'id': None, 'name': name, 'db_type': 'sqlite', 'file_path': path}
+
+    if engine == 'psql':
+        instance = await stack.enter_async_context(local_postgres())
+        await create_psql_fixture(instance, args.size_mb, args.seed)
+    elif engine == 'mysql':
+        instance = await stack.enter_async_context(local_mysql())
+        await asyncio.to_thread(create_mysql_fixture, instance, args.size_mb, args.seed)
+    else:
+        instance = await stack.enter_async_context(local_mongo())
+        await asyncio.to_thread(create_mongo_fixture, instance, args.size_mb, args.seed)
+    return {'id': None, 'name': name, 'db_type': engine, **instance}
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    from contextlib import AsyncExitStack
+
+    from utils import db
+    from utils.scheduler import perform_single_backup, upload_to_backup_server, perform_auto_backup
+    from utils.ssh_pool import ssh_manager
+    from utils.jobs import worker_pool
+
+    workdir = tempfile.mkdtemp(prefix='backupbot_bench_')
+    backup_dir = os.path.join(workdir, 'backups')
+    os.makedirs(backup_dir)
+    previous_cwd = os.getcwd()
+
+    report: Dict[str, Any] = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'git_commit': get_git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'size_mb': args.size_mb,
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'compression': os.getenv('BACKUP_COMPRESSION', 'none'),
+            'encrypted': bool(os.getenv('BACKUP_ENCRYPTION_KEY')),
+        },
+        'skipped': {},
+        'fixtures': {},
+        'stages': [],
+    }
+
+    try:
+        # Служебная БД бота (DB_PATH относительный) создается во временном каталоге
+        os.chdir(workdir)
+        os.environ['BACKUP_DIR'] = backup_dir
+        os.environ.setdefault('ADMIN_ID', '0')
+        await db.init_db()
+
+        async with AsyncExitStack() as stack:
+            standin = await stack.enter_async_context(ssh_standin())
+            backup_server = {
+                'id': None, 'name': 'bench', 'remote_path': os.path.join(workdir, 'remote'), **standin.params()
+            }
+            backup_server['id'] = await db.add_backup_server(
+                backup_server['name'], standin.host, standin.port,
+                standin.username, standin.password, backup_server['remote_path']
+            )
+
+            connections = []
+            for engine in args.engines:
+                reason = engine_available(engine)
+                if reason:
+                    report['skipped'][engine] = reason
+                    continue
+                started = time.perf_counter()
+                try:
+                    conn = await start_engine(engine, stack, workdir, args)
+                except Exception as e:
+                    report['skipped'][engine] = f"ошибка запуска: {e}"
+                    continue
+                report['fixtures'][engine] = {'setup_s': time.perf_counter() - started}
+                connections.append(conn)
+
+            for conn in connections:
+                runs, artifact = [], None
+                for _ in range(args.repeat):
+                    async with Stage(f"dump:{conn['db_type']}") as stage:
+                        success, result = await perform_single_backup(conn, backup_dir)
+                        if not success:
+                            raise RuntimeError(result)
+                        artifact = result
+                        stage.bytes = artifact_size(artifact)
+                    runs.append(stage.result)
+                report['stages'].append(summarize(f"dump:{conn['db_type']}", runs))
+                if not artifact:
+                    continue
+
+                runs = []
+                for _ in range(args.repeat):
+                    async with Stage(f"upload:{conn['db_type']}") as stage:
+                        if not await upload_to_backup_server(artifact, backup_server):
+                            raise RuntimeError("загрузка не удалась")
+                        stage.bytes = artifact_size(artifact)
+                    runs.append(stage.result)
+                report['stages'].append(summarize(f"upload:{conn['db_type']}", runs))
+
+            # Полная ночь: все движки в воркерах бэкапов, как в планировщике, с загрузкой
+            if connections and not args.skip_auto:
+                for conn in connections:
+                    fields = {key: conn.get(key) for key in ('host', 'port', 'database', 'user', 'password', 'file_path')}
+                    conn['id'] = await db.add_connection(conn['name'], conn['db_type'], **fields)
+                await worker_pool.start()
+
+                runs = []
+                for _ in range(args.repeat):
+                    shutil.rmtree(backup_dir)
+                    os.makedirs(backup_dir)
+                    bot = FakeBot()
+                    async with Stage('auto_backup') as stage:
+                        await perform_auto_backup(bot)
+                        stage.bytes = sum(artifact_size(os.path.join(backup_dir, entry)) for entry in os.listdir(backup_dir))
+                        if not bot.messages or '❌' in bot.messages[-1].split('Итого')[0]:
+                            raise RuntimeError(bot.messages[-1] if bot.messages else "нет отчета")
+                    runs.append(stage.result)
+                report['stages'].append(summarize('auto_backup', runs))
+    finally:
+        await worker_pool.stop()
+        await ssh_manager.close_all()
+        os.chdir(previous_cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return report
+
+def compare(before_path: str, after_path: str) -> str:
+    """Сравнение двух отчетов по медианному времени и пропускной способности этапов"""
+    with open(before_path) as f:
+        before = {stage['stage']: stage for stage in json.load(f)['stages']}
+    with open(after_path) as f:
+        after = {stage['stage']: stage for stage in json.load(f)['stages']}
+
+    lines = [f"{'stage':<16} {'before, s':>10} {'after, s':>10} {'change':>8} {'MB/s before':>12} {'MB/s after':>11}"]
+    for name in list(dict.fromkeys([*before, *after])):
+        old, new = before.get(name, {}), after.get(name, {})
+        old_wall, new_wall = old.get('wall_s'), new.get('wall_s')
+        change = f"{(new_wall / old_wall - 1) * 100:+.1f}%" if old_wall and new_wall else "-"
+
+        def fmt(value, digits=2):
+            return f"{value:.{digits}f}" if isinstance(value, (int, float)) else "-"
+
+        lines.append(
+            f"{name:<16} {fmt(old_wall, 3):>10} {fmt(new_wall, 3):>10} {change:>8} "
+            f"{fmt(old.get('throughput_mb_s')):>12} {fmt(new.get('throughput_mb_s')):>11}"
+        )
+    return "\n".join(lines)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк дампов, загрузки и автобэкапа")
+    parser.add_argument('--size-mb', type=float, default=20, help="размер фикстуры каждого движка, МБ")
+    parser.add_argument('--engines', default=','.join(ENGINES), help="движки через запятую")
+    parser.add_argument('--repeat', type=int, default=3, help="повторов каждого этапа (в отчете медиана)")
+    parser.add_argument('--seed', type=int, default=42, help="зерно генератора фикстур")
+    parser.add_argument('--skip-auto', action='store_true', help="без этапа полного автобэкапа")
+    parser.add_argument('--keep', action='store_true', help="не удалять временный каталог")
+    parser.add_argument('--output', help="файл для JSON отчета (по умолчанию stdout)")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="сравнить два отчета")
+    args = parser.parse_args(argv)
+    args.engines = [engine.strip() for engine in args.engines.split(',') if engine.strip()]
+    unknown = set(args.engines) - set(ENGINES)
+    if unknown:
+        parser.error(f"неизвестные движки: {', '.join(sorted(unknown))}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        print(compare(*args.compare))
+        return
+
+    report = asyncio.run(run_benchmark(args))
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+"""Бенчмарк SSH: загрузка и скачивание бэкапов, список файлов, команды и восстановление после обрыва.
+
+Все сценарии идут через локальный SSH/SFTP сервер (benchmarks/ssh_standin.py) с эмуляцией канала,
+поэтому задержку и скорость WAN можно воспроизвести на одной машине.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_ssh.py --profile wan --output wan.json
+    python benchmarks/bench_ssh.py --latency-ms 40 --bandwidth-mbit 50 --scenarios upload,shell
+    python benchmarks/bench_ssh.py --compare before.json after.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.ssh_standin import ssh_standin, SSHStandin
+from benchmarks.bench_backup import get_git_commit
+
+SCENARIOS = ('upload', 'download', 'list', 'exec', 'shell', 'reconnect')
+
+# Условия канала: задержка в одну сторону (мс), разброс (мс), скорость (Мбит/с, 0 - без ограничения)
+PROFILES = {
+    'local': (0, 0, 0),
+    'lan': (0.5, 0.2, 1000),
+    'wan': (25, 5, 100),
+    'slow': (100, 20, 10),
+}
+
+# Сколько ждать восстановления команды после обрыва соединения
+RECONNECT_TIMEOUT = 30
+
+SERVER_ID = 1
+
+def percentile(values: List[float], share: float) -> Optional[float]:
+    """Перцентиль по ближайшему рангу"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(share * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+class Scenario:
+    """Результаты сценария: длительность каждой операции и перенесенные байты"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.errors: List[str] = []
+        self.bytes = 0
+        self.wall = 0.0
+
+    async def measure(self, operation: Callable[[], Awaitable[Any]]):
+        """Одна операция; ошибка попадает в отчет и не прерывает сценарий"""
+        started = time.perf_counter()
+        try:
+            await operation()
+        except Exception as e:
+            self.errors.append(f"{type(e).__name__}: {e}")
+            return
+        self.latencies.append(time.perf_counter() - started)
+
+    def summary(self) -> Dict[str, Any]:
+        ms = [latency * 1000 for latency in self.latencies]
+        return {
+            'scenario': self.name,
+            'ops': len(self.latencies),
+            'errors': len(self.errors),
+            'first_error': self.errors[0] if self.errors else None,
+            'wall_s': self.wall,
+            'ops_s': len(self.latencies) / self.wall if self.wall else None,
+            'throughput_mb_s': self.bytes / self.wall / 1024 / 1024 if self.wall and self.bytes else None,
+            'p50_ms': percentile(ms, 0.50),
+            'p95_ms': percentile(ms, 0.95),
+            'p99_ms': percentile(ms, 0.99),
+            'max_ms': max(ms) if ms else None,
+        }
+
+async def run_concurrently(scenario: Scenario, count: int, concurrency: int, operation: Callable[[int], Awaitable[Any]]):
+    """count операций, не больше concurrency одновременно; общее время - в scenario.wall"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int):
+        async with semaphore:
+            await scenario.measure(lambda: operation(index))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(count)))
+    scenario.wall = time.perf_counter() - started
+
+def expect(result, what: str):
+    """Функции бота возвращают (успех, ...): неуспех становится ошибкой операции"""
+    if not result[0]:
+        raise RuntimeError(f"{what}: {result[-1]}")
+    return result
+
+async def bench_upload(server: SSHStandin, workdir: str, args) -> Scenario:
+    from utils.backup_transfer import backup_transfer
+
+    scenario = Scenario('upload')
+    local_path = os.path.join(workdir, 'upload.sql')
+    with open(local_path, 'wb') as f:
+        f.write(os.urandom(int(args.file_mb * 1024 * 1024)))
+    remote_path = os.path.join(workdir, 'remote')
+
+    async def upload(_):
+        expect(await backup_transfer.connect(SERVER_ID, **server.params()), "подключение")
+        try:
+            expect(await backup_transfer.upload_backup(SERVER_ID, local_path, remote_path), "загрузка")
+        finally:
+            await backup_transfer.close_connection(SERVER_ID)
+        scenario.bytes += os.path.getsize(local_path)
+
+    # Параллельные загрузки идут каналами одного соединения, как в автобэкапе
+    await run_concurrently(scenario, args.repeat, args.parallel, upload)
+    return scenario
+
+async def bench_download(server: SSHStandin, workdir: str, args) -> Scenario:
+    from utils.backup_sqlite import backup_sqlite_ssh
+
+    scenario = Scenario('download')
+    remote_file = os.path.join(workdir, 'remote.db')
+    with open(remote_file, 'wb') as f:
+        f.write(os.urandom(int(args.file_mb * 1024 * 1024)))
+
+    async def download(index: int):
+        local_path = os.path.join(workdir, f"download_{index}.db")
+        expect(await backup_sqlite_ssh(
+            server.host, server.port, server.username, server.password, remote_file, local_path, 'bench'
+        ), "скачивание")
+        scenario.bytes += os.path.getsize(local_path)
+        os.remove(local_path)
+
+    await run_concurrently(scenario, args.repeat, args.parallel, download)
+    return scenario
+
+async def bench_list(server: SSHStandin, workdir: str, args) -> Scenario:
+    from utils.backup_transfer import backup_transfer
+
+    scenario = Scenario('list')
+    remote_path = os.path.join(workdir, 'listing')
+    os.makedirs(remote_path)
+    for index in range(args.files):
+        open(os.path.join(remote_path, f"bench_{index:05d}.sql.gz"), 'w').close()
+
+    async def list_files(_):
+        _, files, _ = expect(await backup_transfer.list_backup_files(SERVER_ID, remote_path), "список файлов")
+        if len(files) != args.files:
+            raise RuntimeError(f"получено {len(files)} файлов из {args.files}")
+
+    expect(await backup_transfer.connect(SERVER_ID, **server.params()), "подключение")
+    try:
+        await run_concurrently(scenario, args.commands, 1, list_files)
+    finally:
+        await backup_transfer.close_connection(SERVER_ID)
+    return scenario
+
+async def bench_exec(server: SSHStandin, workdir: str, args) -> Scenario:
+    from utils.ssh_pool import ssh_manager
+
+    scenario = Scenario('exec')
+
+    async def run(_):
+        completed = await ssh_manager.run(server.host, server.port, server.username, server.password, "true")
+        if completed.exit_status != 0:
+            raise RuntimeError(f"код {completed.exit_status}")
+
+    # Отдельная команда = отдельный канал поверх соединения из пула
+    await run_concurrently(scenario, args.commands, args.concurrency, run)
+    return scenario
+
+async def bench_shell(server: SSHStandin, workdir: str, args) -> Scenario:
+    from utils.ssh_client import ssh_client
+
+    scenario = Scenario('shell')
+    expect(await ssh_client.connect(SERVER_ID, **server.params()), "подключение")
+
+    async def run(index: int):
+        expect(await ssh_client.execute_command(SERVER_ID, f"echo {index}"), "команда")
+
+    try:
+        # Оболочка SSH менеджера одна на сервер: команды идут по очереди
+        await run_concurrently(scenario, args.commands, 1, run)
+    finally:
+        await ssh_client.close_connection(SERVER_ID)
+    return scenario
+
+async def bench_reconnect(server: SSHStandin, workdir: str, args) -> Scenario:
+    """Время от обрыва соединения до первой успешной команды в SSH менеджере"""
+    from utils.ssh_client import ssh_client
+
+    scenario = Scenario('reconnect')
+    expect(await ssh_client.connect(SERVER_ID, **server.params()), "подключение")
+
+    async def recover(_):
+        server.disconnect_all()
+        deadline = time.monotonic() + RECONNECT_TIMEOUT
+        while True:
+            success, _, output = await ssh_client.execute_command(SERVER_ID, "true")
+            if success:
+                return
+            if time.monotonic() > deadline:
+                raise RuntimeError(output)
+            await asyncio.sleep(0.05)
+
+    try:
+        await run_concurrently(scenario, args.repeat, 1, recover)
+    finally:
+        await ssh_client.close_connection(SERVER_ID)
+    return scenario
+
+BENCHMARKS = {
+    'upload': bench_upload,
+    'download': bench_download,
+    'list': bench_list,
+    'exec': bench_exec,
+    'shell': bench_shell,
+    'reconnect': bench_reconnect,
+}
+
+async def run_benchmark(args) -> Dict[str, Any]:
+    from utils.ssh_pool import ssh_manager
+
+    latency_ms, jitter_ms, bandwidth_mbit = PROFILES[args.profile]
+    if args.latency_ms is not None:
+        latency_ms = args.latency_ms
+    if args.jitter_ms is not None:
+        jitter_ms = args.jitter_ms
+    if args.bandwidth_mbit is not None:
+        bandwidth_mbit = args.bandwidth_mbit
+
+    report: Dict[str, Any] = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'git_commit': get_git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'link': {
+            'profile': args.profile,
+            'latency_ms': latency_ms,
+            'jitter_ms': jitter_ms,
+            'bandwidth_mbit': bandwidth_mbit,
+        },
+        'params': {
+            'file_mb': args.file_mb,
+            'files': args.files,
+            'commands': args.commands,
+            'concurrency': args.concurrency,
+            'parallel': args.parallel,
+            'repeat': args.repeat,
+        },
+        'scenarios': [],
+    }
+
+    workdir = tempfile.mkdtemp(prefix='backupbot_bench_ssh_')
+    try:
+        async with ssh_standin(
+            latency=latency_ms / 1000,
+            jitter=jitter_ms / 1000,
+            bandwidth=int(bandwidth_mbit * 1000 * 1000 / 8),
+            seed=args.seed
+        ) as server:
+            for name in args.scenarios:
+                scenario = await BENCHMARKS[name](server, workdir, args)
+                report['scenarios'].append(scenario.summary())
+                # Каждый сценарий начинается с нового соединения
+                await ssh_manager.close_all()
+            report['link']['connections'] = server.accepted
+    finally:
+        await ssh_manager.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return report
+
+def compare(before_path: str, after_path: str) -> str:
+    """Сравнение двух отчетов: медиана и хвост задержки, скорость или число операций в секунду"""
+    with open(before_path) as f:
+        before = {scenario['scenario']: scenario for scenario in json.load(f)['scenarios']}
+    with open(after_path) as f:
+        after = {scenario['scenario']: scenario for scenario in json.load(f)['scenarios']}
+
+    def fmt(value, digits=1):
+        return f"{value:.{digits}f}" if isinstance(value, (int, float)) else "-"
+
+    def rate(scenario):
+        value = scenario.get('throughput_mb_s')
+        return f"{fmt(value, 2)} MB/s" if value else f"{fmt(scenario.get('ops_s'))} op/s"
+
+    lines = [f"{'scenario':<10} {'p50 ms':>17} {'p99 ms':>17} {'rate':>27}"]
+    for name in list(dict.fromkeys([*before, *after])):
+        old, new = before.get(name, {}), after.get(name, {})
+        lines.append(
+            f"{name:<10} {fmt(old.get('p50_ms')):>8} {fmt(new.get('p50_ms')):>8} "
+            f"{fmt(old.get('p99_ms')):>8} {fmt(new.get('p99_ms')):>8} "
+            f"{rate(old):>13} {rate(new):>13}"
+        )
+    return "\n".join(lines)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк передачи файлов и команд по SSH с эмуляцией канала")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='wan', help="условия канала")
+    parser.add_argument('--latency-ms', type=float, help="задержка в одну сторону, мс (вместо профиля)")
+    parser.add_argument('--jitter-ms', type=float, help="случайная добавка к задержке, мс")
+    parser.add_argument('--bandwidth-mbit', type=float, help="скорость канала, Мбит/с (0 - без ограничения)")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="сценарии через запятую")
+    parser.add_argument('--file-mb', type=float, default=10, help="размер файла для загрузки и скачивания, МБ")
+    parser.add_argument('--files', type=int, default=500, help="число файлов в каталоге для списка")
+    parser.add_argument('--commands', type=int, default=200, help="число команд и запросов списка")
+    parser.add_argument('--concurrency', type=int, default=10, help="одновременных exec команд")
+    parser.add_argument('--parallel', type=int, default=1, help="одновременных загрузок и скачиваний")
+    parser.add_argument('--repeat', type=int, default=5, help="загрузок, скачиваний и обрывов соединения")
+    parser.add_argument('--seed', type=int, default=42, help="зерно разброса задержки")
+    parser.add_argument('--output', help="файл для JSON отчета (по умолчанию stdout)")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="сравнить два отчета")
+    args = parser.parse_args(argv)
+    args.scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"неизвестные сценарии: {', '.join(sorted(unknown))}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        print(compare(*args.compare))
+        return
+
+    report = asyncio.run(run_benchmark(args))
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""Бенчмарк запуска бота: время импорта main.py и время до первого опроса Telegram.
+
+Бот запускается отдельным процессом против локального сервера Bot API (TELEGRAM_API_URL),
+время до первого getUpdates - это время, через которое перезапущенный бот снова отвечает.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_startup.py --repeat 5 --output startup.json
+    python benchmarks/bench_startup.py --check          # ошибка, если драйверы БД или SSH загружаются при старте
+    python benchmarks/bench_startup.py --compare before.json after.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import asyncio
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.bench_backup import compare, get_git_commit
+
+# Модули, которые не должны загружаться при старте: нужны только при работе с конкретной БД или SSH
+DRIVERS = ('asyncpg', 'pymysql', 'pymongo', 'asyncssh', 'paramiko')
+
+# Сколько ждать первого опроса, прежде чем считать запуск неудачным
+START_TIMEOUT = 60
+
+IMPORT_SNIPPET = f"""
+import sys, time, json
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'drivers': [name for name in {DRIVERS!r} if name in sys.modules]}}))
+"""
+
+def summarize(name: str, values: List[float]) -> Dict[str, Any]:
+    """Медиана, минимум и максимум в формате этапов bench_backup"""
+    if not values:
+        return {'stage': name, 'runs': 0}
+    return {
+        'stage': name,
+        'runs': len(values),
+        'wall_s': statistics.median(values),
+        'wall_min_s': min(values),
+        'wall_max_s': max(values),
+    }
+
+def measure_import() -> Dict[str, Any]:
+    """Импорт main.py в новом интерпретаторе: время импорта, время процесса и загруженные драйверы"""
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-c', IMPORT_SNIPPET], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['process_seconds'] = time.perf_counter() - started
+    return result
+
+def import_breakdown(limit: int = 15) -> List[Dict[str, Any]]:
+    """Самые тяжелые модули по python -X importtime (накопленное время, мс)"""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'], cwd=ROOT, capture_output=True, text=True
+    )
+    modules = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        parts = line.split(':', 1)[1].split('|')
+        if len(parts) != 3:
+            continue
+        _, cumulative_us, name = parts
+        # Только импорты верхнего уровня main.py и их прямые зависимости
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        if depth <= 2:
+            modules.append({'module': name.strip(), 'depth': depth, 'cumulative_ms': int(cumulative_us) / 1000})
+    modules.sort(key=lambda module: module['cumulative_ms'], reverse=True)
+    return modules[:limit]
+
+class FakeBotAPI:
+    """Локальный сервер Bot API: отвечает на getMe и getUpdates, запоминает время запросов"""
+
+    def __init__(self):
+        self.first_request: Optional[float] = None
+        self.first_poll: Optional[float] = None
+        self.polled = asyncio.Event()
+
+    async def handle(self, request):
+        from aiohttp import web
+
+        now = time.perf_counter()
+        method = request.match_info['method']
+        if self.first_request is None:
+            self.first_request = now
+
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+        elif method == 'getUpdates':
+            if self.first_poll is None:
+                self.first_poll = now
+                self.polled.set()
+            # Длинный опрос без обновлений
+            await asyncio.sleep(1)
+            result = []
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+async def measure_first_poll(workdir: str) -> Dict[str, float]:
+    """Время от запуска процесса бота до первого запроса к API и до первого getUpdates"""
+    from aiohttp import web
+
+    api = FakeBotAPI()
+    app = web.Application()
+    app.router.add_post('/bot{token}/{method}', api.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+
+    env = dict(
+        os.environ,
+        BOT_TOKEN='123456:bench',
+        ADMIN_ID='1',
+        TELEGRAM_API_URL=f"http://127.0.0.1:{port}",
+        BACKUP_DIR=os.path.join(workdir, 'backups'),
+        TRACE_DIR=os.path.join(workdir, 'traces'),
+        METRICS_PORT='0',
+    )
+    # Служебная БД и логи бота - во временном каталоге
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(ROOT, 'main.py'),
+        cwd=workdir, env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+    )
+    polled = asyncio.create_task(api.polled.wait())
+    exited = asyncio.create_task(process.wait())
+    try:
+        # Бот, упавший при запуске, не должен ждать полный таймаут
+        await asyncio.wait({polled, exited}, timeout=START_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+        if not polled.done():
+            log_path = os.path.join(workdir, 'logs', 'bot.log')
+            log = open(log_path, errors='ignore').read()[-500:] if os.path.exists(log_path) else ""
+            raise RuntimeError(f"Бот не начал опрос: {log}")
+    finally:
+        polled.cancel()
+        exited.cancel()
+        if process.returncode is None:
+            process.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(process.wait(), timeout=10)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        await runner.cleanup()
+
+    return {
+        'first_request': api.first_request - started,
+        'first_poll': api.first_poll - started,
+    }
+
+def run_benchmark(args) -> Dict[str, Any]:
+    report: Dict[str, Any] = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'git_commit': get_git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeat': args.repeat,
+        },
+        'stages': [],
+    }
+
+    # Прогрев: компиляция .pyc и файловый кэш не должны попасть в замеры
+    for _ in range(args.warmup):
+        measure_import()
+
+    imports, processes, drivers = [], [], set()
+    for _ in range(args.repeat):
+        result = measure_import()
+        imports.append(result['seconds'])
+        processes.append(result['process_seconds'])
+        drivers.update(result['drivers'])
+
+    first_requests, first_polls = [], []
+    for _ in range(args.repeat):
+        workdir = tempfile.mkdtemp(prefix='backupbot_bench_start_')
+        try:
+            result = asyncio.run(measure_first_poll(workdir))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        first_requests.append(result['first_request'])
+        first_polls.append(result['first_poll'])
+
+    report['stages'] += [
+        summarize('import_main', imports),
+        summarize('import_process', processes),
+        summarize('first_api_request', first_requests),
+        summarize('first_poll', first_polls),
+    ]
+    report['drivers_loaded_at_startup'] = sorted(drivers)
+    report['import_breakdown'] = import_breakdown()
+    return report
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк запуска бота")
+    parser.add_argument('--repeat', type=int, default=5, help="число запусков (в отчете медиана)")
+    parser.add_argument('--warmup', type=int, default=1, help="прогревочных импортов перед замерами")
+    parser.add_argument('--check', action='store_true', help="код выхода 1, если драйверы загружаются при старте")
+    parser.add_argument('--output', help="файл для JSON отчета (по умолчанию stdout)")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="сравнить два отчета")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        print(compare(*args.compare))
+        return
+
+    report = run_benchmark(args)
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.check and report['drivers_loaded_at_startup']:
+        print(f"Загружены при старте: {', '.join(report['drivers_loaded_at_startup'])}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
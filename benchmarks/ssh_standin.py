@@ -0,0 +1,251 @@
+"""Локальный SSH/SFTP сервер для тестов и бенчмарков передачи файлов и команд.
+
+Сервер asyncssh обслуживает exec, интерактивную оболочку (как в SSH менеджере) и SFTP.
+Клиенты подключаются через TCP прокси, который эмулирует канал: задержку в каждую
+сторону, разброс задержки, ограничение скорости и обрывы соединения.
+
+    async with ssh_standin(latency=0.05, bandwidth=10 * 1024 * 1024) as server:
+        await ssh_manager.run(server.host, server.port, server.username, server.password, "true")
+        server.link.latency = 0.2      # условия меняются на лету
+        server.disconnect_all()        # обрыв всех соединений (RST)
+        server.link.blackhole = True   # соединения живы, но данные пропадают
+"""
+import random
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+import asyncssh
+
+# Размер чтения из сокета и очередь чанков в каждую сторону (буфер "маршрутизатора")
+CHUNK_SIZE = 64 * 1024
+QUEUE_CHUNKS = 256
+
+class _StandinServer(asyncssh.SSHServer):
+    """Вход только по заданному паролю"""
+
+    def __init__(self, username: str, password: str):
+        self.username = username
+        self.password = password
+
+    def begin_auth(self, username: str) -> bool:
+        return True
+
+    def password_auth_supported(self) -> bool:
+        return True
+
+    def validate_password(self, username: str, password: str) -> bool:
+        return username == self.username and password == self.password
+
+async def _run_command(process: asyncssh.SSHServerProcess):
+    """Команда выполняется локальной оболочкой, без команды - интерактивный bash на каналах"""
+    if process.command:
+        local = await asyncio.create_subprocess_shell(
+            process.command,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        await process.redirect(stdout=local.stdout, stderr=local.stderr)
+    else:
+        local = await asyncio.create_subprocess_exec(
+            'bash', '--norc', '--noprofile',
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT
+        )
+        await process.redirect(stdin=local.stdin, stdout=local.stdout)
+
+    try:
+        status = await local.wait()
+    except asyncio.CancelledError:
+        # Клиент отключился: локальный процесс не должен пережить канал
+        with suppress(ProcessLookupError):
+            local.kill()
+        raise
+    await process.stdout.drain()
+    process.exit(status)
+
+class LinkConditions:
+    """Параметры эмулируемого канала; меняются во время работы"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        bandwidth: int = 0,
+        drop_after: int = 0,
+        seed: Optional[int] = None
+    ):
+        # Задержка в одну сторону и ее случайная добавка (секунды)
+        self.latency = latency
+        self.jitter = jitter
+        # Скорость в каждую сторону, байт/с (0 - без ограничения)
+        self.bandwidth = bandwidth
+        # Обрыв соединения после стольких байт в обе стороны (0 - не обрывать)
+        self.drop_after = drop_after
+        # Данные пропадают, соединение не закрывается (зависший сервер или сеть)
+        self.blackhole = False
+        self._random = random.Random(seed)
+
+    def delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        return self.latency + self._random.uniform(0, self.jitter)
+
+class _ProxiedConnection:
+    """Одно клиентское соединение через эмулятор канала"""
+
+    def __init__(self, link: LinkConditions):
+        self.link = link
+        self.transferred = 0
+        self.tasks: Set[asyncio.Task] = set()
+        self.writers = []
+
+    def abort(self):
+        for writer in self.writers:
+            writer.transport.abort()
+        for task in self.tasks:
+            task.cancel()
+
+    async def serve(self, client_reader, client_writer, upstream_port: int):
+        try:
+            server_reader, server_writer = await asyncio.open_connection('127.0.0.1', upstream_port)
+        except OSError:
+            client_writer.transport.abort()
+            return
+        self.writers = [client_writer, server_writer]
+        self.tasks = {
+            asyncio.create_task(self._pump(client_reader, server_writer)),
+            asyncio.create_task(self._pump(server_reader, client_writer)),
+        }
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        for writer in self.writers:
+            writer.close()
+
+    async def _pump(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Передача в одну сторону: чанк уходит не раньше, чем истечет задержка,
+        и занимает канал на время len/bandwidth"""
+        queue: asyncio.Queue = asyncio.Queue(QUEUE_CHUNKS)
+        loop = asyncio.get_running_loop()
+
+        async def receive():
+            last_due = 0.0
+            while True:
+                data = await reader.read(CHUNK_SIZE)
+                # Разброс задержки не меняет порядок байт
+                last_due = max(last_due, loop.time() + self.link.delay())
+                await queue.put((last_due, data))
+                if not data:
+                    return
+                self.transferred += len(data)
+                if self.link.drop_after and self.transferred >= self.link.drop_after:
+                    self.abort()
+                    return
+
+        async def deliver():
+            while True:
+                due, data = await queue.get()
+                wait = due - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                if not data:
+                    with suppress(OSError):
+                        writer.write_eof()
+                    return
+                if self.link.blackhole:
+                    continue
+                writer.write(data)
+                await writer.drain()
+                if self.link.bandwidth:
+                    await asyncio.sleep(len(data) / self.link.bandwidth)
+
+        receiver = asyncio.create_task(receive())
+        try:
+            await deliver()
+            await receiver
+        except (ConnectionError, OSError):
+            self.abort()
+        finally:
+            receiver.cancel()
+
+class SSHStandin:
+    """Запущенный сервер: адрес для клиентов, параметры канала и управление соединениями"""
+
+    def __init__(self, host: str, port: int, username: str, password: str, link: LinkConditions):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.link = link
+        self.connections: Set[_ProxiedConnection] = set()
+        self.accepted = 0
+        self._handlers: Set[asyncio.Task] = set()
+
+    def params(self) -> Dict[str, Any]:
+        """Параметры подключения в формате таблиц ssh_servers и backup_servers"""
+        return {'host': self.host, 'port': self.port, 'username': self.username, 'password': self.password}
+
+    def disconnect_all(self) -> int:
+        """Обрыв всех текущих соединений; возвращает их число"""
+        connections = list(self.connections)
+        for connection in connections:
+            connection.abort()
+        return len(connections)
+
+    async def close(self):
+        """Обрыв соединений и ожидание их обработчиков"""
+        self.disconnect_all()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+
+    async def _accept(self, reader, writer, upstream_port: int):
+        connection = _ProxiedConnection(self.link)
+        handler = asyncio.current_task()
+        self.connections.add(connection)
+        self._handlers.add(handler)
+        self.accepted += 1
+        try:
+            await connection.serve(reader, writer, upstream_port)
+        finally:
+            self.connections.discard(connection)
+            self._handlers.discard(handler)
+
+@asynccontextmanager
+async def ssh_standin(
+    username: str = 'bench',
+    password: str = 'bench',
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    bandwidth: int = 0,
+    drop_after: int = 0,
+    seed: Optional[int] = None
+) -> AsyncIterator[SSHStandin]:
+    """Локальный SSH сервер с exec, оболочкой и SFTP за эмулятором канала на случайном порту"""
+    host_key = asyncssh.generate_private_key('ssh-ed25519')
+    server = await asyncssh.listen(
+        '127.0.0.1', 0,
+        server_factory=lambda: _StandinServer(username, password),
+        server_host_keys=[host_key],
+        process_factory=_run_command,
+        sftp_factory=True,
+        # Оболочка SSH менеджера запрашивает PTY: построчный редактор сервера не нужен
+        line_editor=False,
+        encoding=None
+    )
+    upstream_port = server.sockets[0].getsockname()[1]
+
+    link = LinkConditions(latency, jitter, bandwidth, drop_after, seed)
+    standin = SSHStandin('127.0.0.1', 0, username, password, link)
+    proxy = await asyncio.start_server(
+        lambda reader, writer: standin._accept(reader, writer, upstream_port), '127.0.0.1', 0
+    )
+    standin.port = proxy.sockets[0].getsockname()[1]
+
+    try:
+        yield standin
+    finally:
+        proxy.close()
+        await standin.close()
+        await proxy.wait_closed()
+        server.close()
+        await server.wait_closed()
@@ -13,9 +13,10 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from utils.db import (
     add_connection, get_connections, get_connection,
     update_connection_enabled, delete_connection, get_recent_logs,
-    update_connection, get_enabled_backup_server
+    update_connection, get_enabled_backup_servers, get_recent_verifications
 )
-from utils.connection_test import test_connection
+from utils.connection_test import test_connection, test_all_connections
+from utils.health import health_monitor, format_health
 
 router = Router()
 
@@ -107,16 +108,50 @@ async def menu_connections(callback_query: CallbackQuery, state: FSMContext):
         status = "✅" if conn['enabled'] else "❌"
         db_info = conn['database'] or conn['file_path'] or 'N/A'
         text += f"{status} {conn['name']} ({conn['db_type']})\n"
-        text += f"   ID: {conn['id']} | БД: {db_info}\n\n"
+        text += f"   ID: {conn['id']} | БД: {db_info}\n"
+        if conn['enabled']:
+            text += f"   Состояние: {format_health(health_monitor.get('connection', conn['id']))}\n"
+        text += "\n"
     
     keyboard = InlineKeyboardBuilder()
     for conn in connections:
         keyboard.button(text=f"✏️ {conn['name']}", callback_data=f"conn_edit_{conn['id']}")
+    keyboard.button(text="🔗 Проверить все", callback_data="check_all_connections")
     keyboard.button(text="🔙 Назад", callback_data="menu_main")
     keyboard.adjust(1)
     
     await callback_query.message.edit_text(text, reply_markup=keyboard.as_markup())
 
+# Одновременная проверка всех подключений
+@router.callback_query(F.data == "check_all_connections")
+async def check_all_connections(callback_query: CallbackQuery):
+    connections = await get_connections()
+    if not connections:
+        await callback_query.answer("📭 Нет сохраненных подключений")
+        return
+    
+    await callback_query.message.edit_text(f"🔍 Проверяю подключения ({len(connections)})...")
+    
+    started = asyncio.get_running_loop().time()
+    results = await test_all_connections(connections)
+    elapsed = asyncio.get_running_loop().time() - started
+    
+    success_count = sum(1 for _, success, _ in results if success)
+    text = f"🔗 Проверка подключений: {success_count}/{len(results)} успешно\n\n"
+    for conn, success, message in results:
+        if success:
+            text += f"✅ {conn['name']} ({conn['db_type']})\n"
+        else:
+            text += f"❌ {conn['name']} ({conn['db_type']}): {message.splitlines()[0] if message else ''}\n"
+    text += f"\n⏱ Время проверки: {elapsed:.1f} с"
+    
+    keyboard = InlineKeyboardBuilder()
+    keyboard.button(text="🔄 Повторить", callback_data="check_all_connections")
+    keyboard.button(text="🔙 Назад", callback_data="menu_connections")
+    keyboard.adjust(1)
+    
+    await callback_query.message.edit_text(text[:4000], reply_markup=keyboard.as_markup())
+
 # Меню редактирования подключения
 @router.callback_query(F.data.startswith("conn_edit_"))
 async def conn_edit(callback_query: CallbackQuery, state: FSMContext):
@@ -149,8 +184,18 @@ async def conn_edit(callback_query: CallbackQuery, state: FSMContext):
             text += "SSH Password: ******\n"
         text += f"File Path: {connection['file_path']}\n"
     
-    text += f"Автобэкап: {'✅ Включен' if connection['enabled'] else '❌ Выключен'}\n\n"
-    text += "Выберите действие:"
+    text += f"Автобэкап: {'✅ Включен' if connection['enabled'] else '❌ Выключен'}\n"
+    text += f"Воркер: {connection.get('affinity') or 'любой'}\n"
+    
+    health = health_monitor.get('connection', connection_id)
+    if health and health.success is not None:
+        text += f"Состояние: {format_health(health)}\n"
+        if health.version:
+            text += f"Версия: {health.version}\n"
+        if health.size:
+            text += f"Размер: {health.size}\n"
+    
+    text += "\nВыберите действие:"
     
     keyboard = InlineKeyboardBuilder()
     
@@ -164,6 +209,7 @@ async def conn_edit(callback_query: CallbackQuery, state: FSMContext):
         keyboard.button(text="📁 File Path", callback_data=f"edit_file_{connection_id}")
     
     keyboard.button(text="📝 Name", callback_data=f"edit_name_{connection_id}")
+    keyboard.button(text="🌍 Воркер", callback_data=f"edit_affinity_{connection_id}")
     keyboard.button(text="🔗 Проверить подключение", callback_data=f"test_{connection_id}")
     keyboard.button(text="🔄 Автобэкап", callback_data=f"toggle_{connection_id}")
     keyboard.button(text="❌ Удалить", callback_data=f"del_confirm_{connection_id}")
@@ -876,10 +922,10 @@ async def menu_autobackup(callback_query: CallbackQuery):
         status = "✅" if conn['enabled'] else "❌"
         text += f"{status} {conn['name']}\n"
     
-    # Добавляем информацию о резервном сервере
-    backup_server = await get_enabled_backup_server()
-    if backup_server:
-        text += f"\n📦 Резервный сервер: ✅ {backup_server['name']}"
+    # Добавляем информацию о резервных серверах (бэкап загружается на каждый)
+    backup_servers = await get_enabled_backup_servers()
+    if backup_servers:
+        text += f"\n📦 Резервные серверы: ✅ {', '.join(server['name'] for server in backup_servers)}"
     else:
         text += f"\n📦 Резервный сервер: ❌ Не настроен"
     
@@ -909,18 +955,48 @@ async def menu_logs(callback_query: CallbackQuery):
             status = "✅" if log['success'] else "❌"
             timestamp = log['created_at'][:19] if log['created_at'] else "N/A"
             text += f"{status} {log['connection_name']}\n"
-            text += f"   {timestamp}\n"
+            worker = f" · {log['worker']}" if log.get('worker') else ""
+            text += f"   {timestamp}{worker}\n"
             if not log['success'] and log['error_message']:
                 error_short = log['error_message'][:50] + "..." if len(log['error_message']) > 50 else log['error_message']
                 text += f"   Ошибка: {error_short}\n"
             text += "\n"
     
     keyboard = InlineKeyboardBuilder()
+    keyboard.button(text="🧪 Проверки восстановления", callback_data="menu_verifications")
     keyboard.button(text="🔙 Назад", callback_data="menu_main")
     keyboard.adjust(1)
     
     await callback_query.message.edit_text(text, reply_markup=keyboard.as_markup())
 
+# Результаты проверки восстановления
+@router.callback_query(F.data == "menu_verifications")
+async def menu_verifications(callback_query: CallbackQuery):
+    verifications = await get_recent_verifications(10)
+    
+    if not verifications:
+        text = "🧪 Проверки восстановления\n\n📭 Проверок еще не было"
+    else:
+        text = "🧪 Последние 10 проверок восстановления:\n\n"
+        for item in verifications:
+            status = "✅" if item['success'] else "❌"
+            timestamp = item['created_at'][:19] if item['created_at'] else "N/A"
+            text += f"{status} {item['connection_name']}\n"
+            text += f"   {timestamp}\n"
+            if item['success']:
+                total_rows = sum(item['row_counts'].values())
+                text += f"   ⏱️ {item['restore_seconds']:.1f} с | таблиц: {len(item['row_counts'])} | строк: {total_rows}\n"
+            elif item['error_message']:
+                error_short = item['error_message'][:50] + "..." if len(item['error_message']) > 50 else item['error_message']
+                text += f"   Ошибка: {error_short}\n"
+            text += "\n"
+    
+    keyboard = InlineKeyboardBuilder()
+    keyboard.button(text="🔙 Назад", callback_data="menu_logs")
+    keyboard.adjust(1)
+    
+    await callback_query.message.edit_text(text, reply_markup=keyboard.as_markup())
+
 # Обработчики для остальных функций (тестирование, удаление и т.д.)
 @router.callback_query(F.data.startswith("test_"))
 async def test_connection_handler(callback_query: CallbackQuery):
@@ -1070,7 +1146,8 @@ async def edit_field_start(callback_query: CallbackQuery, state: FSMContext):
         'db': 'базу данных',
         'user': 'пользователя',
         'pass': 'пароль',
-        'file': 'путь к файлу'
+        'file': 'путь к файлу',
+        'affinity': 'метку воркера (регион или хост; "-" - любой воркер)'
     }
     
     field_key = {
@@ -1080,7 +1157,8 @@ async def edit_field_start(callback_query: CallbackQuery, state: FSMContext):
         'db': 'database',
         'user': 'user',
         'pass': 'password',
-        'file': 'file_path'
+        'file': 'file_path',
+        'affinity': 'affinity'
     }
     
     field_display = field_names.get(field_type)
@@ -1090,7 +1168,7 @@ async def edit_field_start(callback_query: CallbackQuery, state: FSMContext):
         await callback_query.answer("❌ Неизвестное поле")
         return
     
-    current_value = connection.get(field_name, 'не установлено')
+    current_value = connection.get(field_name) or 'не установлено'
     if field_name == 'password':
         current_value = '******'
     
@@ -1130,6 +1208,12 @@ async def process_edit_field(message: Message, state: FSMContext):
             await message.answer("❌ Порт должен быть числом. Попробуйте еще раз:")
             return
     
+    # Бэкап без метки выполняет любой воркер
+    if field_name == 'affinity':
+        new_value = new_value.strip()
+        if new_value in ('', '-'):
+            new_value = None
+    
     # Обновление подключения
     success = await update_connection(connection_id, {field_name: new_value})
     
@@ -1166,8 +1250,18 @@ async def conn_edit_by_id(message: Message, connection_id: int):
             text += "SSH Password: ******\n"
         text += f"File Path: {connection['file_path']}\n"
     
-    text += f"Автобэкап: {'✅ Включен' if connection['enabled'] else '❌ Выключен'}\n\n"
-    text += "Выберите действие:"
+    text += f"Автобэкап: {'✅ Включен' if connection['enabled'] else '❌ Выключен'}\n"
+    text += f"Воркер: {connection.get('affinity') or 'любой'}\n"
+    
+    health = health_monitor.get('connection', connection_id)
+    if health and health.success is not None:
+        text += f"Состояние: {format_health(health)}\n"
+        if health.version:
+            text += f"Версия: {health.version}\n"
+        if health.size:
+            text += f"Размер: {health.size}\n"
+    
+    text += "\nВыберите действие:"
     
     keyboard = InlineKeyboardBuilder()
     
@@ -1181,6 +1275,7 @@ async def conn_edit_by_id(message: Message, connection_id: int):
         keyboard.button(text="📁 File Path", callback_data=f"edit_file_{connection_id}")
     
     keyboard.button(text="📝 Name", callback_data=f"edit_name_{connection_id}")
+    keyboard.button(text="🌍 Воркер", callback_data=f"edit_affinity_{connection_id}")
     keyboard.button(text="🔗 Проверить подключение", callback_data=f"test_{connection_id}")
     keyboard.button(text="🔄 Автобэкап", callback_data=f"toggle_{connection_id}")
     keyboard.button(text="❌ Удалить", callback_data=f"del_confirm_{connection_id}")
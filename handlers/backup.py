@@ -1,18 +1,33 @@
 import os
 import glob
 import re
+import asyncio
+import logging
 from aiogram import Router, F
+from aiogram.fsm.context import FSMContext
 from datetime import datetime
 from aiogram.types import (
-    Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, FSInputFile
+    Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, FSInputFile, InputFile
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
 
 from utils.db import get_connections, get_connection, update_connection_enabled
-from utils.scheduler import perform_single_backup
-from utils.db import log_backup
+from utils.db import get_enabled_backup_server
+from utils.backup_transfer import backup_transfer
+from utils.restore import restore_backup, RestoreProgress, read_local_file
+from utils.artifacts import artifact_size
+from utils.encryption import is_encrypted, decrypt_stream, get_key, ENCRYPTED_EXTENSION
+from utils.jobs import job_manager
 
 router = Router()
+logger = logging.getLogger(__name__)
+
+# Минимальный интервал между обновлениями сообщения с прогрессом
+PROGRESS_UPDATE_INTERVAL = 3
+
+# Выполняющиеся восстановления по ID подключения
+active_restores = {}
 
 def is_admin(user_id: int) -> bool:
     admin_id = os.getenv('ADMIN_ID')
@@ -75,22 +90,96 @@ async def perform_manual_backup(callback_query: CallbackQuery):
         await callback_query.answer("❌ Подключение не найдено")
         return
     
-    await callback_query.message.edit_text(f"🔄 Выполняю бэкап {connection['name']}...")
+    job, created = await job_manager.submit(connection)
     
-    backup_dir = os.getenv('BACKUP_DIR', './backups')
-    success, result = await perform_single_backup(connection, backup_dir)
+    if created:
+        await callback_query.answer(f"🚀 Задача #{job.id} поставлена в очередь")
+    else:
+        await callback_query.answer(f"⏳ Бэкап {connection['name']} уже выполняется (задача #{job.id})")
     
-    await log_backup(connection_id, success, result if not success else None)
+    # Прогресс обновляется в фоне, обработчик сразу освобождается
+    asyncio.create_task(track_job_progress(callback_query.message, job))
+
+def format_size(size: float) -> str:
+    """Человекочитаемый размер"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+def format_job_progress(job) -> str:
+    """Текст сообщения с прогрессом задачи"""
+    if job.status == 'queued':
+        return f"⏳ Бэкап {job.connection['name']} (задача #{job.id}) ожидает свободного воркера\n\n⏱️ В очереди: {job.elapsed:.0f} с"
+    
+    text = f"🔄 Бэкап {job.connection['name']} (задача #{job.id})\n\n"
+    text += f"📏 Записано: {format_size(job.bytes_done)}"
+    if job.percent is not None:
+        text += f" из ~{format_size(job.total_bytes)} ({job.percent:.0f}%)"
+    text += f"\n⚡ Скорость: {format_size(job.speed)}/с\n"
+    text += f"⏱️ Прошло: {job.elapsed:.0f} с"
+    if job.eta is not None:
+        text += f" | Осталось: ~{job.eta:.0f} с"
+    return text
+
+async def track_job_progress(message: Message, job):
+    """Обновление сообщения с прогрессом до завершения задачи"""
+    keyboard = InlineKeyboardBuilder()
+    keyboard.button(text="⛔ Отменить", callback_data=f"job_cancel_{job.id}")
+    markup = keyboard.as_markup()
+    last_text = None
+    
+    while not job.is_finished:
+        text = format_job_progress(job)
+        if text != last_text:
+            try:
+                await message.edit_text(text, reply_markup=markup)
+                last_text = text
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except TelegramBadRequest as e:
+                if "message is not modified" not in str(e):
+                    logger.warning(f"Прогресс задачи #{job.id} не обновлен: {e}")
+                    return
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout=PROGRESS_UPDATE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
     
-    if success:
-        await callback_query.message.edit_text(
-            f"✅ Бэкап {connection['name']} успешно создан\n"
-            f"Файл: {result}"
+    if job.status == 'done':
+        text = (
+            f"✅ Бэкап {job.connection['name']} успешно создан\n"
+            f"Файл: {job.result}\n"
+            f"📏 {format_size(job.bytes_done)} за {job.elapsed:.1f} с"
         )
+    elif job.status == 'cancelled':
+        text = f"⛔ Бэкап {job.connection['name']} отменен"
     else:
-        await callback_query.message.edit_text(
-            f"❌ Ошибка бэкапа {connection['name']}:\n{result}"
-        )
+        text = f"❌ Ошибка бэкапа {job.connection['name']}:\n{job.result}"
+    
+    try:
+        await message.edit_text(text)
+    except TelegramRetryAfter as e:
+        await asyncio.sleep(e.retry_after)
+        await message.edit_text(text)
+    except TelegramBadRequest:
+        pass
+
+@router.callback_query(F.data.startswith("job_cancel_"))
+async def cancel_backup_job(callback_query: CallbackQuery):
+    """Отмена фоновой задачи бэкапа"""
+    try:
+        job_id = int(callback_query.data.split("_")[2])
+    except (IndexError, ValueError):
+        await callback_query.answer("❌ Ошибка формата данных")
+        return
+    
+    if await job_manager.cancel(job_id):
+        await callback_query.answer(f"⛔ Задача #{job_id} отменяется")
+    else:
+        await callback_query.answer("ℹ️ Задача уже завершена")
 
 @router.message(F.text == "⚙️ Настройки автобэкапа")
 async def backup_settings(message: Message):
@@ -191,16 +280,16 @@ async def close_message(callback_query: CallbackQuery):
 
 # Менеджер бэкапов
 @router.callback_query(F.data == "menu_backup_manager")
-async def menu_backup_manager(callback_query: CallbackQuery):
+async def menu_backup_manager(callback_query: CallbackQuery, state: FSMContext):
     """Главный вход в менеджер бэкапов"""
     try:
-        await show_backup_files(callback_query.message, page=1)
+        await show_backup_files(callback_query.message, state, page=1)
         await callback_query.answer()
     except Exception as e:
         print(f"❌ ERROR in menu_backup_manager: {e}")
         await callback_query.answer("❌ Ошибка открытия менеджера")
 
-async def show_backup_files(message: Message, page: int = 1):
+async def show_backup_files(message: Message, state: FSMContext, page: int = 1):
     """Показать список файлов бэкапов с пагинацией"""
     backup_dir = os.getenv('BACKUP_DIR', './backups')
 
@@ -270,10 +359,11 @@ async def show_backup_files(message: Message, page: int = 1):
     
     keyboard = InlineKeyboardBuilder()
     
-    # Кнопки для скачивания файлов
+    # Кнопки для скачивания файлов: имена с расширениями сжатия и шифрования
+    # не помещаются в 64 байта callback_data - передаем индекс
+    await state.update_data(download_files=[os.path.basename(file_path) for file_path in page_files])
     for i, file_path in enumerate(page_files, start=1):
-        file_name = os.path.basename(file_path)
-        keyboard.button(text=f"📥 {i}", callback_data=f"download_{file_name}")
+        keyboard.button(text=f"📥 {i}", callback_data=f"download_{i - 1}")
     
     # Группируем кнопки файлов (по 2 в ряд)
     if page_files:
@@ -302,6 +392,7 @@ async def show_backup_files(message: Message, page: int = 1):
         keyboard.row(*pagination_buttons)
     
     # Основные кнопки
+    keyboard.button(text="♻️ Восстановление", callback_data="menu_restore")
     keyboard.button(text="🔄 Обновить", callback_data="menu_backup_manager")
     keyboard.button(text="🔙 Назад", callback_data="menu_main")
     keyboard.adjust(1)
@@ -314,20 +405,36 @@ async def show_backup_files(message: Message, page: int = 1):
             
 # Обработчики пагинации - ДОБАВЬТЕ ЭТИ ОБРАБОТЧИКИ
 @router.callback_query(F.data.startswith("page_"))
-async def backup_page_handler(callback_query: CallbackQuery):
+async def backup_page_handler(callback_query: CallbackQuery, state: FSMContext):
     try:
         page = int(callback_query.data.split("_")[1])
-        await show_backup_files(callback_query.message, page)
+        await show_backup_files(callback_query.message, state, page)
         await callback_query.answer()
     except (IndexError, ValueError) as e:
         print(f"Ошибка пагинации: {e}")
         await callback_query.answer("❌ Ошибка пагинации")
 
+class DecryptedInputFile(InputFile):
+    """Зашифрованный бэкап для отправки в Telegram: расшифровывается потоком, открытый текст на диск не пишется"""
+    
+    def __init__(self, path: str, filename: str):
+        super().__init__(filename=filename)
+        self.path = path
+    
+    async def read(self, bot):
+        async for chunk in decrypt_stream(read_local_file(self.path, self.chunk_size)):
+            yield chunk
+
 @router.callback_query(F.data.startswith("download_"))
-async def download_backup(callback_query: CallbackQuery):
+async def download_backup(callback_query: CallbackQuery, state: FSMContext):
     """Скачивание файла бэкапа"""
     try:
-        file_name = callback_query.data.split("_", 1)[1]
+        try:
+            index = int(callback_query.data.split("_", 1)[1])
+            file_name = (await state.get_data())['download_files'][index]
+        except (IndexError, ValueError, KeyError):
+            await callback_query.answer("❌ Список файлов устарел, откройте его заново")
+            return
         backup_dir = os.getenv('BACKUP_DIR', './backups')
         file_path = os.path.join(backup_dir, file_name)
         
@@ -335,12 +442,20 @@ async def download_backup(callback_query: CallbackQuery):
             await callback_query.answer("❌ Файл не найден")
             return
         
-        # Отправляем файл
-        file = FSInputFile(file_path)
-        await callback_query.message.answer_document(
-            document=file,
-            caption=f"📁 Бэкап: {file_name}"
-        )
+        # Зашифрованный бэкап отправляется расшифрованным, если ключ задан
+        if is_encrypted(file_name) and get_key():
+            plain_name = file_name[:-len(ENCRYPTED_EXTENSION)]
+            await callback_query.message.answer_document(
+                document=DecryptedInputFile(file_path, plain_name),
+                caption=f"📁 Бэкап: {plain_name}"
+            )
+        else:
+            # Отправляем файл
+            file = FSInputFile(file_path)
+            await callback_query.message.answer_document(
+                document=file,
+                caption=f"📁 Бэкап: {file_name}"
+            )
         
         await callback_query.answer("✅ Файл отправлен")
         
@@ -350,4 +465,214 @@ async def download_backup(callback_query: CallbackQuery):
 
 @router.callback_query(F.data == "noop")
 async def noop_handler(callback_query: CallbackQuery):
-    await callback_query.answer()
\ No newline at end of file
+    await callback_query.answer()
+
+# Восстановление из бэкапа
+@router.callback_query(F.data == "menu_restore")
+async def menu_restore(callback_query: CallbackQuery, state: FSMContext):
+    """Выбор артефакта для восстановления"""
+    await state.clear()
+    backup_dir = os.getenv('BACKUP_DIR', './backups')
+    
+    files = []
+    if os.path.exists(backup_dir):
+        files = [os.path.join(backup_dir, f) for f in os.listdir(backup_dir)]
+        files.sort(key=os.path.getmtime, reverse=True)
+    
+    text = "♻️ Восстановление из бэкапа\n\n"
+    text += "Выберите локальный бэкап (последние 10) или резервный сервер:"
+    
+    # Имена файлов не помещаются в 64 байта callback_data - передаем индекс
+    files = [os.path.basename(file_path) for file_path in files[:10]]
+    await state.update_data(restore_local_files=files)
+    
+    keyboard = InlineKeyboardBuilder()
+    for i, file_name in enumerate(files):
+        keyboard.button(text=f"📄 {file_name}", callback_data=f"restore_file_{i}")
+    keyboard.button(text="📦 С резервного сервера", callback_data="restore_remote_list")
+    keyboard.button(text="🔙 Назад", callback_data="menu_backup_manager")
+    keyboard.adjust(1)
+    
+    await callback_query.message.edit_text(text, reply_markup=keyboard.as_markup())
+
+@router.callback_query(F.data == "restore_remote_list")
+async def restore_remote_list(callback_query: CallbackQuery, state: FSMContext):
+    """Список бэкапов на резервном сервере"""
+    backup_server = await get_enabled_backup_server()
+    if not backup_server:
+        await callback_query.answer("❌ Нет активного резервного сервера")
+        return
+    
+    if not backup_transfer.has_file_list(backup_server):
+        await callback_query.message.edit_text(f"📦 Получаю список бэкапов с {backup_server['name']}...")
+    
+    success, files, message = await backup_transfer.get_backup_files(backup_server)
+    
+    keyboard = InlineKeyboardBuilder()
+    
+    if not success:
+        keyboard.button(text="🔙 Назад", callback_data="menu_restore")
+        await callback_query.message.edit_text(message, reply_markup=keyboard.as_markup())
+        return
+    
+    # Пути на сервере длинные - в callback передаем индекс
+    files = files[:20]
+    await state.update_data(restore_remote_files=files, restore_server_id=backup_server['id'])
+    
+    text = f"📦 Резервный сервер: {backup_server['name']}\n\n{message}"
+    for i, file_path in enumerate(files):
+        keyboard.button(text=f"📄 {os.path.basename(file_path)}", callback_data=f"restore_remote_{i}")
+    keyboard.button(text="🔙 Назад", callback_data="menu_restore")
+    keyboard.adjust(1)
+    
+    await callback_query.message.edit_text(text, reply_markup=keyboard.as_markup())
+
+@router.callback_query(F.data.startswith("restore_file_") | F.data.startswith("restore_remote_"))
+async def restore_choose_target(callback_query: CallbackQuery, state: FSMContext):
+    """Выбор подключения, в которое восстанавливать"""
+    remote = callback_query.data.startswith("restore_remote_")
+    try:
+        index = int(callback_query.data.split("_")[2])
+        data = await state.get_data()
+        file_name = data['restore_remote_files' if remote else 'restore_local_files'][index]
+    except (IndexError, ValueError, KeyError):
+        await callback_query.answer("❌ Список файлов устарел, откройте его заново")
+        return
+    await state.update_data(restore_artifact=file_name, restore_remote=remote)
+    
+    connections = await get_connections()
+    if not connections:
+        await callback_query.answer("📭 Нет сохраненных подключений")
+        return
+    
+    base_name = os.path.basename(file_name)
+    keyboard = InlineKeyboardBuilder()
+    # Подключения, которым принадлежит бэкап, показываем первыми
+    connections.sort(key=lambda c: not base_name.startswith(f"{c['name']}_"))
+    for conn in connections:
+        keyboard.button(text=f"{conn['name']} ({conn['db_type']})", callback_data=f"restore_to_{conn['id']}")
+    keyboard.button(text="🔙 Назад", callback_data="menu_restore")
+    keyboard.adjust(1)
+    
+    await callback_query.message.edit_text(
+        f"♻️ Бэкап: {base_name}\n\nВыберите подключение для восстановления:",
+        reply_markup=keyboard.as_markup()
+    )
+
+@router.callback_query(F.data.startswith("restore_to_"))
+async def restore_confirm_prompt(callback_query: CallbackQuery, state: FSMContext):
+    """Подтверждение восстановления"""
+    try:
+        connection_id = int(callback_query.data.split("_")[2])
+    except (IndexError, ValueError):
+        await callback_query.answer("❌ Ошибка формата данных")
+        return
+    
+    data = await state.get_data()
+    connection = await get_connection(connection_id)
+    if not connection or 'restore_artifact' not in data:
+        await callback_query.answer("❌ Подключение или бэкап не найдены")
+        return
+    
+    await state.update_data(restore_connection_id=connection_id)
+    
+    text = "⚠️ Восстановление перезапишет данные!\n\n"
+    text += f"📄 Бэкап: {os.path.basename(data['restore_artifact'])}\n"
+    text += f"📍 Источник: {'резервный сервер' if data.get('restore_remote') else 'локальный диск'}\n"
+    text += f"🗃️ Подключение: {connection['name']} ({connection['db_type']})\n\n"
+    text += "Продолжить?"
+    
+    keyboard = InlineKeyboardBuilder()
+    keyboard.button(text="✅ Да, восстановить", callback_data="restore_confirm")
+    keyboard.button(text="❌ Отмена", callback_data="menu_restore")
+    keyboard.adjust(1)
+    
+    await callback_query.message.edit_text(text, reply_markup=keyboard.as_markup())
+
+@router.callback_query(F.data == "restore_confirm")
+async def restore_confirm(callback_query: CallbackQuery, state: FSMContext):
+    """Выполнение восстановления"""
+    data = await state.get_data()
+    await state.clear()
+    
+    connection = await get_connection(data.get('restore_connection_id', 0))
+    if not connection or 'restore_artifact' not in data:
+        await callback_query.answer("❌ Подключение или бэкап не найдены")
+        return
+    
+    backup_server = None
+    if data.get('restore_remote'):
+        backup_server = await get_enabled_backup_server()
+        if not backup_server or backup_server['id'] != data.get('restore_server_id'):
+            await callback_query.answer("❌ Резервный сервер изменился, выберите бэкап заново")
+            return
+        artifact_path = data['restore_artifact']
+    else:
+        artifact_path = os.path.join(os.getenv('BACKUP_DIR', './backups'), data['restore_artifact'])
+        if not os.path.exists(artifact_path):
+            await callback_query.answer("❌ Файл не найден")
+            return
+    
+    if connection['id'] in active_restores:
+        await callback_query.answer(f"⏳ Восстановление {connection['name']} уже выполняется")
+        return
+    
+    progress = RestoreProgress(None if backup_server else artifact_size(artifact_path))
+    active_restores[connection['id']] = progress
+    await callback_query.answer("♻️ Восстановление запущено")
+    
+    # Восстановление идет в фоне, обработчик сразу освобождается
+    asyncio.create_task(run_restore(callback_query.message, connection, artifact_path, backup_server, progress))
+
+def format_restore_progress(connection: dict, file_name: str, progress: RestoreProgress) -> str:
+    """Текст сообщения с прогрессом восстановления"""
+    text = f"♻️ Восстанавливаю {connection['name']} из {file_name}\n\n"
+    text += f"📏 Прочитано: {format_size(progress.bytes_done)}"
+    if progress.percent is not None:
+        text += f" из {format_size(progress.total_bytes)} ({progress.percent:.0f}%)"
+    text += f"\n⏱️ Прошло: {progress.elapsed:.0f} с"
+    return text
+
+async def run_restore(message: Message, connection: dict, artifact_path: str, backup_server: dict, progress: RestoreProgress):
+    """Восстановление с обновлением сообщения о прогрессе"""
+    file_name = os.path.basename(artifact_path)
+    task = asyncio.create_task(restore_backup(connection, artifact_path, backup_server, progress=progress))
+    last_text = None
+    
+    try:
+        while not task.done():
+            text = format_restore_progress(connection, file_name, progress)
+            if text != last_text:
+                try:
+                    await message.edit_text(text)
+                    last_text = text
+                except TelegramRetryAfter as e:
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except TelegramBadRequest as e:
+                    if "message is not modified" not in str(e):
+                        logger.warning(f"Прогресс восстановления {connection['name']} не обновлен: {e}")
+            await asyncio.wait({task}, timeout=PROGRESS_UPDATE_INTERVAL)
+        
+        success, result = task.result()
+    finally:
+        active_restores.pop(connection['id'], None)
+    
+    keyboard = InlineKeyboardBuilder()
+    keyboard.button(text="🔙 Назад", callback_data="menu_backup_manager")
+    
+    if success:
+        text = (
+            f"✅ {connection['name']} восстановлено из {file_name}\n"
+            f"⏱️ Время восстановления: {progress.elapsed:.1f} секунд"
+        )
+    else:
+        text = f"❌ Ошибка восстановления {connection['name']}:\n{result}"
+    
+    try:
+        await message.edit_text(text, reply_markup=keyboard.as_markup())
+    except TelegramRetryAfter as e:
+        await asyncio.sleep(e.retry_after)
+        await message.edit_text(text, reply_markup=keyboard.as_markup())
+    except TelegramBadRequest:
+        pass
\ No newline at end of file
@@ -0,0 +1,186 @@
+import os
+import time
+import logging
+from aiogram import Router, F
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import (
+    Message, InlineKeyboardMarkup, InlineKeyboardButton,
+    CallbackQuery, BufferedInputFile
+)
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
+
+from utils.db import get_ssh_servers
+from utils.fleet import UPDATE_SCRIPT, run_fleet, format_report, format_full_report, get_settings
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+# Как часто обновляется сообщение с прогрессом (секунды)
+PROGRESS_UPDATE_INTERVAL = 3
+
+# Проверка прав администратора
+def is_admin(user_id: int) -> bool:
+    admin_id = os.getenv('ADMIN_ID')
+    if not admin_id:
+        return False
+    return user_id == int(admin_id)
+
+class FleetCommand(StatesGroup):
+    selecting = State()
+    entering_command = State()
+
+async def show_selection(message: Message, selected: list):
+    """Выбор серверов для группового выполнения"""
+    servers = await get_ssh_servers()
+
+    text = "🚀 Выполнение на группе серверов\n\n"
+    if not servers:
+        text += "📭 Нет сохраненных серверов"
+    else:
+        text += f"Выбрано: {len(selected)} из {len(servers)}\nОтметьте серверы и выберите действие:"
+
+    keyboard = InlineKeyboardBuilder()
+    for server in servers:
+        mark = "☑️" if server['id'] in selected else "⬜"
+        keyboard.button(text=f"{mark} {server['name']}", callback_data=f"fleet_pick_{server['id']}")
+
+    sizes = [2] * (len(servers) // 2) + [1] * (len(servers) % 2)
+    if servers:
+        keyboard.button(text="✅ Выбрать все / снять", callback_data="fleet_all")
+        keyboard.button(text="📦 Обновить библиотеки", callback_data="fleet_update")
+        keyboard.button(text="⌨️ Выполнить команду", callback_data="fleet_command")
+        sizes += [1, 1, 1]
+    keyboard.button(text="🔙 Назад", callback_data="menu_ssh")
+    keyboard.adjust(*sizes, 1)
+
+    await message.edit_text(text, reply_markup=keyboard.as_markup())
+
+@router.callback_query(F.data == "fleet_menu")
+async def fleet_menu(callback_query: CallbackQuery, state: FSMContext):
+    """Меню группового выполнения"""
+    if not is_admin(callback_query.from_user.id):
+        await callback_query.answer("⛔ У вас нет доступа")
+        return
+
+    await state.set_state(FleetCommand.selecting)
+    await state.update_data(fleet_selected=[])
+    await show_selection(callback_query.message, [])
+
+@router.callback_query(F.data.startswith("fleet_pick_"))
+async def fleet_pick(callback_query: CallbackQuery, state: FSMContext):
+    """Отметка сервера"""
+    try:
+        server_id = int(callback_query.data.split("_")[2])
+    except (IndexError, ValueError):
+        await callback_query.answer("❌ Ошибка формата данных")
+        return
+
+    data = await state.get_data()
+    selected = data.get('fleet_selected', [])
+    if server_id in selected:
+        selected.remove(server_id)
+    else:
+        selected.append(server_id)
+    await state.update_data(fleet_selected=selected)
+    await show_selection(callback_query.message, selected)
+
+@router.callback_query(F.data == "fleet_all")
+async def fleet_all(callback_query: CallbackQuery, state: FSMContext):
+    """Выбор всех серверов или снятие выбора"""
+    servers = await get_ssh_servers()
+    data = await state.get_data()
+    all_ids = [server['id'] for server in servers]
+    selected = [] if set(data.get('fleet_selected', [])) >= set(all_ids) else all_ids
+    await state.update_data(fleet_selected=selected)
+    await show_selection(callback_query.message, selected)
+
+async def get_selected_servers(state: FSMContext) -> list:
+    data = await state.get_data()
+    selected = set(data.get('fleet_selected', []))
+    return [server for server in await get_ssh_servers() if server['id'] in selected]
+
+@router.callback_query(F.data == "fleet_update")
+async def fleet_update(callback_query: CallbackQuery, state: FSMContext):
+    """Обновление библиотек на выбранных серверах"""
+    servers = await get_selected_servers(state)
+    if not servers:
+        await callback_query.answer("❗ Выберите хотя бы один сервер")
+        return
+
+    await state.clear()
+    await run_and_report(callback_query.message, servers, UPDATE_SCRIPT, "📦 Обновление библиотек")
+
+@router.callback_query(F.data == "fleet_command")
+async def fleet_command(callback_query: CallbackQuery, state: FSMContext):
+    """Запрос команды для выбранных серверов"""
+    servers = await get_selected_servers(state)
+    if not servers:
+        await callback_query.answer("❗ Выберите хотя бы один сервер")
+        return
+
+    await state.set_state(FleetCommand.entering_command)
+    await callback_query.message.edit_text(
+        f"⌨️ Введите команду для {len(servers)} серверов.\n"
+        f"Несколько команд - по одной на строку, выполнение остановится на первой ошибке:",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="❌ Отмена", callback_data="fleet_menu")
+        ]])
+    )
+
+@router.message(FleetCommand.entering_command)
+async def process_fleet_command(message: Message, state: FSMContext):
+    """Выполнение введенной команды на выбранных серверах"""
+    commands = [line.strip() for line in (message.text or "").splitlines() if line.strip()]
+    if not commands:
+        await message.answer("❌ Команда не может быть пустой. Попробуйте еще раз:")
+        return
+
+    servers = await get_selected_servers(state)
+    await state.clear()
+
+    status_message = await message.answer("🚀 Запускаю...")
+    script = [(command, command) for command in commands]
+    await run_and_report(status_message, servers, script, f"⌨️ {commands[0]}" + (" …" if len(commands) > 1 else ""))
+
+async def run_and_report(message: Message, servers: list, script: list, title: str):
+    """Выполнение сценария на серверах с прогрессом и итоговым отчетом"""
+    settings = get_settings()
+    started = time.monotonic()
+    last_update = 0.0
+
+    await message.edit_text(
+        f"{title}\n\n🚀 Выполняю на {len(servers)} серверах "
+        f"(одновременно до {settings['concurrency']})..."
+    )
+
+    async def on_progress(done: int, total: int):
+        nonlocal last_update
+        now = time.monotonic()
+        if done < total and now - last_update < PROGRESS_UPDATE_INTERVAL:
+            return
+        last_update = now
+        try:
+            await message.edit_text(f"{title}\n\n🚀 Выполнено: {done}/{total} ({now - started:.0f} с)")
+        except (TelegramRetryAfter, TelegramBadRequest):
+            pass
+
+    results = await run_fleet(servers, script, on_progress=on_progress)
+
+    report = format_report(f"{title}\n⏱ Общее время: {time.monotonic() - started:.1f} с", results)
+    keyboard = InlineKeyboardBuilder()
+    keyboard.button(text="🚀 Еще раз выбрать серверы", callback_data="fleet_menu")
+    keyboard.button(text="🔙 SSH Менеджер", callback_data="menu_ssh")
+    keyboard.adjust(1)
+
+    await message.edit_text(report, reply_markup=keyboard.as_markup())
+
+    # Полный вывод всех серверов - одним файлом
+    try:
+        await message.answer_document(
+            BufferedInputFile(format_full_report(results).encode('utf-8'), filename="fleet_report.txt"),
+            caption="📄 Вывод команд по серверам"
+        )
+    except Exception as e:
+        logger.error(f"Ошибка отправки отчета: {e}")
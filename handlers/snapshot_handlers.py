@@ -48,7 +48,7 @@ async def menu_snapshot(callback_query: CallbackQuery, state: FSMContext):
         return
     
     backup_servers = await get_backup_servers()
-    enabled_server = await get_enabled_backup_server()
+    enabled_servers = [server for server in backup_servers if server['enabled']]
     
     if not backup_servers:
         # Нет серверов - предлагаем добавить
@@ -71,8 +71,9 @@ async def menu_snapshot(callback_query: CallbackQuery, state: FSMContext):
             text += f"   📍 {server['host']}:{server['port']}\n"
             text += f"   📁 {server['remote_path']}\n\n"
         
-        if enabled_server:
-            text += f"✅ Активный сервер: {enabled_server['name']}"
+        if enabled_servers:
+            # Бэкапы загружаются на все включенные серверы
+            text += f"✅ Активные серверы: {', '.join(server['name'] for server in enabled_servers)}"
         else:
             text += "❌ Нет активного резервного сервера"
         
@@ -337,34 +338,11 @@ async def snapshot_browser(callback_query: CallbackQuery):
         await callback_query.answer("❌ Нет активного резервного сервера")
         return
     
-    await callback_query.message.edit_text(f"📁 Подключаюсь к резервному серверу {enabled_server['name']}...")
-    
-    # Подключаемся к серверу
-    success, message = await backup_transfer.connect(
-        server_id=enabled_server['id'],
-        host=enabled_server['host'],
-        port=enabled_server['port'],
-        username=enabled_server['username'],
-        password=enabled_server['password']
-    )
-    
-    if not success:
-        await callback_query.message.edit_text(
-            f"❌ Не удалось подключиться к резервному серверу:\n{message}",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
-                InlineKeyboardButton(text="🔙 Назад", callback_data="menu_snapshot")
-            ]])
-        )
-        return
-    
-    # Получаем список файлов
-    success, files, message = await backup_transfer.list_backup_files(
-        server_id=enabled_server['id'],
-        remote_path=enabled_server['remote_path']
-    )
+    if not backup_transfer.has_file_list(enabled_server):
+        await callback_query.message.edit_text(f"📁 Подключаюсь к резервному серверу {enabled_server['name']}...")
     
-    # Закрываем соединение
-    await backup_transfer.close_connection(enabled_server['id'])
+    # Получаем список файлов (из кэша, подключение - только при обновлении списка)
+    success, files, message = await backup_transfer.get_backup_files(enabled_server)
     
     if not success:
         await callback_query.message.edit_text(
@@ -418,7 +396,7 @@ async def snapshot_server_detail(callback_query: CallbackQuery):
         return
     
     # Проверяем пинг
-    is_online = await ping_server(server['host'])
+    is_online = await ping_server(server['host'], port=server['port'])
     ping_status = "🟢 Онлайн" if is_online else "🔴 Офлайн"
     
     text = f"📦 Резервный сервер: {server['name']}\n\n"
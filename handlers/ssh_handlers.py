@@ -1,4 +1,5 @@
 import os
+import html
 import asyncio
 import subprocess
 from aiogram import Router, F
@@ -6,7 +7,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import (
     Message, InlineKeyboardMarkup, InlineKeyboardButton,
-    CallbackQuery
+    CallbackQuery, BufferedInputFile
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from utils.db import (
@@ -14,7 +15,13 @@ from utils.db import (
     update_ssh_server, delete_ssh_server, log_ssh_command
 )
 from utils.ssh_client import ssh_client
-from utils.ssh_utils import ping_server, execute_ssh_command, measure_ping
+from utils.ssh_utils import ping_server, ping_servers, execute_ssh_command, measure_ping
+from utils.health import health_monitor
+from utils.cache import TTLCache
+from utils.output_stream import OutputStreamer, StoredOutput, output_store, TAIL_CHARS
+from utils.fleet import UPDATE_SCRIPT, get_settings as get_fleet_settings
+from utils.reboot_watcher import reboot_watcher
+from utils.metrics import cache_entries
 
 router = Router()
 
@@ -41,26 +48,40 @@ class EditSSHServer(StatesGroup):
 class SSHCommand(StatesGroup):
     waiting_command = State()
 
-server_status_cache = {}
 CACHE_TIMEOUT = 30
 
-async def get_server_status(server_id: int, host: str) -> tuple:
-    """Получение статуса сервера с кэшированием"""
-    current_time = asyncio.get_event_loop().time()
-    
-    # Проверяем кэш
-    if server_id in server_status_cache:
-        status, timestamp = server_status_cache[server_id]
-        if current_time - timestamp < CACHE_TIMEOUT:
-            return status
-    
-    # Быстрая проверка доступности (1 пакет, короткий таймаут)
-    is_online = await ping_server(host, timeout=2)
-    
-    # Сохраняем в кэш
-    server_status_cache[server_id] = (is_online, current_time)
+# Устаревший статус еще 10 минут отдается сразу, пока в фоне идет новая проверка
+server_status_cache = TTLCache(ttl=CACHE_TIMEOUT, maxsize=1000, stale_ttl=600)
+cache_entries.set_function(lambda: len(server_status_cache), cache='server_status')
+
+async def get_servers_status(servers: list) -> list:
+    """Получение статусов серверов с кэшированием (одна проверка на всех, кого нет в кэше)"""
+    statuses = {}
+    to_probe = {}
+    
+    for server in servers:
+        # Результат фонового мониторинга - без проверки на клик
+        health = health_monitor.get('ssh', server['id'])
+        if health and health.success is not None:
+            statuses[server['id']] = health.success
+        else:
+            to_probe[server['id']] = server
+    
+    if to_probe:
+        async def probe(server_ids: list) -> dict:
+            # Все хосты проверяются одновременно за один таймаут
+            targets = [(to_probe[i]['host'], to_probe[i]['port']) for i in server_ids]
+            rtts = await ping_servers(targets, timeout=2)
+            return {i: rtts.get(to_probe[i]['host']) is not None for i in server_ids}
+        
+        statuses.update(await server_status_cache.get_many(list(to_probe), probe))
     
-    return is_online
+    return [statuses[server['id']] for server in servers]
+
+async def get_server_status(server_id: int, host: str, port: int = 22) -> bool:
+    """Получение статуса одного сервера с кэшированием"""
+    statuses = await get_servers_status([{'id': server_id, 'host': host, 'port': port}])
+    return statuses[0]
 
 # Главное меню SSH
 @router.callback_query(F.data == "menu_ssh")
@@ -80,14 +101,8 @@ async def menu_ssh(callback_query: CallbackQuery, state: FSMContext):
     keyboard = InlineKeyboardBuilder()
     
     if servers:
-        # Создаем задачи для параллельной проверки статусов
-        status_tasks = []
-        for server in servers:
-            task = get_server_status(server['id'], server['host'])
-            status_tasks.append(task)
-        
-        # Ждем завершения всех проверок
-        ping_results = await asyncio.gather(*status_tasks)
+        # Статусы из кэша, остальные - одной пачкой
+        ping_results = await get_servers_status(servers)
         
         for i, server in enumerate(servers):
             # Статус подключения
@@ -102,6 +117,7 @@ async def menu_ssh(callback_query: CallbackQuery, state: FSMContext):
     
     keyboard.button(text="➕ Добавить SSH сервер", callback_data="ssh_add_server")
     keyboard.button(text="📋 Список серверов", callback_data="ssh_list_servers")
+    keyboard.button(text="🚀 Команда на группу серверов", callback_data="fleet_menu")
     keyboard.button(text="🔄 Обновить", callback_data="menu_ssh")
     keyboard.button(text="🔙 Назад", callback_data="menu_main")
     keyboard.adjust(1)
@@ -374,7 +390,7 @@ async def ssh_server_detail(callback_query: CallbackQuery, state: FSMContext):
         return
     
     # Проверяем пинг
-    is_online = await ping_server(server['host'])
+    is_online = await get_server_status(server_id, server['host'], server['port'])
     ping_status = "🟢 Онлайн" if is_online else "🔴 Офлайн"
     
     # Проверяем SSH подключение
@@ -385,7 +401,11 @@ async def ssh_server_detail(callback_query: CallbackQuery, state: FSMContext):
     text += f"📍 Host: {server['host']}\n"
     text += f"🔢 Port: {server['port']}\n"
     text += f"👤 User: {server['username']}\n"
-    text += f"📊 Статус: {ping_status} | {ssh_status}\n\n"
+    text += f"📊 Статус: {ping_status} | {ssh_status}\n"
+    health = health_monitor.get('ssh', server_id)
+    if health and health.version:
+        text += f"🧩 {health.version}\n"
+    text += "\n"
     text += "Выберите действие:"
     
     keyboard = InlineKeyboardBuilder()
@@ -487,40 +507,30 @@ async def process_ssh_command(message: Message, state: FSMContext):
     except:
         pass
     
-    # Выполняем команду
-    success, current_dir, output = await ssh_client.execute_command(server_id, command)
-    
-    # Логируем команду
-    await log_ssh_command(server_id, command, output)
-    
-    if not success:
-        output = f"❌ Ошибка: {output}"
+    close_markup = InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="❌ Закрыть сессию", callback_data=f"ssh_close_{server_id}")
+    ]])
+    prompt = f"{username}@{host}:{ssh_client.get_current_dir(server_id)}# {command}"
+    output_message = await message.answer(
+        f"<code>{html.escape(prompt)}</code>\n⏳ Выполняется...",
+        parse_mode="HTML",
+        reply_markup=close_markup
+    )
     
-    # Форматируем вывод
-    if output:
-        formatted_output = f"```\n{username}@{host}:{current_dir}# {command}\n{output}\n```"
-    else:
-        formatted_output = f"```\n{username}@{host}:{current_dir}# {command}\n```"
-    
-    # Разбиваем длинные сообщения
-    if len(formatted_output) > 4000:
-        chunks = [formatted_output[i:i+4000] for i in range(0, len(formatted_output), 4000)]
-        for chunk in chunks:
-            await message.answer(
-                chunk,
-                parse_mode="Markdown",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
-                    InlineKeyboardButton(text="❌ Закрыть сессию", callback_data=f"ssh_close_{server_id}")
-                ]])
-            )
-    else:
-        await message.answer(
-            formatted_output,
-            parse_mode="Markdown",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
-                InlineKeyboardButton(text="❌ Закрыть сессию", callback_data=f"ssh_close_{server_id}")
-            ]])
+    # Выполняем команду, вывод показывается по мере поступления
+    streamer = OutputStreamer(output_message, f"<code>{html.escape(prompt)}</code>", close_markup)
+    try:
+        success, current_dir, output = await ssh_client.execute_command(
+            server_id, command, on_output=streamer.feed
         )
+        
+        # Логируем команду
+        await log_ssh_command(server_id, command, streamer.getvalue() or output)
+        
+        footer = html.escape(output) if not success else ""
+        await streamer.finish(footer)
+    finally:
+        streamer.close()
 
 # Перезагрузка сервера
 @router.callback_query(F.data.startswith("ssh_reboot_"))
@@ -537,6 +547,10 @@ async def ssh_reboot(callback_query: CallbackQuery):
         await callback_query.answer("❌ SSH сервер не найден")
         return
     
+    if reboot_watcher.is_watching(server_id):
+        await callback_query.answer("⏳ Сервер уже перезагружается, ожидаю его включения", show_alert=True)
+        return
+    
     await callback_query.message.edit_text(f"🔄 Отправляю команду перезагрузки на {server['name']}...")
     
     # Подключаемся если не подключены
@@ -563,54 +577,16 @@ async def ssh_reboot(callback_query: CallbackQuery):
         
         # Закрываем соединение
         await ssh_client.close_connection(server_id)
+        server_status_cache.invalidate(server_id)
         
-        # Мониторим перезагрузку
-        await monitor_reboot(callback_query.message, server)
+        # Наблюдение идет в фоне, о возвращении сервера придет уведомление
+        if reboot_watcher.watch(server, callback_query.message):
+            await callback_query.message.edit_text("⏳ Ожидаю отключения сервера...")
     else:
         await callback_query.message.edit_text(
             f"❌ Ошибка при отправке команды перезагрузки:\n{output}"
         )
 
-async def monitor_reboot(message: Message, server: dict):
-    """Мониторинг перезагрузки сервера"""
-    import time
-    start_time = time.time()
-    
-    # Ждем пока сервер станет недоступным
-    await message.edit_text("⏳ Ожидаю отключения сервера...")
-    
-    max_wait_time = 300  # 5 минут максимум
-    check_interval = 5   # проверка каждые 5 секунд
-    
-    # Ждем отключения
-    for i in range(max_wait_time // check_interval):
-        is_online = await ping_server(server['host'])
-        if not is_online:
-            break
-        await asyncio.sleep(check_interval)
-    
-    if is_online:
-        await message.edit_text("❌ Сервер не отключился в течение ожидаемого времени")
-        return
-    
-    offline_time = time.time()
-    await message.edit_text("🔴 Сервер отключился. Ожидаю включения...")
-    
-    # Ждем включения
-    for i in range(max_wait_time // check_interval):
-        is_online = await ping_server(server['host'])
-        if is_online:
-            online_time = time.time()
-            reboot_duration = online_time - offline_time
-            await message.edit_text(
-                f"✅ Сервер перезагрузился!\n"
-                f"⏱️ Время перезагрузки: {reboot_duration:.1f} секунд"
-            )
-            return
-        await asyncio.sleep(check_interval)
-    
-    await message.edit_text("❌ Сервер не включился в течение ожидаемого времени")
-
 # Обновление библиотек
 @router.callback_query(F.data.startswith("ssh_update_"))
 async def ssh_update(callback_query: CallbackQuery):
@@ -642,38 +618,43 @@ async def ssh_update(callback_query: CallbackQuery):
             return
     
     # Отправляем команды обновления
-    commands = [
-        ("sudo apt update", "📥 Обновление списка пакетов"),
-        ("sudo apt upgrade -y", "🔄 Обновление пакетов"), 
-        ("sudo apt autoremove -y", "🧹 Очистка ненужных пакетов")
-    ]
+    commands = UPDATE_SCRIPT
     
     results = []
+    # Выводы сохраняются под id итогового сообщения: кнопки показывают их без повторного запуска
+    message_id = callback_query.message.message_id
     
-    for cmd, description in commands:
+    for i, (cmd, description) in enumerate(commands):
         await callback_query.message.edit_text(f"📦 Выполняю: {description}...")
-        success, current_dir, output = await ssh_client.execute_command(server_id, cmd)
-        
-        results.append({
-            'command': cmd,
-            'description': description,
-            'success': success,
-            'output': output or "Нет вывода"
-        })
+        # Ход выполнения виден в сообщении; полный вывод доступен по кнопкам в итоговом отчете
+        streamer = OutputStreamer(callback_query.message, f"📦 Выполняю: {html.escape(description)}...")
+        try:
+            # apt может работать дольше обычного таймаута команды
+            success, current_dir, output = await ssh_client.execute_command(
+                server_id, cmd, timeout=get_fleet_settings()['host_timeout'], on_output=streamer.feed
+            )
+            if not success and not streamer.total:
+                streamer.feed(output)
+            await streamer.finish(attach=False)
+            results.append(output_store.put(
+                (server_id, message_id, i), cmd, description, success, streamer.detach()
+            ))
+        finally:
+            streamer.close()
     
     # Формируем сообщение со сворачиваемыми блоками
     text = f"📦 Результат обновления {server['name']}:\n\n"
     
     for i, result in enumerate(results):
-        status_emoji = "✅" if result['success'] else "❌"
-        text += f"{status_emoji} {result['description']}:\n"
+        status_emoji = "✅" if result.success else "❌"
+        text += f"{status_emoji} {result.description}:\n"
         
         # Создаем сворачиваемый блок
         block_id = f"update_{server_id}_{i}"
-        short_output = get_short_output(result['output'])
+        short_output = get_short_output(result)
         
         text += f"<blockquote expandable='{block_id}'>\n"
-        text += f"{short_output}\n"
+        text += f"{html.escape(short_output)}\n"
         text += f"</blockquote>\n\n"
     
     # Создаем клавиатуру с кнопками для раскрытия блоков
@@ -697,14 +678,14 @@ async def ssh_update(callback_query: CallbackQuery):
         parse_mode="HTML"  # Включаем HTML для блоков
     )
 
-def get_short_output(output: str, max_lines: int = 3) -> str:
+def get_short_output(result: StoredOutput, max_lines: int = 3) -> str:
     """Получение короткой версии вывода"""
-    lines = output.split('\n')
-    if len(lines) <= max_lines:
-        return output
+    lines = result.head(max_lines)
+    if result.line_count <= max_lines:
+        return '\n'.join(lines).strip() or "Нет вывода"
     
-    # Показываем первые и последние строки
-    short_lines = lines[:max_lines] + ["...", f"📊 Показано {max_lines} из {len(lines)} строк"]
+    # Показываем первые строки
+    short_lines = lines + ["...", f"📊 Показано {max_lines} из {result.line_count} строк"]
     return '\n'.join(short_lines)
 
 @router.callback_query(F.data.startswith("show_output_"))
@@ -718,58 +699,30 @@ async def show_full_output(callback_query: CallbackQuery):
         await callback_query.answer("❌ Ошибка формата данных")
         return
     
-    server = await get_ssh_server(server_id)
-    if not server:
-        await callback_query.answer("❌ SSH сервер не найден")
+    result = output_store.get((server_id, callback_query.message.message_id, command_index))
+    if not result:
+        await callback_query.answer("⌛ Вывод больше не хранится, запустите обновление снова", show_alert=True)
         return
     
-    # Здесь нужно получить результаты выполнения команд
-    # Для простоты перезапустим обновление или сохраним результаты в состоянии
-    await callback_query.answer("ℹ️ Полный вывод доступен в основном сообщении")
-    
-    # Альтернативно, можно отправить полный вывод отдельным сообщением
-    await send_full_output(callback_query.message, server_id, command_index)
+    await callback_query.answer()
+    await send_full_output(callback_query.message, result)
 
-async def send_full_output(message: Message, server_id: int, command_index: int):
-    """Отправка полного вывода команды"""
-    # Команды в том же порядке
-    commands_info = [
-        ("sudo apt update", "📥 Обновление списка пакетов"),
-        ("sudo apt upgrade -y", "🔄 Обновление пакетов"),
-        ("sudo apt autoremove -y", "🧹 Очистка ненужных пакетов")
-    ]
-    
-    if command_index >= len(commands_info):
-        await message.answer("❌ Неверный индекс команды")
-        return
-    
-    cmd, description = commands_info[command_index]
-    
-    # Выполняем команду еще раз для получения вывода
-    success, current_dir, output = await ssh_client.execute_command(server_id, cmd)
-    
-    text = f"📦 Полный вывод: {description}\n\n"
-    text += f"💻 Команда: <code>{cmd}</code>\n\n"
-    
-    if output:
-        # Форматируем вывод как код
-        formatted_output = f"<pre>{output}</pre>"
-        
-        # Разбиваем длинный вывод на части
-        if len(formatted_output) > 4000:
-            chunks = [formatted_output[i:i+4000] for i in range(0, len(formatted_output), 4000)]
-            for i, chunk in enumerate(chunks):
-                await message.answer(
-                    f"{text}Часть {i+1}:\n{chunk}",
-                    parse_mode="HTML"
-                )
-        else:
-            await message.answer(
-                f"{text}{formatted_output}",
-                parse_mode="HTML"
-            )
+async def send_full_output(message: Message, result: StoredOutput):
+    """Отправка сохраненного полного вывода команды"""
+    text = f"📦 Полный вывод: {result.description}\n\n"
+    text += f"💻 Команда: <code>{html.escape(result.command)}</code>\n\n"
+    
+    output = result.read().strip() if result.size <= TAIL_CHARS else None
+    if output is None:
+        # Длинный вывод отправляется файлом, а не серией сообщений
+        await message.answer_document(
+            BufferedInputFile(result.read().encode('utf-8'), filename="output.txt"),
+            caption=f"📦 Полный вывод: {result.description} ({result.line_count} строк)"
+        )
+    elif output:
+        await message.answer(f"{text}<pre>{html.escape(output)}</pre>", parse_mode="HTML")
     else:
-        await message.answer(f"{text}❌ Нет вывода от команды")
+        await message.answer(f"{text}❌ Нет вывода от команды", parse_mode="HTML")
         
 # Пинг сервера
 @router.callback_query(F.data.startswith("ssh_ping_"))
@@ -873,13 +826,8 @@ async def ssh_list_servers(callback_query: CallbackQuery):
     else:
         text = "📋 Список SSH серверов:\n\n"
         
-        # Параллельная проверка статусов
-        status_tasks = []
-        for server in servers:
-            task = get_server_status(server['id'], server['host'])
-            status_tasks.append(task)
-        
-        ping_results = await asyncio.gather(*status_tasks)
+        # Статусы из кэша, остальные - одной пачкой
+        ping_results = await get_servers_status(servers)
         
         for i, server in enumerate(servers):
             # Проверяем пинг из кэша
@@ -1031,6 +979,7 @@ async def process_ssh_edit_field(message: Message, state: FSMContext):
             return
     
     success = await update_ssh_server(server_id, {field_name: new_value})
+    server_status_cache.invalidate(server_id)
     
     if success:
         await message.answer("✅ Поле успешно обновлено")
@@ -1047,7 +996,7 @@ async def ssh_server_detail_by_id(message: Message, server_id: int):
         await message.answer("❌ SSH сервер не найден")
         return
     
-    is_online = await ping_server(server['host'])
+    is_online = await get_server_status(server_id, server['host'], server['port'])
     ping_status = "🟢 Онлайн" if is_online else "🔴 Офлайн"
     
     ssh_connected = ssh_client.is_connected(server_id)
@@ -1057,7 +1006,11 @@ async def ssh_server_detail_by_id(message: Message, server_id: int):
     text += f"📍 Host: {server['host']}\n"
     text += f"🔢 Port: {server['port']}\n"
     text += f"👤 User: {server['username']}\n"
-    text += f"📊 Статус: {ping_status} | {ssh_status}\n\n"
+    text += f"📊 Статус: {ping_status} | {ssh_status}\n"
+    health = health_monitor.get('ssh', server_id)
+    if health and health.version:
+        text += f"🧩 {health.version}\n"
+    text += "\n"
     text += "Выберите действие:"
     
     keyboard = InlineKeyboardBuilder()
@@ -1091,7 +1044,7 @@ async def ssh_delete(callback_query: CallbackQuery):
         return
     
     # Закрываем соединение если открыто
-    if ssh_client.is_connected(server_id):
+    if ssh_client.has_session(server_id):
         await ssh_client.close_connection(server_id)
     
     text = f"❌ Удаление SSH сервера\n\nВы уверены, что хотите удалить сервер?\n\nИмя: {server['name']}\nHost: {server['host']}\n\nЭто действие нельзя отменить!"
@@ -1118,6 +1071,7 @@ async def ssh_confirm_delete(callback_query: CallbackQuery):
         return
     
     success = await delete_ssh_server(server_id)
+    server_status_cache.invalidate(server_id)
     
     if success:
         await callback_query.message.edit_text(
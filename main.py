@@ -5,14 +5,23 @@ import os
 import warnings
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import MemoryStorage
 
 # Подавление предупреждений cryptography
 warnings.filterwarnings("ignore", message=".*TripleDES.*")
 
-from handlers import admin, backup, ssh_handlers
+from handlers import admin, backup, ssh_handlers, fleet_handlers
 from utils.scheduler import setup_scheduler
 from utils.db import init_db
+from utils.health import health_monitor
+from utils.ssh_pool import ssh_manager
+from utils.reboot_watcher import reboot_watcher
+from utils.metrics import HandlerMetricsMiddleware, metrics_server, get_settings as get_metrics_settings
+from utils.tracing import TracingMiddleware, tracer
+from utils.jobs import worker_pool
+from utils.job_queue import queue_server, get_settings as get_queue_settings
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -48,8 +57,10 @@ async def main():
     # Инициализация базы данных
     await init_db()
     
-    # Инициализация бота и диспетчера
-    bot = Bot(token=os.getenv('BOT_TOKEN'))
+    # Инициализация бота и диспетчера (TELEGRAM_API_URL - собственный сервер Bot API)
+    api_url = os.getenv('TELEGRAM_API_URL')
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else None
+    bot = Bot(token=os.getenv('BOT_TOKEN'), session=session)
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
     
@@ -57,10 +68,32 @@ async def main():
     dp.include_router(admin.router)
     dp.include_router(backup.router)
     dp.include_router(ssh_handlers.router) 
+    dp.include_router(fleet_handlers.router)
+    
+    # Длительность и трассировка обработчиков всех роутеров
+    dp.message.middleware(HandlerMetricsMiddleware('message'))
+    dp.callback_query.middleware(HandlerMetricsMiddleware('callback_query'))
+    dp.message.middleware(TracingMiddleware('message'))
+    dp.callback_query.middleware(TracingMiddleware('callback_query'))
+    
+    # Процессы-воркеры бэкапов: дампы и загрузки не занимают цикл событий бота
+    await worker_pool.start()
+    
+    # API очереди для воркеров на других узлах
+    if get_queue_settings()['enabled']:
+        await queue_server.start()
     
     # Настройка планировщика
     await setup_scheduler(bot)
     
+    # Фоновый мониторинг состояния подключений и SSH серверов
+    if os.getenv('HEALTH_MONITOR_ENABLED', 'true').lower() == 'true':
+        health_monitor.start(bot)
+    
+    # Метрики в формате Prometheus на локальном HTTP эндпоинте
+    if get_metrics_settings()['enabled']:
+        await metrics_server.start()
+    
     logger.info("Бот запущен")
     
     try:
@@ -68,6 +101,13 @@ async def main():
     except Exception as e:
         logger.error(f"Ошибка при запуске бота: {e}")
     finally:
+        await health_monitor.stop()
+        await worker_pool.stop()
+        await queue_server.stop()
+        await reboot_watcher.stop()
+        await metrics_server.stop()
+        tracer.close()
+        await ssh_manager.close_all()
         await bot.session.close()
 
 if __name__ == '__main__':
@@ -0,0 +1,36 @@
+import os
+import re
+from typing import List, Optional
+
+# Имя артефакта: {name}_{YYYY-MM-DD_HH-MM-SS}[.ext]
+TIMESTAMP_PATTERN = r'\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}'
+
+def list_artifacts(backup_dir: str, name: str) -> List[str]:
+    """Список артефактов подключения (новые сначала)"""
+    if not os.path.isdir(backup_dir):
+        return []
+
+    pattern = re.compile(rf'^{re.escape(name)}_{TIMESTAMP_PATTERN}')
+    artifacts = [
+        os.path.join(backup_dir, entry)
+        for entry in os.listdir(backup_dir)
+        if pattern.match(entry)
+    ]
+    artifacts.sort(key=os.path.getmtime, reverse=True)
+    return artifacts
+
+def find_latest_artifact(backup_dir: str, name: str) -> Optional[str]:
+    """Последний артефакт подключения или None"""
+    artifacts = list_artifacts(backup_dir, name)
+    return artifacts[0] if artifacts else None
+
+def artifact_size(path: str) -> int:
+    """Размер артефакта в байтах (файл или каталог mongodump)"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+
+    total = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            total += os.path.getsize(os.path.join(root, file_name))
+    return total
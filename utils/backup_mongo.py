@@ -4,6 +4,8 @@ import subprocess
 from datetime import datetime
 from typing import Tuple
 
+from utils.process_runner import run_dump
+
 async def backup_mongodb(
     host: str,
     port: int,
@@ -11,20 +13,21 @@ async def backup_mongodb(
     user: str,
     password: str,
     backup_dir: str,
-    name: str
+    name: str,
+    job=None
 ) -> Tuple[bool, str]:
     """Создание бэкапа MongoDB с помощью mongodump"""
     try:
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        dirname = f"{name}_{timestamp}"
-        dirpath = os.path.join(backup_dir, dirname)
+        filename = f"{name}_{timestamp}.archive"
+        filepath = os.path.join(backup_dir, filename)
         
-        # Базовая команда mongodump
+        # Базовая команда mongodump (один файл-архив, восстанавливается потоком)
         cmd = [
             'mongodump',
             f'--host={host}:{port}',
             f'--db={database}',
-            f'--out={dirpath}'
+            '--archive'
         ]
         
         # Добавление аутентификации если есть
@@ -35,19 +38,12 @@ async def backup_mongodb(
                 '--authenticationDatabase=admin'
             ])
         
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await process.communicate()
+        success, result = await run_dump(cmd, filepath, job=job)
         
-        if process.returncode == 0:
-            return True, dirpath
+        if success:
+            return True, result
         else:
-            error_msg = stderr.decode().strip()
-            return False, f"Ошибка mongodump: {error_msg}"
+            return False, f"Ошибка mongodump: {result}"
             
     except Exception as e:
         return False, f"Исключение: {str(e)}"
\ No newline at end of file
@@ -4,6 +4,8 @@ import subprocess
 from datetime import datetime
 from typing import Tuple
 
+from utils.process_runner import run_dump
+
 async def backup_mysql(
     host: str,
     port: int,
@@ -11,7 +13,8 @@ async def backup_mysql(
     user: str,
     password: str,
     backup_dir: str,
-    name: str
+    name: str,
+    job=None
 ) -> Tuple[bool, str]:
     """Создание бэкапа MySQL с помощью mysqldump"""
     try:
@@ -31,22 +34,13 @@ async def backup_mysql(
             database
         ]
         
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await process.communicate()
+        # Дамп потоком пишется в файл, без накопления в памяти
+        success, result = await run_dump(cmd, filepath, job=job)
         
-        if process.returncode == 0:
-            # Сохранение результата в файл
-            with open(filepath, 'wb') as f:
-                f.write(stdout)
-            return True, filepath
+        if success:
+            return True, result
         else:
-            error_msg = stderr.decode().strip()
-            return False, f"Ошибка mysqldump: {error_msg}"
+            return False, f"Ошибка mysqldump: {result}"
             
     except Exception as e:
         return False, f"Исключение: {str(e)}"
\ No newline at end of file
@@ -4,6 +4,8 @@ import subprocess
 from datetime import datetime
 from typing import Tuple
 
+from utils.process_runner import run_dump
+
 async def backup_postgresql(
     host: str,
     port: int,
@@ -11,7 +13,8 @@ async def backup_postgresql(
     user: str,
     password: str,
     backup_dir: str,
-    name: str
+    name: str,
+    job=None
 ) -> Tuple[bool, str]:
     """Создание бэкапа PostgreSQL с помощью pg_dump"""
     try:
@@ -24,32 +27,25 @@ async def backup_postgresql(
         env = os.environ.copy()
         env['PGPASSWORD'] = password
         
-        # Команда pg_dump
+        # Команда pg_dump (дамп пишется в stdout и потоком сохраняется в файл)
         cmd = [
             'pg_dump',
             '-h', host,
             '-p', str(port),
             '-U', user,
             '-d', database,
-            '-f', filepath,
-            '--no-password'
+            '--no-password',
+            # Дамп сам удаляет существующие объекты: восстановление поверх непустой базы
+            '--clean', '--if-exists'
         ]
         
         # Выполнение команды
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            env=env,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await process.communicate()
+        success, result = await run_dump(cmd, filepath, env=env, job=job)
         
-        if process.returncode == 0:
-            return True, filepath
+        if success:
+            return True, result
         else:
-            error_msg = stderr.decode().strip()
-            return False, f"Ошибка pg_dump: {error_msg}"
+            return False, f"Ошибка pg_dump: {result}"
             
     except Exception as e:
         return False, f"Исключение: {str(e)}"
\ No newline at end of file
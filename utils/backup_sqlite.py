@@ -1,10 +1,13 @@
 import os
+import shlex
 import shutil
 import aiofiles
-import paramiko
 from io import BytesIO
 from datetime import datetime
-from typing import Tuple
+from typing import AsyncIterator, Tuple
+
+from utils.ssh_pool import ssh_manager
+from utils.process_runner import write_artifact, CHUNK_SIZE
 
 async def backup_sqlite(
     file_path: str,
@@ -13,7 +16,8 @@ async def backup_sqlite(
     ssh_host: str = None,
     ssh_port: int = 22,
     ssh_user: str = None,
-    ssh_password: str = None
+    ssh_password: str = None,
+    job=None
 ) -> Tuple[bool, str]:
     """Создание бэкапа SQLite"""
     try:
@@ -25,28 +29,32 @@ async def backup_sqlite(
             # Бэкап через SSH
             return await backup_sqlite_ssh(
                 ssh_host, ssh_port, ssh_user, ssh_password,
-                file_path, filepath, name
+                file_path, filepath, name, job
             )
         else:
             # Локальный бэкап
-            return await backup_sqlite_local(file_path, filepath, name)
+            return await backup_sqlite_local(file_path, filepath, name, job)
         
     except Exception as e:
         return False, f"Исключение: {str(e)}"
 
-async def backup_sqlite_local(file_path: str, backup_path: str, name: str) -> Tuple[bool, str]:
+async def backup_sqlite_local(file_path: str, backup_path: str, name: str, job=None) -> Tuple[bool, str]:
     """Локальный бэкап SQLite"""
     try:
         if not os.path.exists(file_path):
             return False, f"Файл не найден: {file_path}"
         
-        # Копирование файла
-        async with aiofiles.open(file_path, 'rb') as source_file:
-            async with aiofiles.open(backup_path, 'wb') as backup_file:
-                content = await source_file.read()
-                await backup_file.write(content)
+        async def read_source() -> AsyncIterator[bytes]:
+            async with aiofiles.open(file_path, 'rb') as source_file:
+                while not (job and job.cancelled):
+                    chunk = await source_file.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
         
-        return True, backup_path
+        # Копирование чанками через сжатие, шифрование и SHA-256, как у дампов
+        artifact = await write_artifact(read_source(), backup_path, job)
+        return _finish(artifact, job)
         
     except Exception as e:
         return False, f"Ошибка локального бэкапа: {str(e)}"
@@ -58,36 +66,42 @@ async def backup_sqlite_ssh(
     ssh_password: str,
     remote_path: str,
     local_path: str,
-    name: str
+    name: str,
+    job=None
 ) -> Tuple[bool, str]:
     """Бэкап SQLite через SSH"""
     try:
-        # Создаем SSH клиент
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-        # Подключаемся по SSH
-        ssh.connect(ssh_host, port=ssh_port, username=ssh_user, password=ssh_password, timeout=30)
-        
-        # Проверяем существование файла
-        stdin, stdout, stderr = ssh.exec_command(f"test -f {remote_path} && echo 'EXISTS' || echo 'NOT_EXISTS'")
-        file_exists = stdout.read().decode().strip()
-        
-        if file_exists != 'EXISTS':
-            ssh.close()
-            return False, f"Файл не найден на сервере по пути: {remote_path}"
+        # Соединение из общего пула, проверка и SFTP идут каналами поверх него
+        async with ssh_manager.connection(ssh_host, ssh_port, ssh_user, ssh_password, connect_timeout=30) as ssh:
+            # Проверяем существование файла
+            result = await ssh.run(f"test -f {shlex.quote(remote_path)} && echo 'EXISTS' || echo 'NOT_EXISTS'")
+            file_exists = result.stdout.strip()
+            
+            if file_exists != 'EXISTS':
+                return False, f"Файл не найден на сервере по пути: {remote_path}"
+            
+            # Скачиваем файл потоком через сжатие, шифрование и SHA-256, как у дампов
+            async with ssh.start_sftp_client() as sftp:
+                async with sftp.open(remote_path, 'rb') as remote_file:
+                    async def read_remote() -> AsyncIterator[bytes]:
+                        while not (job and job.cancelled):
+                            chunk = await remote_file.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            yield chunk
+                    
+                    artifact = await write_artifact(read_remote(), local_path, job)
         
-        # Создаем SFTP сессию
-        sftp = ssh.open_sftp()
-        
-        # Скачиваем файл
-        sftp.get(remote_path, local_path)
-        
-        # Закрываем соединения
-        sftp.close()
-        ssh.close()
-        
-        return True, local_path
+        return _finish(artifact, job)
         
     except Exception as e:
-        return False, f"Ошибка SSH бэкапа: {str(e)}"
\ No newline at end of file
+        return False, f"Ошибка SSH бэкапа: {str(e)}"
+
+def _finish(artifact: dict, job) -> Tuple[bool, str]:
+    """Итог копирования: отмененная копия удаляется, хеш сохраняется в задаче"""
+    if job and job.cancelled:
+        os.remove(artifact['path'])
+        return False, "Бэкап отменен"
+    if job:
+        job.checksum = artifact['sha256']
+    return True, artifact['path']
\ No newline at end of file
@@ -1,24 +1,47 @@
 import os
 import asyncio
-import asyncssh
-from typing import Tuple, List, Optional
+from typing import Tuple, List, Optional, AsyncIterator
 from datetime import datetime
 
+from utils.cache import TTLCache
+from utils.ssh_pool import ssh_manager
+from utils.metrics import cache_entries
+from utils.tracing import tracer
+from utils.lazy import lazy_import
+
+asyncssh = lazy_import('asyncssh')
+
+# Расширения файлов бэкапов на резервном сервере
+BACKUP_EXTENSIONS = ('.sql', '.dump', '.db', '.bson', '.archive')
+
+# Сколько секунд список файлов на резервном сервере считается свежим
+FILE_LIST_TTL = 60
+
 class BackupTransfer:
     def __init__(self):
         self.connections = {}
+        # Сколько операций сейчас используют соединение сервера
+        self.users = {}
+        # Списки файлов по (server_id, remote_path); устаревший список отдается сразу и обновляется в фоне
+        self.file_list_cache = TTLCache(ttl=FILE_LIST_TTL, maxsize=100, stale_ttl=3600)
     
     async def connect(self, server_id: int, host: str, port: int, username: str, password: str) -> Tuple[bool, str]:
         """Подключение к резервному серверу"""
         try:
-            conn = await asyncssh.connect(
-                host=host,
-                port=port,
-                username=username,
-                password=password,
-                known_hosts=None
-            )
-            self.connections[server_id] = conn
+            # Одновременные операции с сервером используют одно соединение из пула,
+            # каждая загрузка или чтение открывает свой SFTP канал
+            conn = self.connections.get(server_id)
+            if conn is None or conn.is_closed():
+                new_conn = await ssh_manager.acquire(host, port, username, password)
+                current = self.connections.get(server_id)
+                if current is not None and current is not conn and not current.is_closed():
+                    # Параллельная операция уже подключилась, пока мы ждали
+                    ssh_manager.release(new_conn)
+                else:
+                    if conn is not None:
+                        ssh_manager.release(conn)
+                    self.connections[server_id] = new_conn
+            self.users[server_id] = self.users.get(server_id, 0) + 1
             return True, "✅ Подключение к резервному серверу установлено"
         except asyncssh.PermissionDenied:
             return False, "❌ Ошибка аутентификации: неверный логин или пароль"
@@ -36,15 +59,53 @@ class BackupTransfer:
             conn = self.connections[server_id]
             
             # Создаем удаленную директорию если не существует
-            await conn.run(f"mkdir -p {remote_path}")
+            with tracer.span('remote_mkdir', path=remote_path):
+                await conn.run(f"mkdir -p {remote_path}")
             
             # Получаем имя файла
             file_name = os.path.basename(local_file_path)
             remote_file_path = os.path.join(remote_path, file_name).replace('\\', '/')
             
             # Загружаем файл через SFTP
+            with tracer.span('sftp_put', path=remote_file_path, bytes=os.path.getsize(local_file_path)):
+                async with conn.start_sftp_client() as sftp:
+                    await sftp.put(local_file_path, remote_file_path)
+            self.invalidate_file_list(server_id)
+            
+            return True, f"✅ Бэкап успешно загружен на резервный сервер: {file_name}"
+            
+        except Exception as e:
+            return False, f"❌ Ошибка загрузки бэкапа: {str(e)}"
+    
+    async def upload_stream(self, server_id: int, chunks: AsyncIterator[bytes], file_name: str, remote_path: str) -> Tuple[bool, str]:
+        """Загрузка бэкапа на резервный сервер из потока (части файла, прочитанного один раз)"""
+        if server_id not in self.connections:
+            return False, "❌ Соединение с резервным сервером не установлено"
+        
+        remote_file_path = os.path.join(remote_path, file_name).replace('\\', '/')
+        try:
+            conn = self.connections[server_id]
+            
+            with tracer.span('remote_mkdir', path=remote_path):
+                await conn.run(f"mkdir -p {remote_path}")
+            
             async with conn.start_sftp_client() as sftp:
-                await sftp.put(local_file_path, remote_file_path)
+                try:
+                    with tracer.span('sftp_write', path=remote_file_path) as span:
+                        written = 0
+                        async with sftp.open(remote_file_path, 'wb') as remote_file:
+                            async for chunk in chunks:
+                                await remote_file.write(chunk)
+                                written += len(chunk)
+                        span.set_attribute('bytes', written)
+                except BaseException:
+                    # Недописанный файл не должен выглядеть как бэкап
+                    try:
+                        await sftp.remove(remote_file_path)
+                    except Exception:
+                        pass
+                    raise
+            self.invalidate_file_list(server_id)
             
             return True, f"✅ Бэкап успешно загружен на резервный сервер: {file_name}"
             
@@ -64,8 +125,13 @@ class BackupTransfer:
             if 'NOT_EXISTS' in result.stdout:
                 return True, [], "📁 Директория для бэкапов не существует"
             
-            # Получаем список файлов
-            result = await conn.run(f"find {remote_path} -type f -name '*.sql' -o -name '*.db' -o -name '*.bson' | sort -r")
+            # Получаем список файлов (в том числе сжатых и зашифрованных)
+            patterns = ' -o '.join(
+                f"-name '*{ext}{suffix}'"
+                for ext in BACKUP_EXTENSIONS
+                for suffix in ('', '.gz', '.zst', '.enc', '.gz.enc', '.zst.enc')
+            )
+            result = await conn.run(f"find {remote_path} -type f \\( {patterns} \\) | sort -r")
             files = [f.strip() for f in result.stdout.split('\n') if f.strip()]
             
             return True, files, f"📁 Найдено {len(files)} файлов бэкапов"
@@ -73,6 +139,40 @@ class BackupTransfer:
         except Exception as e:
             return False, [], f"❌ Ошибка получения списка файлов: {str(e)}"
     
+    async def get_backup_files(self, server: dict) -> Tuple[bool, List[str], str]:
+        """Список файлов бэкапов с кэшированием: подключение открывается только при загрузке списка"""
+        async def load():
+            success, message = await self.connect(
+                server_id=server['id'],
+                host=server['host'],
+                port=server['port'],
+                username=server['username'],
+                password=server['password']
+            )
+            if not success:
+                raise ConnectionError(message)
+            try:
+                success, files, message = await self.list_backup_files(server['id'], server['remote_path'])
+            finally:
+                await self.close_connection(server['id'])
+            if not success:
+                raise RuntimeError(message)
+            return files, message
+        
+        try:
+            files, message = await self.file_list_cache.get_or_load((server['id'], server['remote_path']), load)
+        except Exception as e:
+            return False, [], str(e)
+        return True, files, message
+    
+    def has_file_list(self, server: dict) -> bool:
+        """Есть ли список файлов сервера в кэше (свежий или устаревший)"""
+        return (server['id'], server['remote_path']) in self.file_list_cache
+    
+    def invalidate_file_list(self, server_id: int):
+        """Сброс кэша списка файлов сервера после загрузки или удаления"""
+        self.file_list_cache.invalidate_matching(lambda key: key[0] == server_id)
+    
     async def download_backup(self, server_id: int, remote_file_path: str, local_dir: str) -> Tuple[bool, str]:
         """Скачивание файла бэкапа с резервного сервера"""
         if server_id not in self.connections:
@@ -97,6 +197,20 @@ class BackupTransfer:
         except Exception as e:
             return False, f"❌ Ошибка скачивания бэкапа: {str(e)}"
     
+    async def stream_backup(self, server_id: int, remote_file_path: str, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+        """Потоковое чтение файла бэкапа с резервного сервера"""
+        if server_id not in self.connections:
+            raise ConnectionError("Соединение с резервным сервером не установлено")
+        
+        conn = self.connections[server_id]
+        async with conn.start_sftp_client() as sftp:
+            async with sftp.open(remote_file_path, 'rb') as remote_file:
+                while True:
+                    chunk = await remote_file.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+    
     async def delete_backup(self, server_id: int, remote_file_path: str) -> Tuple[bool, str]:
         """Удаление файла бэкапа с резервного сервера"""
         if server_id not in self.connections:
@@ -109,6 +223,7 @@ class BackupTransfer:
             result = await conn.run(f"rm -f {remote_file_path}")
             
             if result.exit_status == 0:
+                self.invalidate_file_list(server_id)
                 return True, "✅ Файл бэкапа удален с резервного сервера"
             else:
                 return False, f"❌ Ошибка удаления файла: {result.stderr}"
@@ -120,8 +235,10 @@ class BackupTransfer:
         """Закрытие соединения с резервным сервером"""
         try:
             if server_id in self.connections:
-                self.connections[server_id].close()
-                del self.connections[server_id]
+                self.users[server_id] = self.users.get(server_id, 1) - 1
+                if self.users[server_id] <= 0:
+                    ssh_manager.release(self.connections.pop(server_id))
+                    self.users.pop(server_id, None)
             return True
         except:
             return False
@@ -131,4 +248,5 @@ class BackupTransfer:
         return server_id in self.connections
 
 # Глобальный экземпляр для передачи бэкапов
-backup_transfer = BackupTransfer()
\ No newline at end of file
+backup_transfer = BackupTransfer()
+cache_entries.set_function(lambda: len(backup_transfer.file_list_cache), cache='backup_files')
\ No newline at end of file
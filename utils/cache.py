@@ -0,0 +1,147 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """Кэш с ограничением размера (LRU), временем жизни и stale-while-revalidate.
+
+    Свежие значения (моложе ttl) отдаются сразу. Устаревшие, но моложе
+    ttl + stale_ttl, тоже отдаются сразу, а в фоне запускается обновление.
+    Более старые считаются отсутствующими и загружаются с ожиданием.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024, stale_ttl: Optional[float] = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # None - устаревшее значение можно отдавать, пока оно не вытеснено
+        self.stale_ttl = stale_ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._loading: Dict[Hashable, asyncio.Future] = {}
+        self._refreshing: Set[Hashable] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._state(key) != 'missing'
+
+    def _state(self, key: Hashable) -> str:
+        """fresh, stale или missing"""
+        entry = self._data.get(key)
+        if entry is None:
+            return 'missing'
+        age = time.monotonic() - entry[1]
+        if age < self.ttl:
+            return 'fresh'
+        if self.stale_ttl is None or age < self.ttl + self.stale_ttl:
+            return 'stale'
+        return 'missing'
+
+    def get(self, key: Hashable, default: Any = None, allow_stale: bool = False) -> Any:
+        """Значение без загрузки"""
+        state = self._state(key)
+        if state == 'fresh' or (allow_stale and state == 'stale'):
+            self._data.move_to_end(key)
+            return self._data[key][0]
+        return default
+
+    def set(self, key: Hashable, value: Any):
+        """Сохранение значения с вытеснением давно не использованных"""
+        self._data[key] = (value, time.monotonic())
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """Удаление значения"""
+        self._data.pop(key, None)
+
+    def invalidate_matching(self, predicate: Callable[[Hashable], bool]):
+        """Удаление значений, ключи которых подходят под условие"""
+        for key in [key for key in self._data if predicate(key)]:
+            del self._data[key]
+
+    def clear(self):
+        """Очистка кэша"""
+        self._data.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Значение из кэша или загрузка; одновременные запросы ключа ждут одну загрузку"""
+        state = self._state(key)
+        if state == 'fresh':
+            self._data.move_to_end(key)
+            return self._data[key][0]
+        if state == 'stale':
+            if key not in self._loading:
+                self._spawn(self._load(key, loader))
+            self._data.move_to_end(key)
+            return self._data[key][0]
+        return await self._load(key, loader)
+
+    async def get_many(
+        self,
+        keys: Iterable[Hashable],
+        loader: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]]
+    ) -> Dict[Hashable, Any]:
+        """Значения для многих ключей: отсутствующие загружаются одним вызовом loader,
+        устаревшие отдаются сразу и обновляются одним фоновым вызовом"""
+        result = {}
+        missing, stale = [], []
+        for key in dict.fromkeys(keys):
+            state = self._state(key)
+            if state == 'missing':
+                missing.append(key)
+                continue
+            if state == 'stale' and key not in self._refreshing:
+                stale.append(key)
+            self._data.move_to_end(key)
+            result[key] = self._data[key][0]
+
+        if stale:
+            self._refreshing.update(stale)
+            self._spawn(self._load_many(stale, loader, background=True))
+
+        if missing:
+            result.update(await self._load_many(missing, loader))
+
+        return result
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._loading.get(key)
+        if future is None:
+            future = asyncio.ensure_future(loader())
+            self._loading[key] = future
+            try:
+                value = await future
+                self.set(key, value)
+                return value
+            finally:
+                self._loading.pop(key, None)
+        return await asyncio.shield(future)
+
+    async def _load_many(self, keys: List[Hashable], loader, background: bool = False) -> Dict[Hashable, Any]:
+        try:
+            values = await loader(keys)
+            for key, value in values.items():
+                self.set(key, value)
+            return values
+        finally:
+            if background:
+                self._refreshing.difference_update(keys)
+
+    def _spawn(self, coro):
+        """Фоновое обновление: ошибки логируются, старое значение остается"""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+
+        def done(task: asyncio.Task):
+            self._tasks.discard(task)
+            if not task.cancelled() and task.exception():
+                logger.warning(f"Ошибка фонового обновления кэша: {task.exception()}")
+
+        task.add_done_callback(done)
@@ -0,0 +1,216 @@
+import os
+import zlib
+import hashlib
+import shutil
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+# Размер блока параллельного gzip: каждый блок сжимается отдельным членом gzip
+GZIP_BLOCK_SIZE = 2 * 1024 * 1024
+
+# Расширения артефактов по алгоритму сжатия
+EXTENSIONS = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+def get_settings() -> Dict[str, Any]:
+    """Сжатие дампов из переменных окружения"""
+    algorithm = os.getenv('BACKUP_COMPRESSION', 'none').lower()
+    if algorithm not in EXTENSIONS:
+        logger.warning(f"Неизвестный BACKUP_COMPRESSION={algorithm}, дампы не сжимаются")
+        algorithm = 'none'
+    level = os.getenv('BACKUP_COMPRESSION_LEVEL', '')
+    return {
+        'algorithm': algorithm,
+        'level': int(level) if level else None,
+        # 0 - все ядра
+        'threads': int(os.getenv('BACKUP_COMPRESSION_THREADS', '0')) or os.cpu_count() or 1,
+    }
+
+class FileSink:
+    """Файл артефакта: запись и SHA-256 записанного за один проход"""
+
+    def __init__(self, path: str):
+        self.file = open(path, 'wb')
+        self.hash = hashlib.sha256()
+
+    def _write(self, data: bytes):
+        # hashlib и запись отпускают GIL: цикл событий не ждет
+        self.hash.update(data)
+        self.file.write(data)
+
+    async def write(self, data: bytes) -> int:
+        """Запись части артефакта; возвращает число байт, записанных на диск"""
+        await asyncio.to_thread(self._write, data)
+        return len(data)
+
+    async def close(self) -> int:
+        """Завершение записи; возвращает число байт, дописанных на диск"""
+        self.file.close()
+        return 0
+
+    async def abort(self):
+        self.file.close()
+
+    @property
+    def checksum(self) -> str:
+        """SHA-256 артефакта в hex"""
+        return self.hash.hexdigest()
+
+class PlainWriter:
+    """Запись дампа без сжатия"""
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    async def write(self, data: bytes) -> int:
+        return await self.sink.write(data)
+
+    async def close(self) -> int:
+        return await self.sink.close()
+
+    async def abort(self):
+        await self.sink.abort()
+
+def _gzip_member(block: bytes, level: int) -> bytes:
+    """Блок как самостоятельный член gzip (zlib отпускает GIL на время сжатия)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    return compressor.compress(block) + compressor.flush()
+
+class ParallelGzipWriter:
+    """Блочно-параллельный gzip в стиле pigz.
+
+    Поток дампа режется на блоки, блоки сжимаются в пуле потоков на всех
+    ядрах и пишутся в артефакт по порядку. Результат - обычный многочленный
+    gzip: его читают gzip -d, zcat и потоковое восстановление.
+    """
+
+    def __init__(self, sink, level: int, threads: int):
+        self.sink = sink
+        self.level = level
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='gzip')
+        self.buffer = bytearray()
+        # Блоки в работе; в памяти не больше двух блоков на поток
+        self.pending = deque()
+
+    def _submit(self, block: bytes):
+        loop = asyncio.get_running_loop()
+        self.pending.append(loop.run_in_executor(self.executor, _gzip_member, block, self.level))
+
+    async def _write_next(self) -> int:
+        return await self.sink.write(await self.pending.popleft())
+
+    async def write(self, data: bytes) -> int:
+        self.buffer += data
+        written = 0
+        while len(self.buffer) >= GZIP_BLOCK_SIZE:
+            self._submit(bytes(self.buffer[:GZIP_BLOCK_SIZE]))
+            del self.buffer[:GZIP_BLOCK_SIZE]
+            # Пока пул занят, дамп ждет и упирается в заполненный pipe
+            while len(self.pending) >= self.threads * 2:
+                written += await self._write_next()
+        return written
+
+    async def close(self) -> int:
+        if self.buffer or not self.pending:
+            # Пустой дамп - тоже корректный gzip
+            self._submit(bytes(self.buffer))
+            self.buffer.clear()
+        written = 0
+        try:
+            while self.pending:
+                written += await self._write_next()
+        finally:
+            self.executor.shutdown(wait=False)
+        return written + await self.sink.close()
+
+    async def abort(self):
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.executor.shutdown(wait=False)
+        await self.sink.abort()
+
+class ProcessWriter:
+    """Сжатие внешней утилитой (zstd -T): дамп идет в stdin, сжатый поток из stdout - в артефакт"""
+
+    def __init__(self, sink, cmd: List[str]):
+        self.sink = sink
+        self.cmd = cmd
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.reader: Optional[asyncio.Task] = None
+        # Сжатые байты, записанные читателем stdout, но еще не учтенные в прогрессе
+        self.unreported = 0
+
+    async def _read_output(self):
+        while True:
+            data = await self.process.stdout.read(CHUNK_SIZE)
+            if not data:
+                break
+            self.unreported += await self.sink.write(data)
+
+    def _take_reported(self) -> int:
+        count, self.unreported = self.unreported, 0
+        return count
+
+    async def write(self, data: bytes) -> int:
+        if self.process is None:
+            self.process = await asyncio.create_subprocess_exec(
+                *self.cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            self.reader = asyncio.create_task(self._read_output())
+        self.process.stdin.write(data)
+        await self.process.stdin.drain()
+        return self._take_reported()
+
+    async def close(self) -> int:
+        if self.process is None:
+            await self.write(b'')
+        self.process.stdin.close()
+        stderr = await self.process.stderr.read()
+        await self.reader
+        await self.process.wait()
+        if self.process.returncode != 0:
+            raise RuntimeError(f"{self.cmd[0]}: {stderr.decode(errors='ignore').strip()}")
+        return self._take_reported() + await self.sink.close()
+
+    async def abort(self):
+        if self.reader:
+            self.reader.cancel()
+        if self.process and self.process.returncode is None:
+            self.process.kill()
+            await self.process.wait()
+        await self.sink.abort()
+
+def compressed_path(path: str, settings: Dict[str, Any] = None) -> str:
+    """Путь артефакта с расширением сжатия"""
+    settings = settings or get_settings()
+    return path + EXTENSIONS[settings['algorithm']]
+
+def open_writer(sink, settings: Dict[str, Any] = None, wrap=None):
+    """Запись дампа в артефакт с выбранным сжатием на все ядра (wrap - ограничения ресурсов для внешней утилиты)"""
+    settings = settings or get_settings()
+    algorithm = settings['algorithm']
+
+    if algorithm == 'gzip':
+        level = settings['level'] if settings['level'] is not None else 6
+        return ParallelGzipWriter(sink, level, settings['threads'])
+
+    if algorithm == 'zstd':
+        if not shutil.which('zstd'):
+            raise RuntimeError("zstd не установлен на хосте")
+        level = settings['level'] if settings['level'] is not None else 3
+        # Многопоточный zstd пишет обычные кадры, zstd -d читает их без опций
+        cmd = ['zstd', '-q', '-c', f"-{level}", f"-T{settings['threads']}"]
+        return ProcessWriter(sink, wrap(cmd) if wrap else cmd)
+
+    return PlainWriter(sink)
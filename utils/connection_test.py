@@ -1,34 +1,63 @@
+import os
+import shlex
 import asyncio
-import asyncpg
-import pymysql
-import paramiko
-from io import StringIO
+import functools
 import aiosqlite
-from pymongo import MongoClient
-from pymongo.errors import ServerSelectionTimeoutError
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
+from utils.ssh_pool import ssh_manager
+from utils.lazy import lazy_import
+
+# Драйверы загружаются при первой проверке своего типа БД
+asyncpg = lazy_import('asyncpg')
+pymysql = lazy_import('pymysql')
+pymongo = lazy_import('pymongo')
+
 logger = logging.getLogger(__name__)
 
+# Общий таймаут проверки одного подключения (драйверы сами ждут до 10 секунд)
+TEST_TIMEOUT = 15
+
+# Отдельный пул для блокирующих драйверов (pymysql, pymongo),
+# чтобы проверки не занимали общий пул asyncio.to_thread
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('CONNECTION_TEST_WORKERS', '8')),
+    thread_name_prefix='connection_test'
+)
+
+async def run_blocking(func, *args, **kwargs):
+    """Выполнение блокирующего вызова в пуле проверок без блокировки event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
 async def test_connection(connection):
     """Тестирование подключения к базе данных"""
     db_type = connection['db_type']
     
     try:
         if db_type == 'psql':
-            return await test_postgresql(connection)
+            tester = test_postgresql
         elif db_type == 'mysql':
-            return await test_mysql(connection)
+            tester = test_mysql
         elif db_type == 'sqlite':
-            return await test_sqlite(connection)
+            tester = test_sqlite
         elif db_type == 'mongo':
-            return await test_mongodb(connection)
+            tester = test_mongodb
         else:
             return False, f"Неизвестный тип БД: {db_type}"
+        return await asyncio.wait_for(tester(connection), timeout=TEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        return False, f"Таймаут проверки подключения ({TEST_TIMEOUT} с)"
     except Exception as e:
         logger.error(f"Ошибка тестирования подключения: {e}")
         return False, f"Ошибка тестирования: {str(e)}"
 
+async def test_all_connections(connections):
+    """Одновременная проверка всех подключений: [(подключение, успех, сообщение)]"""
+    results = await asyncio.gather(*(test_connection(conn) for conn in connections))
+    return [(conn, success, message) for conn, (success, message) in zip(connections, results)]
+
 async def test_postgresql(connection):
     """Тестирование подключения PostgreSQL"""
     try:
@@ -63,15 +92,22 @@ async def test_postgresql(connection):
 async def test_mysql(connection):
     """Тестирование подключения MySQL"""
     try:
-        conn = pymysql.connect(
-            host=connection['host'],
-            port=connection['port'],
-            user=connection['user'],
-            password=connection['password'],
-            database=connection['database'],
-            connect_timeout=10
-        )
-        
+        return True, await run_blocking(get_mysql_info, connection)
+    except Exception as e:
+        return False, f"Ошибка подключения: {str(e)}"
+
+def get_mysql_info(connection):
+    """Сведения о MySQL (блокирующий вызов, выполняется в пуле)"""
+    conn = pymysql.connect(
+        host=connection['host'],
+        port=connection['port'],
+        user=connection['user'],
+        password=connection['password'],
+        database=connection['database'],
+        connect_timeout=10
+    )
+    
+    try:
         with conn.cursor() as cursor:
             # Получаем информацию о БД
             cursor.execute("SELECT VERSION()")
@@ -89,17 +125,14 @@ async def test_mysql(connection):
             """, (connection['database'],))
             db_info = cursor.fetchone()
             db_size = f"{db_info[1]} MB" if db_info else "N/A"
-        
+    finally:
         conn.close()
-        
-        message = f"MySQL версия: {version}\n"
-        message += f"Комментарий: {version_comment}\n"
-        message += f"Размер БД: {db_size}"
-        
-        return True, message
-        
-    except Exception as e:
-        return False, f"Ошибка подключения: {str(e)}"
+    
+    message = f"MySQL версия: {version}\n"
+    message += f"Комментарий: {version_comment}\n"
+    message += f"Размер БД: {db_size}"
+    
+    return message
 
 async def test_sqlite(connection):
     """Тестирование подключения SQLite"""
@@ -137,37 +170,28 @@ async def test_sqlite(connection):
 async def test_sqlite_ssh(connection):
     """Тестирование SQLite через SSH"""
     try:
-        ssh_host = connection['ssh_host']
-        ssh_port = connection.get('ssh_port', 22)
-        ssh_user = connection['ssh_user']
-        ssh_password = connection['ssh_password']
-        file_path = connection['file_path']
-        
-        # Создаем SSH клиент
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        
-        # Подключаемся по SSH
-        ssh.connect(ssh_host, port=ssh_port, username=ssh_user, password=ssh_password, timeout=10)
-        
-        # Проверяем существование файла
-        stdin, stdout, stderr = ssh.exec_command(f"test -f {file_path} && echo 'EXISTS' || echo 'NOT_EXISTS'")
-        file_exists = stdout.read().decode().strip()
-        
-        if file_exists != 'EXISTS':
-            ssh.close()
-            return False, f"Файл не найден по пути: {file_path}"
-        
-        # Получаем информацию о файле
-        stdin, stdout, stderr = ssh.exec_command(f"stat -c '%s' {file_path}")
-        file_size = stdout.read().decode().strip()
-        
-        # Пытаемся выполнить простой SQL запрос
-        stdin, stdout, stderr = ssh.exec_command(f"sqlite3 {file_path} 'SELECT sqlite_version();'")
-        version_output = stdout.read().decode().strip()
-        error_output = stderr.read().decode().strip()
-        
-        ssh.close()
+        file_path = shlex.quote(connection['file_path'])
+        
+        # Соединение из общего пула: повторные проверки не открывают новое SSH подключение
+        async with ssh_manager.connection(
+            connection['ssh_host'],
+            connection.get('ssh_port') or 22,
+            connection['ssh_user'],
+            connection['ssh_password']
+        ) as ssh:
+            # Проверяем существование файла
+            result = await ssh.run(f"test -f {file_path} && echo 'EXISTS' || echo 'NOT_EXISTS'")
+            if result.stdout.strip() != 'EXISTS':
+                return False, f"Файл не найден по пути: {connection['file_path']}"
+            
+            # Получаем информацию о файле
+            result = await ssh.run(f"stat -c '%s' {file_path}")
+            file_size = result.stdout.strip()
+            
+            # Пытаемся выполнить простой SQL запрос
+            result = await ssh.run(f"sqlite3 {file_path} 'SELECT sqlite_version();'")
+            version_output = result.stdout.strip()
+            error_output = result.stderr.strip()
         
         if error_output and "not found" in error_output:
             return False, "SQLite3 не установлен на удаленном сервере"
@@ -186,14 +210,23 @@ async def test_sqlite_ssh(connection):
 async def test_mongodb(connection):
     """Тестирование подключения MongoDB"""
     try:
-        client = MongoClient(
-            host=connection['host'],
-            port=connection['port'],
-            username=connection['user'],
-            password=connection['password'],
-            serverSelectionTimeoutMS=10000
-        )
-        
+        return True, await run_blocking(get_mongodb_info, connection)
+    except pymongo.errors.ServerSelectionTimeoutError:
+        return False, "Таймаут подключения к MongoDB"
+    except Exception as e:
+        return False, f"Ошибка подключения: {str(e)}"
+
+def get_mongodb_info(connection):
+    """Сведения о MongoDB (блокирующий вызов, выполняется в пуле)"""
+    client = pymongo.MongoClient(
+        host=connection['host'],
+        port=connection['port'],
+        username=connection['user'],
+        password=connection['password'],
+        serverSelectionTimeoutMS=10000
+    )
+    
+    try:
         # Тестируем подключение
         client.admin.command('ismaster')
         
@@ -203,16 +236,11 @@ async def test_mongodb(connection):
         
         # Получаем список коллекций
         collections = db.list_collection_names()
-        
+    finally:
         client.close()
-        
-        message = f"MongoDB подключение: ✅ Успешно\n"
-        message += f"Количество коллекций: {len(collections)}\n"
-        message += f"Размер БД: {db_stats['dataSize'] / 1024 / 1024:.2f} MB"
-        
-        return True, message
-        
-    except ServerSelectionTimeoutError:
-        return False, "Таймаут подключения к MongoDB"
-    except Exception as e:
-        return False, f"Ошибка подключения: {str(e)}"
\ No newline at end of file
+    
+    message = f"MongoDB подключение: ✅ Успешно\n"
+    message += f"Количество коллекций: {len(collections)}\n"
+    message += f"Размер БД: {db_stats['dataSize'] / 1024 / 1024:.2f} MB"
+    
+    return message
\ No newline at end of file
@@ -1,13 +1,33 @@
 import aiosqlite
 import json
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator
+
+from utils.metrics import db_query_duration
 
 DB_PATH = 'connections.db'
 
+@asynccontextmanager
+async def _connect(operation: str) -> AsyncIterator[aiosqlite.Connection]:
+    """Соединение со служебной БД с замером длительности операции"""
+    with db_query_duration.time(operation=operation):
+        async with aiosqlite.connect(DB_PATH) as db:
+            yield db
+
+async def _add_column(db: aiosqlite.Connection, table: str, column: str, definition: str):
+    """Добавление колонки в существующую таблицу, если ее еще нет"""
+    cursor = await db.execute(f'PRAGMA table_info({table})')
+    columns = [row[1] for row in await cursor.fetchall()]
+    if column not in columns:
+        await db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
 async def init_db():
     """Инициализация базы данных для хранения подключений"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('init_db') as db:
+        # WAL: бот и воркеры читают базу, пока другой процесс в нее пишет
+        await db.execute('PRAGMA journal_mode=WAL')
+
         # Основная таблица подключений
         await db.execute('''
             CREATE TABLE IF NOT EXISTS connections (
@@ -25,6 +45,7 @@ async def init_db():
                 ssh_user TEXT,
                 ssh_password TEXT,
                 enabled BOOLEAN DEFAULT 1,
+                affinity TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
@@ -36,6 +57,8 @@ async def init_db():
                 connection_id INTEGER,
                 success BOOLEAN,
                 error_message TEXT,
+                worker TEXT,
+                checksum TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (connection_id) REFERENCES connections (id)
             )
@@ -80,9 +103,76 @@ async def init_db():
             )
         ''')
 
+        # Таблица проверок восстановления бэкапов
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS backup_verifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                connection_id INTEGER,
+                artifact_path TEXT,
+                success BOOLEAN,
+                restore_seconds REAL,
+                row_counts TEXT,
+                error_message TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (connection_id) REFERENCES connections (id)
+            )
+        ''')
+
+        # Таблица результатов фоновых проверок состояния (подключения и SSH серверы)
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS health_checks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                target_type TEXT NOT NULL,
+                target_id INTEGER NOT NULL,
+                success BOOLEAN,
+                latency_ms REAL,
+                version TEXT,
+                size TEXT,
+                message TEXT,
+                checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Очередь бэкапов: бот ставит задачи, процессы-воркеры их выполняют
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS backup_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                connection_id INTEGER NOT NULL,
+                upload BOOLEAN DEFAULT 0,
+                affinity TEXT,
+                status TEXT NOT NULL DEFAULT 'queued' CHECK(status IN ('queued', 'running', 'done', 'failed', 'cancelled')),
+                worker TEXT,
+                attempts INTEGER DEFAULT 0,
+                cancel_requested BOOLEAN DEFAULT 0,
+                bytes_done INTEGER DEFAULT 0,
+                total_bytes INTEGER,
+                result TEXT,
+                uploaded BOOLEAN,
+                uploads TEXT,
+                dump_seconds REAL,
+                upload_seconds REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                heartbeat_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                FOREIGN KEY (connection_id) REFERENCES connections (id)
+            )
+        ''')
+
+        # Колонки, добавленные после создания таблиц
+        await _add_column(db, 'connections', 'affinity', 'TEXT')
+        await _add_column(db, 'backup_logs', 'worker', 'TEXT')
+        await _add_column(db, 'backup_logs', 'checksum', 'TEXT')
+        await _add_column(db, 'backup_queue', 'affinity', 'TEXT')
+        await _add_column(db, 'backup_queue', 'heartbeat_at', 'TIMESTAMP')
+        await _add_column(db, 'backup_queue', 'uploads', 'TEXT')
+
         await db.execute('CREATE INDEX IF NOT EXISTS idx_connections_enabled ON connections(enabled)')
         await db.execute('CREATE INDEX IF NOT EXISTS idx_backup_logs_created ON backup_logs(created_at)')
         await db.execute('CREATE INDEX IF NOT EXISTS idx_ssh_servers_host ON ssh_servers(host)')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_backup_verifications_created ON backup_verifications(created_at)')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_health_checks_target ON health_checks(target_type, target_id, checked_at)')
+        await db.execute('CREATE INDEX IF NOT EXISTS idx_backup_queue_status ON backup_queue(status, id)')
         
         await db.commit()
 
@@ -102,7 +192,7 @@ async def add_connection(
     enabled: bool = True
 ) -> int:
     """Добавление нового подключения к БД"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('add_connection') as db:
         cursor = await db.execute('''
             INSERT INTO connections 
             (name, db_type, host, port, database, user, password, file_path, 
@@ -117,7 +207,7 @@ async def add_connection(
 
 async def get_connections() -> List[Dict[str, Any]]:
     """Получение списка всех подключений"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('get_connections') as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('SELECT * FROM connections ORDER BY created_at DESC')
         rows = await cursor.fetchall()
@@ -125,7 +215,7 @@ async def get_connections() -> List[Dict[str, Any]]:
 
 async def get_connection(connection_id: int) -> Optional[Dict[str, Any]]:
     """Получение подключения по ID"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('get_connection') as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('SELECT * FROM connections WHERE id = ?', (connection_id,))
         row = await cursor.fetchone()
@@ -133,7 +223,7 @@ async def get_connection(connection_id: int) -> Optional[Dict[str, Any]]:
 
 async def get_enabled_connections() -> List[Dict[str, Any]]:
     """Получение списка включенных подключений"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('get_enabled_connections') as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('SELECT * FROM connections WHERE enabled = 1')
         rows = await cursor.fetchall()
@@ -141,7 +231,7 @@ async def get_enabled_connections() -> List[Dict[str, Any]]:
 
 async def update_connection_enabled(connection_id: int, enabled: bool) -> bool:
     """Обновление статуса подключения"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('update_connection_enabled') as db:
         cursor = await db.execute(
             'UPDATE connections SET enabled = ? WHERE id = ?',
             (enabled, connection_id)
@@ -159,7 +249,7 @@ async def update_connection(connection_id: int, updates: Dict[str, Any]) -> bool
     values = list(updates.values())
     values.append(connection_id)
     
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('update_connection') as db:
         cursor = await db.execute(
             f'UPDATE connections SET {set_clause} WHERE id = ?',
             values
@@ -169,23 +259,29 @@ async def update_connection(connection_id: int, updates: Dict[str, Any]) -> bool
 
 async def delete_connection(connection_id: int) -> bool:
     """Удаление подключения"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('delete_connection') as db:
         cursor = await db.execute('DELETE FROM connections WHERE id = ?', (connection_id,))
         await db.commit()
         return cursor.rowcount > 0
 
-async def log_backup(connection_id: int, success: bool, error_message: str = None):
-    """Логирование результата бэкапа"""
-    async with aiosqlite.connect(DB_PATH) as db:
+async def log_backup(
+    connection_id: int,
+    success: bool,
+    error_message: str = None,
+    worker: str = None,
+    checksum: str = None
+):
+    """Логирование результата бэкапа (worker - воркер, который его выполнил, checksum - SHA-256 артефакта)"""
+    async with _connect('log_backup') as db:
         await db.execute(
-            'INSERT INTO backup_logs (connection_id, success, error_message) VALUES (?, ?, ?)',
-            (connection_id, success, error_message)
+            'INSERT INTO backup_logs (connection_id, success, error_message, worker, checksum) VALUES (?, ?, ?, ?, ?)',
+            (connection_id, success, error_message, worker, checksum)
         )
         await db.commit()
 
 async def get_recent_logs(limit: int = 10) -> List[Dict[str, Any]]:
     """Получение последних логов бэкапов"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('get_recent_logs') as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT bl.*, c.name as connection_name 
@@ -196,6 +292,86 @@ async def get_recent_logs(limit: int = 10) -> List[Dict[str, Any]]:
         ''', (limit,))
         rows = await cursor.fetchall()
         return [dict(row) for row in rows]
+
+async def log_verification(
+    connection_id: int,
+    artifact_path: str,
+    success: bool,
+    restore_seconds: float = None,
+    row_counts: Dict[str, int] = None,
+    error_message: str = None
+):
+    """Логирование результата проверки восстановления"""
+    async with _connect('log_verification') as db:
+        await db.execute('''
+            INSERT INTO backup_verifications
+            (connection_id, artifact_path, success, restore_seconds, row_counts, error_message)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (
+            connection_id, artifact_path, success, restore_seconds,
+            json.dumps(row_counts or {}), error_message
+        ))
+        await db.commit()
+
+async def get_recent_verifications(limit: int = 10) -> List[Dict[str, Any]]:
+    """Получение последних проверок восстановления"""
+    async with _connect('get_recent_verifications') as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute('''
+            SELECT bv.*, c.name as connection_name
+            FROM backup_verifications bv
+            LEFT JOIN connections c ON bv.connection_id = c.id
+            ORDER BY bv.created_at DESC
+            LIMIT ?
+        ''', (limit,))
+        rows = await cursor.fetchall()
+        result = []
+        for row in rows:
+            item = dict(row)
+            item['row_counts'] = json.loads(item['row_counts']) if item['row_counts'] else {}
+            result.append(item)
+        return result
+
+async def log_health_check(
+    target_type: str,
+    target_id: int,
+    success: bool,
+    latency_ms: float = None,
+    version: str = None,
+    size: str = None,
+    message: str = None
+):
+    """Сохранение результата проверки состояния"""
+    async with _connect('log_health_check') as db:
+        await db.execute('''
+            INSERT INTO health_checks
+            (target_type, target_id, success, latency_ms, version, size, message)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (target_type, target_id, success, latency_ms, version, size, message))
+        await db.commit()
+
+async def get_latest_health() -> List[Dict[str, Any]]:
+    """Последний результат проверки для каждой цели"""
+    async with _connect('get_latest_health') as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute('''
+            SELECT * FROM health_checks
+            WHERE id IN (
+                SELECT MAX(id) FROM health_checks GROUP BY target_type, target_id
+            )
+        ''')
+        rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
+
+async def delete_old_health_checks(days: int = 7) -> int:
+    """Удаление истории проверок состояния старше указанного числа дней"""
+    async with _connect('delete_old_health_checks') as db:
+        cursor = await db.execute(
+            "DELETE FROM health_checks WHERE checked_at < datetime('now', ?)",
+            (f'-{days} days',)
+        )
+        await db.commit()
+        return cursor.rowcount
     
 async def add_ssh_server(
     name: str,
@@ -205,7 +381,7 @@ async def add_ssh_server(
     password: str = None
 ) -> int:
     """Добавление нового SSH сервера"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('add_ssh_server') as db:
         cursor = await db.execute('''
             INSERT INTO ssh_servers (name, host, port, username, password)
             VALUES (?, ?, ?, ?, ?)
@@ -215,7 +391,7 @@ async def add_ssh_server(
 
 async def get_ssh_servers() -> List[Dict[str, Any]]:
     """Получение списка всех SSH серверов"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('get_ssh_servers') as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('SELECT * FROM ssh_servers ORDER BY created_at DESC')
         rows = await cursor.fetchall()
@@ -223,7 +399,7 @@ async def get_ssh_servers() -> List[Dict[str, Any]]:
 
 async def get_ssh_server(server_id: int) -> Optional[Dict[str, Any]]:
     """Получение SSH сервера по ID"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('get_ssh_server') as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('SELECT * FROM ssh_servers WHERE id = ?', (server_id,))
         row = await cursor.fetchone()
@@ -238,7 +414,7 @@ async def update_ssh_server(server_id: int, updates: Dict[str, Any]) -> bool:
     values = list(updates.values())
     values.append(server_id)
     
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('update_ssh_server') as db:
         cursor = await db.execute(
             f'UPDATE ssh_servers SET {set_clause} WHERE id = ?',
             values
@@ -248,14 +424,14 @@ async def update_ssh_server(server_id: int, updates: Dict[str, Any]) -> bool:
 
 async def delete_ssh_server(server_id: int) -> bool:
     """Удаление SSH сервера"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('delete_ssh_server') as db:
         cursor = await db.execute('DELETE FROM ssh_servers WHERE id = ?', (server_id,))
         await db.commit()
         return cursor.rowcount > 0
 
 async def log_ssh_command(server_id: int, command: str, output: str):
     """Логирование SSH команды"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('log_ssh_command') as db:
         await db.execute(
             'INSERT INTO ssh_logs (server_id, command, output) VALUES (?, ?, ?)',
             (server_id, command, output)
@@ -264,7 +440,7 @@ async def log_ssh_command(server_id: int, command: str, output: str):
 
 async def get_ssh_logs(server_id: int, limit: int = 50) -> List[Dict[str, Any]]:
     """Получение логов SSH сессий"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('get_ssh_logs') as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('''
             SELECT * FROM ssh_logs 
@@ -285,7 +461,7 @@ async def add_backup_server(
     enabled: bool = True
 ) -> int:
     """Добавление нового резервного сервера"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('add_backup_server') as db:
         cursor = await db.execute('''
             INSERT INTO backup_servers (name, host, port, username, password, remote_path, enabled)
             VALUES (?, ?, ?, ?, ?, ?, ?)
@@ -295,7 +471,7 @@ async def add_backup_server(
 
 async def get_backup_servers() -> List[Dict[str, Any]]:
     """Получение списка всех резервных серверов"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('get_backup_servers') as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('SELECT * FROM backup_servers ORDER BY created_at DESC')
         rows = await cursor.fetchall()
@@ -303,7 +479,7 @@ async def get_backup_servers() -> List[Dict[str, Any]]:
 
 async def get_backup_server(server_id: int) -> Optional[Dict[str, Any]]:
     """Получение резервного сервера по ID"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('get_backup_server') as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('SELECT * FROM backup_servers WHERE id = ?', (server_id,))
         row = await cursor.fetchone()
@@ -311,12 +487,20 @@ async def get_backup_server(server_id: int) -> Optional[Dict[str, Any]]:
 
 async def get_enabled_backup_server() -> Optional[Dict[str, Any]]:
     """Получение включенного резервного сервера"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('get_enabled_backup_server') as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute('SELECT * FROM backup_servers WHERE enabled = 1 LIMIT 1')
         row = await cursor.fetchone()
         return dict(row) if row else None
 
+async def get_enabled_backup_servers() -> List[Dict[str, Any]]:
+    """Все включенные резервные серверы: бэкап загружается на каждый"""
+    async with _connect('get_enabled_backup_servers') as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute('SELECT * FROM backup_servers WHERE enabled = 1 ORDER BY id')
+        rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
+
 async def update_backup_server(server_id: int, updates: Dict[str, Any]) -> bool:
     """Обновление данных резервного сервера"""
     if not updates:
@@ -326,7 +510,7 @@ async def update_backup_server(server_id: int, updates: Dict[str, Any]) -> bool:
     values = list(updates.values())
     values.append(server_id)
     
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('update_backup_server') as db:
         cursor = await db.execute(
             f'UPDATE backup_servers SET {set_clause} WHERE id = ?',
             values
@@ -336,7 +520,189 @@ async def update_backup_server(server_id: int, updates: Dict[str, Any]) -> bool:
 
 async def delete_backup_server(server_id: int) -> bool:
     """Удаление резервного сервера"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _connect('delete_backup_server') as db:
         cursor = await db.execute('DELETE FROM backup_servers WHERE id = ?', (server_id,))
         await db.commit()
-        return cursor.rowcount > 0
\ No newline at end of file
+        return cursor.rowcount > 0
+
+async def enqueue_backup_job(connection_id: int, upload: bool = False, affinity: str = None) -> int:
+    """Постановка бэкапа в очередь воркеров (affinity - метка воркеров, которым можно его выполнять)"""
+    async with _connect('enqueue_backup_job') as db:
+        cursor = await db.execute(
+            'INSERT INTO backup_queue (connection_id, upload, affinity) VALUES (?, ?, ?)',
+            (connection_id, upload, affinity)
+        )
+        await db.commit()
+        return cursor.lastrowid
+
+async def enable_backup_job_upload(job_id: int) -> bool:
+    """Загрузка на резервные серверы для задачи, которая еще ждет в очереди. False - воркер уже взял задачу"""
+    async with _connect('enable_backup_job_upload') as db:
+        cursor = await db.execute(
+            "UPDATE backup_queue SET upload = 1 WHERE id = ? AND status = 'queued'",
+            (job_id,)
+        )
+        await db.commit()
+        return cursor.rowcount > 0
+
+async def claim_backup_job(worker: str, labels: List[str] = None) -> Optional[Dict[str, Any]]:
+    """Захват воркером следующей задачи из очереди.
+
+    Воркер берет задачи без метки и задачи с одной из своих меток,
+    причем свои - в первую очередь.
+    """
+    labels = list(labels or [])
+    placeholders = ", ".join("?" for _ in labels)
+    affinity = f"affinity IS NULL OR affinity IN ({placeholders})" if labels else "affinity IS NULL"
+    async with _connect('claim_backup_job') as db:
+        db.row_factory = aiosqlite.Row
+        # Блокировка записи сразу: одну задачу не захватят два воркера
+        await db.execute('BEGIN IMMEDIATE')
+        cursor = await db.execute(f'''
+            SELECT * FROM backup_queue
+            WHERE status = 'queued' AND ({affinity})
+            ORDER BY affinity IS NULL, id
+            LIMIT 1
+        ''', labels)
+        row = await cursor.fetchone()
+        if not row:
+            await db.rollback()
+            return None
+        await db.execute('''
+            UPDATE backup_queue
+            SET status = 'running', worker = ?, attempts = attempts + 1,
+                started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (worker, row['id']))
+        await db.commit()
+        job = dict(row)
+        job.update(status='running', worker=worker, attempts=job['attempts'] + 1)
+        return job
+
+async def report_backup_progress(job_id: int, worker: str, bytes_done: int, total_bytes: int = None) -> bool:
+    """Прогресс и heartbeat задачи от воркера.
+
+    Возвращает True, если выполнение нужно прекратить: запрошена отмена
+    или задача уже передана другому воркеру.
+    """
+    async with _connect('report_backup_progress') as db:
+        cursor = await db.execute('''
+            UPDATE backup_queue SET bytes_done = ?, total_bytes = ?, heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND worker = ? AND status = 'running'
+        ''', (bytes_done, total_bytes, job_id, worker))
+        await db.commit()
+        if cursor.rowcount == 0:
+            return True
+        cursor = await db.execute('SELECT cancel_requested FROM backup_queue WHERE id = ?', (job_id,))
+        row = await cursor.fetchone()
+        return bool(row and row[0])
+
+async def finish_backup_job(
+    job_id: int,
+    worker: str,
+    status: str,
+    result: str,
+    bytes_done: int = 0,
+    uploaded: bool = None,
+    dump_seconds: float = None,
+    upload_seconds: float = None,
+    uploads: List[Dict[str, Any]] = None
+) -> bool:
+    """Сохранение итога задачи (uploads - итоги загрузки по резервным серверам). False - задача уже не принадлежит воркеру"""
+    async with _connect('finish_backup_job') as db:
+        cursor = await db.execute('''
+            UPDATE backup_queue
+            SET status = ?, result = ?, bytes_done = ?, uploaded = ?, uploads = ?, dump_seconds = ?, upload_seconds = ?,
+                finished_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND worker = ? AND status = 'running'
+        ''', (
+            status, result, bytes_done, uploaded, json.dumps(uploads) if uploads is not None else None,
+            dump_seconds, upload_seconds, job_id, worker
+        ))
+        await db.commit()
+        return cursor.rowcount > 0
+
+async def get_backup_jobs(job_ids: List[int]) -> List[Dict[str, Any]]:
+    """Состояние задач очереди по ID"""
+    if not job_ids:
+        return []
+    placeholders = ", ".join("?" for _ in job_ids)
+    async with _connect('get_backup_jobs') as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(f'SELECT * FROM backup_queue WHERE id IN ({placeholders})', list(job_ids))
+        rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
+
+async def cancel_backup_job(job_id: int) -> bool:
+    """Отмена задачи: из очереди снимается сразу, выполняющую воркер прерывает при следующем отчете"""
+    async with _connect('cancel_backup_job') as db:
+        cursor = await db.execute('''
+            UPDATE backup_queue
+            SET status = 'cancelled', result = 'Бэкап отменен пользователем', finished_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = 'queued'
+        ''', (job_id,))
+        if cursor.rowcount == 0:
+            cursor = await db.execute(
+                "UPDATE backup_queue SET cancel_requested = 1 WHERE id = ? AND status = 'running'",
+                (job_id,)
+            )
+        await db.commit()
+        return cursor.rowcount > 0
+
+async def requeue_backup_jobs(workers: List[str] = None, stale_seconds: int = None, max_attempts: int = 3) -> int:
+    """Возврат в очередь задач остановленных воркеров или воркеров без heartbeat дольше stale_seconds.
+
+    После max_attempts попыток задача считается ошибочной.
+    """
+    conditions, params = [], []
+    if workers:
+        conditions.append(f"worker IN ({', '.join('?' for _ in workers)})")
+        params += list(workers)
+    if stale_seconds is not None:
+        conditions.append("heartbeat_at < datetime('now', ?)")
+        params.append(f'-{stale_seconds} seconds')
+    if not conditions:
+        return 0
+    running = f"status = 'running' AND ({' OR '.join(conditions)})"
+    async with _connect('requeue_backup_jobs') as db:
+        await db.execute(f'''
+            UPDATE backup_queue
+            SET status = 'cancelled', result = 'Бэкап отменен пользователем', finished_at = CURRENT_TIMESTAMP
+            WHERE {running} AND cancel_requested = 1
+        ''', params)
+        await db.execute(f'''
+            UPDATE backup_queue
+            SET status = 'failed', result = 'Воркер бэкапов остановился во время выполнения', finished_at = CURRENT_TIMESTAMP
+            WHERE {running} AND attempts >= ?
+        ''', [*params, max_attempts])
+        cursor = await db.execute(f'''
+            UPDATE backup_queue
+            SET status = 'queued', worker = NULL, bytes_done = 0, started_at = NULL, heartbeat_at = NULL
+            WHERE {running}
+        ''', params)
+        await db.commit()
+        return cursor.rowcount
+
+async def expire_backup_jobs(timeout_seconds: int) -> int:
+    """Ошибка для задач, которые ни один воркер не взял за timeout_seconds (нет воркера с нужной меткой или воркеры не запущены)"""
+    async with _connect('expire_backup_jobs') as db:
+        cursor = await db.execute('''
+            UPDATE backup_queue
+            SET status = 'failed', result = ?, finished_at = CURRENT_TIMESTAMP
+            WHERE status = 'queued' AND created_at < datetime('now', ?)
+        ''', (
+            f"Ни один воркер не взял задачу за {timeout_seconds // 60} мин: проверьте BACKUP_WORKERS и метки воркеров",
+            f'-{timeout_seconds} seconds'
+        ))
+        await db.commit()
+        return cursor.rowcount
+
+async def delete_old_backup_jobs(days: int = 7) -> int:
+    """Удаление завершенных задач очереди старше указанного числа дней"""
+    async with _connect('delete_old_backup_jobs') as db:
+        cursor = await db.execute(
+            "DELETE FROM backup_queue WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < datetime('now', ?)",
+            (f'-{days} days',)
+        )
+        await db.commit()
+        return cursor.rowcount
\ No newline at end of file
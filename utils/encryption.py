@@ -0,0 +1,186 @@
+"""Потоковое шифрование артефактов бэкапов (AES-256-GCM по записям).
+
+Формат файла .enc:
+    заголовок: MAGIC | id ключа (4 байта) | префикс nonce (7 байт)
+    записи:    длина шифртекста (4 байта) | шифртекст записи с тегом GCM
+
+Nonce записи - префикс, номер записи (4 байта) и флаг последней записи,
+заголовок подписывается как AAD каждой записи. Поэтому перестановка,
+подмена и обрезка записей обнаруживаются при расшифровке.
+
+Расшифровка без бота (например, на резервном сервере):
+    python -m utils.encryption decrypt backup.sql.gz.enc backup.sql.gz
+"""
+import os
+import sys
+import base64
+import struct
+import asyncio
+import hashlib
+import argparse
+from typing import AsyncIterator, Optional
+
+from utils.lazy import lazy_import
+
+aead = lazy_import('cryptography.hazmat.primitives.ciphers.aead')
+crypto_exceptions = lazy_import('cryptography.exceptions')
+
+MAGIC = b'BBENC\x01'
+HEADER_SIZE = len(MAGIC) + 4 + 7
+TAG_SIZE = 16
+
+# Открытый текст одной записи
+RECORD_SIZE = 1024 * 1024
+
+ENCRYPTED_EXTENSION = '.enc'
+
+def get_key() -> Optional[bytes]:
+    """Ключ шифрования бэкапов из BACKUP_ENCRYPTION_KEY (32 байта в base64) или None"""
+    value = os.getenv('BACKUP_ENCRYPTION_KEY', '')
+    if not value:
+        return None
+    key = base64.b64decode(value)
+    if len(key) != 32:
+        raise ValueError("BACKUP_ENCRYPTION_KEY должен содержать 32 байта в base64")
+    return key
+
+def key_id(key: bytes) -> bytes:
+    """Идентификатор ключа в заголовке: неверный ключ виден сразу, а не как ошибка записи"""
+    return hashlib.sha256(b'backupbot key id' + key).digest()[:4]
+
+def is_encrypted(file_name: str) -> bool:
+    return file_name.endswith(ENCRYPTED_EXTENSION)
+
+def _nonce(prefix: bytes, counter: int, last: bool) -> bytes:
+    return prefix + struct.pack('>IB', counter, 1 if last else 0)
+
+class EncryptingSink:
+    """Шифрование потока перед записью в артефакт (в том же проходе, что сжатие и хеш)"""
+
+    def __init__(self, sink, key: bytes):
+        self.sink = sink
+        self.cipher = aead.AESGCM(key)
+        self.prefix = os.urandom(7)
+        self.header = MAGIC + key_id(key) + self.prefix
+        self.buffer = bytearray()
+        self.counter = 0
+        self.started = False
+
+    async def _seal(self, data: bytes, last: bool) -> int:
+        nonce = _nonce(self.prefix, self.counter, last)
+        self.counter += 1
+        # AES-GCM в OpenSSL отпускает GIL
+        sealed = await asyncio.to_thread(self.cipher.encrypt, nonce, data, self.header)
+        written = 0
+        if not self.started:
+            self.started = True
+            written += await self.sink.write(self.header)
+        return written + await self.sink.write(struct.pack('>I', len(sealed)) + sealed)
+
+    async def write(self, data: bytes) -> int:
+        """Запись части потока; возвращает число байт, записанных на диск"""
+        self.buffer += data
+        written = 0
+        # Последняя запись остается в буфере до close: ее nonce помечен флагом
+        while len(self.buffer) > RECORD_SIZE:
+            record = bytes(self.buffer[:RECORD_SIZE])
+            del self.buffer[:RECORD_SIZE]
+            written += await self._seal(record, last=False)
+        return written
+
+    async def close(self) -> int:
+        written = await self._seal(bytes(self.buffer), last=True)
+        self.buffer.clear()
+        return written + await self.sink.close()
+
+    async def abort(self):
+        await self.sink.abort()
+
+    @property
+    def checksum(self) -> str:
+        return self.sink.checksum
+
+async def decrypt_stream(chunks: AsyncIterator[bytes], key: bytes = None) -> AsyncIterator[bytes]:
+    """Потоковая расшифровка артефакта .enc"""
+    key = key or get_key()
+    if not key:
+        raise RuntimeError("Артефакт зашифрован, а BACKUP_ENCRYPTION_KEY не задан")
+    cipher = aead.AESGCM(key)
+
+    buffer = bytearray()
+    header = None
+    counter = 0
+    # Запись отдается, только когда видно, последняя она или нет
+    pending = None
+
+    async def open_record(record: bytes, last: bool) -> bytes:
+        try:
+            return await asyncio.to_thread(cipher.decrypt, _nonce(header[-7:], counter, last), record, header)
+        except crypto_exceptions.InvalidTag:
+            raise RuntimeError(f"Артефакт поврежден или изменен (запись {counter})")
+
+    async for chunk in chunks:
+        buffer += chunk
+        if header is None:
+            if len(buffer) < HEADER_SIZE:
+                continue
+            header = bytes(buffer[:HEADER_SIZE])
+            del buffer[:HEADER_SIZE]
+            if not header.startswith(MAGIC):
+                raise RuntimeError("Неизвестный формат зашифрованного артефакта")
+            if header[len(MAGIC):len(MAGIC) + 4] != key_id(key):
+                raise RuntimeError("Артефакт зашифрован другим ключом")
+
+        while len(buffer) >= 4:
+            length = struct.unpack('>I', buffer[:4])[0]
+            if length > RECORD_SIZE + TAG_SIZE:
+                raise RuntimeError("Артефакт поврежден: неверная длина записи")
+            if len(buffer) < 4 + length:
+                break
+            record = bytes(buffer[4:4 + length])
+            del buffer[:4 + length]
+            if pending is not None:
+                yield await open_record(pending, last=False)
+                counter += 1
+            pending = record
+
+    if header is None or pending is None or buffer:
+        raise RuntimeError("Зашифрованный артефакт обрезан")
+    yield await open_record(pending, last=True)
+
+async def decrypt_file(source_path: str, target_path: str, key: bytes = None):
+    """Расшифровка файла .enc в файл"""
+    from utils.restore import read_local_file
+
+    try:
+        with open(target_path, 'wb') as target:
+            async for data in decrypt_stream(read_local_file(source_path), key):
+                await asyncio.to_thread(target.write, data)
+    except BaseException:
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        raise
+
+def main(argv=None):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Ключи и расшифровка артефактов бэкапов")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('keygen', help="новый ключ для BACKUP_ENCRYPTION_KEY")
+    decrypt = commands.add_parser('decrypt', help="расшифровка артефакта (ключ из BACKUP_ENCRYPTION_KEY)")
+    decrypt.add_argument('source')
+    decrypt.add_argument('target')
+    args = parser.parse_args(argv)
+
+    if args.command == 'keygen':
+        print(base64.b64encode(os.urandom(32)).decode())
+        return
+    try:
+        asyncio.run(decrypt_file(args.source, args.target))
+    except (RuntimeError, ValueError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from utils.db import log_ssh_command
+from utils.ssh_pool import ssh_manager
+from utils.lazy import lazy_import
+
+asyncssh = lazy_import('asyncssh')
+
+logger = logging.getLogger(__name__)
+
+# Обновление пакетов: (команда, описание)
+UPDATE_SCRIPT = [
+    ("sudo apt update", "📥 Обновление списка пакетов"),
+    ("sudo apt upgrade -y", "🔄 Обновление пакетов"),
+    ("sudo apt autoremove -y", "🧹 Очистка ненужных пакетов"),
+]
+
+# Сколько последних символов вывода шага сохраняется в отчете
+STEP_OUTPUT_CHARS = 20000
+
+def get_settings() -> dict:
+    """Параллельность и таймаут группового выполнения"""
+    return {
+        'concurrency': max(1, int(os.getenv('FLEET_CONCURRENCY', '10'))),
+        'host_timeout': int(os.getenv('FLEET_HOST_TIMEOUT', '900')),
+    }
+
+class StepResult:
+    """Результат одной команды на сервере"""
+
+    def __init__(self, command: str, success: bool, exit_status: Optional[int], output: str):
+        self.command = command
+        self.success = success
+        self.exit_status = exit_status
+        self.output = output
+
+class HostResult:
+    """Результат сценария на одном сервере"""
+
+    def __init__(self, server: dict):
+        self.server = server
+        self.steps: List[StepResult] = []
+        self.success = False
+        self.error: Optional[str] = None
+        self.timed_out = False
+        self.duration = 0.0
+
+    @property
+    def failed_step(self) -> Optional[StepResult]:
+        for step in self.steps:
+            if not step.success:
+                return step
+        return None
+
+def _tail(text: str, limit: int = STEP_OUTPUT_CHARS) -> str:
+    return text if len(text) <= limit else "…" + text[-limit:]
+
+async def run_on_server(server: dict, script: List[Tuple[str, str]], result: HostResult):
+    """Последовательное выполнение команд на сервере до первой ошибки"""
+    for command, _ in script:
+        try:
+            completed = await ssh_manager.run(
+                server['host'], server['port'], server['username'], server['password'], command
+            )
+        except (asyncssh.Error, OSError) as e:
+            result.error = f"Ошибка подключения: {e}"
+            return
+
+        output = (completed.stdout or "") + (completed.stderr or "")
+        step = StepResult(command, completed.exit_status == 0, completed.exit_status, _tail(output.strip()))
+        result.steps.append(step)
+
+        try:
+            await log_ssh_command(server['id'], command, output)
+        except Exception as e:
+            logger.error(f"Ошибка логирования команды на {server['name']}: {e}")
+
+        if not step.success:
+            return
+    result.success = True
+
+async def run_fleet(
+    servers: List[dict],
+    script: List[Tuple[str, str]],
+    concurrency: int = None,
+    host_timeout: int = None,
+    on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+) -> List[HostResult]:
+    """Выполнение сценария на группе серверов: не больше concurrency одновременно, с таймаутом на сервер"""
+    settings = get_settings()
+    semaphore = asyncio.Semaphore(concurrency or settings['concurrency'])
+    host_timeout = host_timeout or settings['host_timeout']
+    results = [HostResult(server) for server in servers]
+    done = 0
+
+    async def run_host(result: HostResult):
+        nonlocal done
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(run_on_server(result.server, script, result), timeout=host_timeout)
+            except asyncio.TimeoutError:
+                result.timed_out = True
+                result.error = f"Таймаут ({host_timeout} с)"
+            except Exception as e:
+                logger.error(f"Ошибка выполнения на {result.server['name']}: {e}")
+                result.error = str(e)
+            result.duration = time.monotonic() - started
+
+        done += 1
+        if on_progress:
+            try:
+                await on_progress(done, len(results))
+            except Exception as e:
+                logger.debug(f"Ошибка обновления прогресса: {e}")
+
+    await asyncio.gather(*(run_host(result) for result in results))
+    return results
+
+def format_report(title: str, results: List[HostResult], limit: int = 3800) -> str:
+    """Краткий отчет: итоги, успешные серверы одной строкой и причина для каждого неудачного"""
+    succeeded = [r for r in results if r.success]
+    timed_out = [r for r in results if r.timed_out]
+    failed = [r for r in results if not r.success and not r.timed_out]
+
+    text = f"{title}\n\n"
+    text += f"✅ Успешно: {len(succeeded)}  ❌ Ошибки: {len(failed)}  ⏱ Таймаут: {len(timed_out)}\n"
+    if results:
+        text += f"⏱ Самый долгий: {max(r.duration for r in results):.1f} с\n"
+
+    if succeeded:
+        text += "\n✅ " + ", ".join(r.server['name'] for r in succeeded) + "\n"
+
+    lines = []
+    for result in failed + timed_out:
+        step = result.failed_step
+        if result.error:
+            reason = result.error
+        elif step:
+            last_line = step.output.splitlines()[-1] if step.output else f"код {step.exit_status}"
+            reason = f"{step.command}: {last_line[:120]}"
+        else:
+            reason = "неизвестная ошибка"
+        lines.append(f"{'⏱' if result.timed_out else '❌'} {result.server['name']} - {reason}")
+
+    if lines:
+        text += "\n" + "\n".join(lines)
+
+    if len(text) > limit:
+        text = text[:limit] + "\n…(полный отчет в файле)"
+    return text
+
+def format_full_report(results: List[HostResult]) -> str:
+    """Полный отчет с выводом всех шагов для отправки файлом"""
+    parts = []
+    for result in results:
+        status = "OK" if result.success else ("TIMEOUT" if result.timed_out else "FAILED")
+        parts.append(f"===== {result.server['name']} ({result.server['host']}) - {status}, {result.duration:.1f} s =====")
+        if result.error:
+            parts.append(result.error)
+        for step in result.steps:
+            parts.append(f"$ {step.command}  [exit {step.exit_status}]")
+            if step.output:
+                parts.append(step.output)
+        parts.append("")
+    return "\n".join(parts)
@@ -0,0 +1,277 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import suppress
+from datetime import datetime, timezone
+from typing import Dict, Tuple, Optional
+
+from utils.db import (
+    get_enabled_connections, get_ssh_servers, log_health_check,
+    get_latest_health, delete_old_health_checks
+)
+from utils.connection_test import test_connection
+
+logger = logging.getLogger(__name__)
+
+# Шаг цикла: как часто проверяется, у каких целей подошло время проверки
+TICK_SECONDS = 5
+
+# Как часто чистится история проверок
+PRUNE_INTERVAL = 24 * 60 * 60
+
+def get_settings() -> Dict[str, int]:
+    """Настройки мониторинга из переменных окружения"""
+    return {
+        'interval_min': int(os.getenv('HEALTH_INTERVAL_MIN', '60')),
+        'interval_max': int(os.getenv('HEALTH_INTERVAL_MAX', '900')),
+        'concurrency': max(1, int(os.getenv('HEALTH_CONCURRENCY', '20'))),
+        'ssh_timeout': int(os.getenv('HEALTH_SSH_TIMEOUT', '5')),
+        'retention_days': int(os.getenv('HEALTH_RETENTION_DAYS', '7')),
+    }
+
+class HealthState:
+    """Последнее известное состояние подключения или SSH сервера"""
+
+    def __init__(self, target_type: str, target_id: int, name: str = None):
+        self.target_type = target_type
+        self.target_id = target_id
+        self.name = name
+        self.success: Optional[bool] = None
+        self.latency_ms: Optional[float] = None
+        self.version: Optional[str] = None
+        self.size: Optional[str] = None
+        self.message: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self.interval = 0
+        self.next_check = 0.0
+
+    @property
+    def age(self) -> Optional[float]:
+        """Сколько секунд назад была последняя проверка"""
+        if self.checked_at is None:
+            return None
+        return max(0.0, time.time() - self.checked_at)
+
+def parse_test_message(message: str) -> Tuple[Optional[str], Optional[str]]:
+    """Версия и размер из сообщения test_connection"""
+    version = size = None
+    for line in (message or '').splitlines():
+        key, _, value = line.partition(': ')
+        if 'версия' in key:
+            version = value.strip()
+        elif key.startswith('Размер'):
+            size = value.strip()
+    return version, size
+
+async def probe_ssh(host: str, port: int, timeout: int) -> Tuple[bool, Optional[float], Optional[str], str]:
+    """Проверка SSH сервера по баннеру без авторизации: (успех, задержка, версия, сообщение)"""
+    started = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+    except asyncio.TimeoutError:
+        return False, None, None, f"Таймаут подключения ({timeout} с)"
+    except OSError as e:
+        return False, None, None, f"Ошибка подключения: {e.strerror or e}"
+
+    try:
+        banner = await asyncio.wait_for(reader.readline(), timeout=timeout)
+    except asyncio.TimeoutError:
+        return False, None, None, "Сервер не прислал SSH баннер"
+    finally:
+        writer.close()
+        with suppress(Exception):
+            await writer.wait_closed()
+
+    latency_ms = (time.perf_counter() - started) * 1000
+    banner = banner.decode(errors='ignore').strip()
+    if not banner.startswith('SSH-'):
+        return False, latency_ms, None, "Порт отвечает, но это не SSH"
+    return True, latency_ms, banner, "OK"
+
+def format_health(state: Optional[HealthState]) -> str:
+    """Краткое описание состояния для меню"""
+    if not state or state.success is None:
+        return "⚪ нет данных"
+
+    icon = "🟢" if state.success else "🔴"
+    text = f"{icon} {state.latency_ms:.0f} мс" if state.success and state.latency_ms is not None else icon
+    if not state.success and state.message:
+        text += f" {state.message.splitlines()[0][:60]}"
+
+    age = state.age
+    if age is not None:
+        if age < 60:
+            text += ", только что"
+        elif age < 3600:
+            text += f", {age / 60:.0f} мин назад"
+        else:
+            text += f", {age / 3600:.0f} ч назад"
+    return text
+
+class HealthMonitor:
+    """Фоновая проверка подключений и SSH серверов с адаптивным интервалом"""
+
+    def __init__(self):
+        self.states: Dict[Tuple[str, int], HealthState] = {}
+        self.bot = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_prune = 0.0
+
+    def get(self, target_type: str, target_id: int) -> Optional[HealthState]:
+        """Последнее состояние цели из кэша (без проверки)"""
+        return self.states.get((target_type, target_id))
+
+    def start(self, bot):
+        """Запуск фонового цикла"""
+        self.bot = bot
+        if not self._task:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Остановка фонового цикла"""
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def load(self):
+        """Загрузка последних результатов из БД, чтобы меню не было пустым после перезапуска"""
+        for row in await get_latest_health():
+            state = HealthState(row['target_type'], row['target_id'])
+            state.success = bool(row['success'])
+            state.latency_ms = row['latency_ms']
+            state.version = row['version']
+            state.size = row['size']
+            state.message = row['message']
+            # CURRENT_TIMESTAMP в SQLite - время UTC
+            state.checked_at = datetime.strptime(
+                row['checked_at'], '%Y-%m-%d %H:%M:%S'
+            ).replace(tzinfo=timezone.utc).timestamp()
+            self.states[(state.target_type, state.target_id)] = state
+
+    async def _loop(self):
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"Ошибка загрузки результатов проверок: {e}")
+
+        while True:
+            try:
+                await self.run_due()
+                await self._prune()
+            except Exception as e:
+                logger.error(f"Ошибка мониторинга состояния: {e}")
+            await asyncio.sleep(TICK_SECONDS)
+
+    async def _load_targets(self) -> Dict[Tuple[str, int], dict]:
+        targets = {}
+        for conn in await get_enabled_connections():
+            targets[('connection', conn['id'])] = conn
+        for server in await get_ssh_servers():
+            targets[('ssh', server['id'])] = server
+        return targets
+
+    async def run_due(self, force: bool = False):
+        """Проверка целей, у которых подошло время (или всех при force)"""
+        settings = get_settings()
+        targets = await self._load_targets()
+
+        # Удаленные и выключенные цели больше не отслеживаем
+        for key in list(self.states):
+            if key not in targets:
+                del self.states[key]
+
+        now = time.monotonic()
+        due = []
+        for key, target in targets.items():
+            state = self.states.get(key)
+            if state is None:
+                state = self.states[key] = HealthState(*key)
+            state.name = target['name']
+            if force or now >= state.next_check:
+                due.append((state, target))
+
+        if not due:
+            return
+
+        semaphore = asyncio.Semaphore(settings['concurrency'])
+
+        async def check(state: HealthState, target: dict):
+            async with semaphore:
+                await self._check(state, target, settings)
+
+        await asyncio.gather(*(check(state, target) for state, target in due))
+
+    async def _check(self, state: HealthState, target: dict, settings: Dict[str, int]):
+        if state.target_type == 'connection':
+            started = time.perf_counter()
+            success, message = await test_connection(target)
+            latency_ms = (time.perf_counter() - started) * 1000
+            version, size = parse_test_message(message) if success else (None, None)
+        else:
+            success, latency_ms, version, message = await probe_ssh(
+                target['host'], target['port'], settings['ssh_timeout']
+            )
+            size = None
+
+        previous = state.success
+        state.success = success
+        state.latency_ms = latency_ms if success else None
+        state.version = version
+        state.size = size
+        state.message = message
+        state.checked_at = time.time()
+
+        # Стабильные цели проверяем все реже, изменения и ошибки - сразу на минимальный интервал
+        if success and previous is True:
+            state.interval = min(settings['interval_max'], max(state.interval, settings['interval_min']) * 2)
+        else:
+            state.interval = settings['interval_min']
+        state.next_check = time.monotonic() + state.interval
+
+        try:
+            await log_health_check(
+                state.target_type, state.target_id, success,
+                state.latency_ms, version, size, None if success else message
+            )
+        except Exception as e:
+            logger.error(f"Ошибка сохранения проверки {state.name}: {e}")
+
+        if previous is not None and previous != success:
+            await self._notify(state)
+
+    async def _notify(self, state: HealthState):
+        """Уведомление администратора об изменении состояния"""
+        if not self.bot:
+            return
+
+        if state.target_type == 'connection':
+            kind, suffix = "Подключение", "но"
+        else:
+            kind, suffix = "SSH сервер", "ен"
+        if state.success:
+            text = f"🟢 {kind} {state.name} снова доступ{suffix}"
+            if state.latency_ms is not None:
+                text += f" ({state.latency_ms:.0f} мс)"
+        else:
+            text = f"🔴 {kind} {state.name} недоступ{suffix}:\n{state.message}"
+
+        logger.info(f"Изменение состояния {state.target_type} {state.name}: {state.success}")
+        try:
+            await self.bot.send_message(int(os.getenv('ADMIN_ID')), text)
+        except Exception as e:
+            logger.error(f"Ошибка отправки уведомления о состоянии: {e}")
+
+    async def _prune(self):
+        now = time.monotonic()
+        if now - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = now
+        deleted = await delete_old_health_checks(get_settings()['retention_days'])
+        if deleted:
+            logger.info(f"Удалено старых проверок состояния: {deleted}")
+
+# Глобальный монитор состояния
+health_monitor = HealthMonitor()
@@ -0,0 +1,193 @@
+import os
+import hmac
+import logging
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from utils.db import (
+    claim_backup_job, report_backup_progress, finish_backup_job, requeue_backup_jobs,
+    get_connection, get_enabled_backup_servers, log_backup
+)
+
+logger = logging.getLogger(__name__)
+
+# Таймаут запросов удаленного воркера к боту
+REQUEST_TIMEOUT = 30
+
+def get_settings() -> Dict[str, Any]:
+    """Адрес API очереди для воркеров на других узлах"""
+    return {
+        'enabled': os.getenv('WORKER_API_ENABLED', 'false').lower() == 'true',
+        'host': os.getenv('WORKER_API_HOST', '127.0.0.1'),
+        'port': int(os.getenv('WORKER_API_PORT', '9109')),
+        'token': os.getenv('WORKER_API_TOKEN', ''),
+    }
+
+class LocalQueue:
+    """Очередь бэкапов в служебной БД бота: для воркеров на том же узле"""
+
+    async def claim(self, worker: str, labels: List[str]) -> Optional[Dict[str, Any]]:
+        """Следующая задача вместе с подключением и резервными серверами для загрузки"""
+        job = await claim_backup_job(worker, labels)
+        if not job:
+            return None
+        job['connection'] = await get_connection(job['connection_id'])
+        job['backup_servers'] = await get_enabled_backup_servers() if job['upload'] else []
+        return job
+
+    async def progress(self, job_id: int, worker: str, bytes_done: int, total_bytes: int = None) -> bool:
+        return await report_backup_progress(job_id, worker, bytes_done, total_bytes)
+
+    async def finish(
+        self,
+        job_id: int,
+        worker: str,
+        connection_id: int,
+        status: str,
+        result: str,
+        bytes_done: int = 0,
+        uploaded: bool = None,
+        uploads: List[Dict[str, Any]] = None,
+        dump_seconds: float = None,
+        upload_seconds: float = None,
+        checksum: str = None
+    ) -> bool:
+        """Итог задачи в очередь и в backup_logs"""
+        accepted = await finish_backup_job(
+            job_id, worker, status, result, bytes_done, uploaded, dump_seconds, upload_seconds, uploads
+        )
+        if accepted:
+            success = status == 'done'
+            await log_backup(connection_id, success, None if success else result, worker, checksum)
+        return accepted
+
+    async def requeue(self, worker: str) -> int:
+        return await requeue_backup_jobs([worker])
+
+    async def close(self):
+        pass
+
+class RemoteQueue:
+    """Очередь бэкапов через HTTP API бота: для воркеров на других узлах"""
+
+    def __init__(self, url: str, token: str):
+        self.url = url.rstrip('/')
+        self.token = token
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def _call(self, method: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                headers={'Authorization': f"Bearer {self.token}"},
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+            )
+        async with self._session.post(f"{self.url}/queue/{method}", json=payload) as response:
+            if response.status != 200:
+                raise RuntimeError(f"API очереди вернул {response.status}: {(await response.text())[:200]}")
+            return await response.json()
+
+    async def claim(self, worker: str, labels: List[str]) -> Optional[Dict[str, Any]]:
+        return (await self._call('claim', {'worker': worker, 'labels': labels}))['job']
+
+    async def progress(self, job_id: int, worker: str, bytes_done: int, total_bytes: int = None) -> bool:
+        response = await self._call('progress', {
+            'job_id': job_id, 'worker': worker, 'bytes_done': bytes_done, 'total_bytes': total_bytes
+        })
+        return response['stop']
+
+    async def finish(self, job_id: int, worker: str, connection_id: int, status: str, result: str, **details) -> bool:
+        response = await self._call('finish', {
+            'job_id': job_id, 'worker': worker, 'connection_id': connection_id,
+            'status': status, 'result': result, **details
+        })
+        return response['accepted']
+
+    async def requeue(self, worker: str) -> int:
+        return (await self._call('requeue', {'worker': worker}))['requeued']
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+class QueueServer:
+    """HTTP API очереди в процессе бота для воркеров на других узлах.
+
+    Ответ на claim содержит пароли подключения и резервных серверов:
+    API слушает только с заданным WORKER_API_TOKEN и должен быть доступен
+    лишь из частной сети или через TLS прокси.
+    """
+
+    def __init__(self):
+        self.queue = LocalQueue()
+        self._runner: Optional[web.AppRunner] = None
+        self._token = ''
+
+    @web.middleware
+    async def _authorize(self, request: web.Request, handler):
+        expected = f"Bearer {self._token}"
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+            return web.json_response({'error': 'unauthorized'}, status=401)
+        return await handler(request)
+
+    async def _claim(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        job = await self.queue.claim(data['worker'], data.get('labels') or [])
+        if job:
+            logger.info(f"Задача бэкапа #{job['id']} выдана воркеру {data['worker']}")
+        return web.json_response({'job': job})
+
+    async def _progress(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        stop = await self.queue.progress(data['job_id'], data['worker'], data['bytes_done'], data.get('total_bytes'))
+        return web.json_response({'stop': stop})
+
+    async def _finish(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        accepted = await self.queue.finish(
+            data['job_id'], data['worker'], data['connection_id'], data['status'], data['result'],
+            data.get('bytes_done', 0), data.get('uploaded'), data.get('uploads'),
+            data.get('dump_seconds'), data.get('upload_seconds'), data.get('checksum')
+        )
+        return web.json_response({'accepted': accepted})
+
+    async def _requeue(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        return web.json_response({'requeued': await self.queue.requeue(data['worker'])})
+
+    async def start(self) -> bool:
+        """Запуск API; без WORKER_API_TOKEN не запускается"""
+        settings = get_settings()
+        if not settings['token']:
+            logger.error("WORKER_API_TOKEN не задан: API очереди для удаленных воркеров не запущен")
+            return False
+        self._token = settings['token']
+
+        app = web.Application(middlewares=[self._authorize])
+        app.router.add_post('/queue/claim', self._claim)
+        app.router.add_post('/queue/progress', self._progress)
+        app.router.add_post('/queue/finish', self._finish)
+        app.router.add_post('/queue/requeue', self._requeue)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            site = web.TCPSite(runner, settings['host'], settings['port'])
+            await site.start()
+        except OSError as e:
+            logger.error(f"Не удалось запустить API очереди на {settings['host']}:{settings['port']}: {e}")
+            await runner.cleanup()
+            return False
+        self._runner = runner
+        logger.info(f"API очереди для удаленных воркеров: http://{settings['host']}:{settings['port']}/queue")
+        return True
+
+    async def stop(self):
+        """Остановка API (при остановке бота)"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+# Глобальный API очереди
+queue_server = QueueServer()
@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.db import (
+    enqueue_backup_job, enable_backup_job_upload, get_backup_jobs, cancel_backup_job, requeue_backup_jobs, expire_backup_jobs, delete_old_backup_jobs
+)
+from utils.metrics import record_dump, record_upload
+from utils.backup_transfer import backup_transfer
+
+logger = logging.getLogger(__name__)
+
+# Сколько завершенных задач хранить для просмотра статуса
+FINISHED_JOBS_LIMIT = 100
+
+# Как часто бот читает из очереди прогресс активных задач
+POLL_INTERVAL = 1.0
+
+FINISHED_STATUSES = ('done', 'failed', 'cancelled')
+
+# Скрипт процесса-воркера (рядом с main.py)
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'worker.py')
+
+# Задача, воркер которой не сообщал прогресс дольше этого времени (с), возвращается в очередь
+LEASE_TIMEOUT = 60
+
+# Пауза перед перезапуском упавшего воркера и ожидание его остановки
+RESTART_DELAY = 5
+STOP_TIMEOUT = 30
+
+def get_settings() -> Dict[str, Any]:
+    """Число процессов-воркеров, которые запускает бот, и срок ожидания задачи в очереди"""
+    return {
+        'workers': max(0, int(os.getenv('BACKUP_WORKERS', '1'))),
+        # Задача, которую за это время (с) не взял ни один воркер, завершается с ошибкой
+        'queue_timeout': int(os.getenv('BACKUP_QUEUE_TIMEOUT', '21600')),
+    }
+
+class BackupJob:
+    """Бэкап одного подключения в очереди воркеров; состояние обновляется из служебной БД"""
+
+    def __init__(self, job_id: int, connection: dict, upload: bool = False):
+        self.id = job_id
+        self.connection = connection
+        self.upload = upload
+        self.status = 'queued'
+        self.result = None
+        self.uploaded = None
+        # Итоги загрузки по резервным серверам: server, uploaded, attempts, seconds, error
+        self.uploads: List[Dict[str, Any]] = []
+        self.worker = None
+        self.bytes_done = 0
+        # Оценка размера - по предыдущему бэкапу этого подключения (ее сообщает воркер)
+        self.total_bytes = None
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    def update(self, row: Dict[str, Any]):
+        """Состояние из строки очереди"""
+        self.status = row['status']
+        self.result = row['result']
+        self.uploaded = None if row['uploaded'] is None else bool(row['uploaded'])
+        self.uploads = json.loads(row['uploads']) if row['uploads'] else []
+        self.worker = row['worker']
+        self.bytes_done = row['bytes_done'] or 0
+        self.total_bytes = row['total_bytes']
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at or time.monotonic()
+        return end - self.started_at
+
+    @property
+    def speed(self) -> float:
+        """Скорость в байтах в секунду"""
+        return self.bytes_done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def percent(self) -> Optional[float]:
+        if not self.total_bytes:
+            return None
+        return min(100.0, self.bytes_done * 100 / self.total_bytes)
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Оставшееся время в секундах"""
+        if not self.total_bytes or not self.speed or self.bytes_done >= self.total_bytes:
+            return None
+        return (self.total_bytes - self.bytes_done) / self.speed
+
+    @property
+    def is_finished(self) -> bool:
+        return self.done.is_set()
+
+class JobManager:
+    """Бэкапы в очереди воркеров с дедупликацией по подключению.
+
+    Бот только ставит задачи и читает их прогресс: дампы, сжатие и загрузка
+    идут в процессах-воркерах, а polling aiogram не ждет их.
+    """
+
+    def __init__(self):
+        self.jobs: Dict[int, BackupJob] = OrderedDict()
+        self.active: Dict[int, BackupJob] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._poller: Optional[asyncio.Task] = None
+
+    async def submit(self, connection: dict, upload: bool = False) -> Tuple[BackupJob, bool]:
+        """Постановка бэкапа в очередь. Если бэкап подключения уже идет - возвращается существующая задача"""
+        # Замок создается в работающем цикле событий (как семафор в process_runner)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            existing = self.active.get(connection['id'])
+            if existing and (existing.upload or not upload):
+                return existing, False
+            if existing and await enable_backup_job_upload(existing.id):
+                existing.upload = True
+                return existing, False
+
+            # Ручной бэкап без загрузки уже выполняется: для загрузки нужен отдельный бэкап,
+            # ручная задача продолжает отслеживаться до завершения
+            job_id = await enqueue_backup_job(connection['id'], upload, connection.get('affinity'))
+            job = BackupJob(job_id, connection, upload)
+            self.jobs[job.id] = job
+            self.active[connection['id']] = job
+
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll())
+        self._trim()
+        return job, True
+
+    def _pending(self) -> Dict[int, BackupJob]:
+        return {job.id: job for job in self.jobs.values() if not job.is_finished}
+
+    async def _poll(self):
+        """Обновление незавершенных задач из очереди, пока они есть"""
+        queue_timeout = get_settings()['queue_timeout']
+        while self._pending():
+            await asyncio.sleep(POLL_INTERVAL)
+            jobs = self._pending()
+            try:
+                # Воркеры других узлов не видны боту: пропавший воркер определяется по heartbeat
+                requeued = await requeue_backup_jobs(stale_seconds=LEASE_TIMEOUT)
+                if requeued:
+                    logger.warning(f"Возвращено в очередь бэкапов без heartbeat: {requeued}")
+                # Без этого задача с меткой, которую не обслуживает ни один воркер, ждала бы вечно
+                expired = await expire_backup_jobs(queue_timeout)
+                if expired:
+                    logger.error(f"Бэкапов, которые не взял ни один воркер: {expired}")
+                rows = await get_backup_jobs(list(jobs))
+            except Exception as e:
+                logger.error(f"Ошибка чтения очереди бэкапов: {e}")
+                continue
+            for row in rows:
+                job = jobs[row['id']]
+                job.update(row)
+                if job.status in FINISHED_STATUSES:
+                    self._finish(job, row)
+
+    def _finish(self, job: BackupJob, row: Dict[str, Any]):
+        job.finished_at = time.monotonic()
+        if self.active.get(job.connection['id']) is job:
+            del self.active[job.connection['id']]
+        job.done.set()
+
+        # Метрики воркеров отдает эндпоинт бота
+        success = job.status == 'done'
+        if row['dump_seconds'] is not None:
+            record_dump(job.connection['db_type'], success, row['dump_seconds'], job.bytes_done if success else 0)
+        for upload in job.uploads:
+            record_upload(upload['uploaded'], upload['seconds'] or 0, job.bytes_done if upload['uploaded'] else 0)
+        if job.uploaded:
+            # Файл загрузил воркер: список файлов резервного сервера в кэше бота устарел
+            backup_transfer.file_list_cache.clear()
+
+        logger.info(f"Задача бэкапа #{job.id} ({job.connection['name']}) завершена на {job.worker}: {job.status}")
+
+    def get(self, job_id: int) -> Optional[BackupJob]:
+        return self.jobs.get(job_id)
+
+    async def cancel(self, job_id: int) -> bool:
+        """Отмена задачи по ID"""
+        job = self.jobs.get(job_id)
+        if not job or job.is_finished:
+            return False
+        return await cancel_backup_job(job_id)
+
+    def _trim(self):
+        """Удаление старых завершенных задач"""
+        finished = [job_id for job_id, job in self.jobs.items() if job.is_finished]
+        for job_id in finished[:max(0, len(finished) - FINISHED_JOBS_LIMIT)]:
+            del self.jobs[job_id]
+
+class WorkerPool:
+    """Процессы-воркеры бэкапов, запущенные ботом; упавший воркер перезапускается"""
+
+    def __init__(self):
+        self.processes: Dict[str, asyncio.subprocess.Process] = {}
+        self._watchers: List[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self, count: int = None):
+        """Запуск воркеров (BACKUP_WORKERS; 0 - воркеры запускаются отдельно: python worker.py)"""
+        count = get_settings()['workers'] if count is None else count
+        names = [f"worker-{index}" for index in range(1, count + 1)]
+        self._stopping = False
+
+        # Задачи, которые не успели выполнить воркеры прошлого запуска бота
+        requeued = await requeue_backup_jobs(names, stale_seconds=LEASE_TIMEOUT)
+        if requeued:
+            logger.warning(f"Возвращено в очередь незавершенных бэкапов: {requeued}")
+        await delete_old_backup_jobs()
+
+        for name in names:
+            await self._spawn(name)
+        if names:
+            logger.info(f"Запущено воркеров бэкапов: {len(names)}")
+
+    async def _spawn(self, name: str):
+        process = await asyncio.create_subprocess_exec(sys.executable, WORKER_SCRIPT, '--name', name)
+        self.processes[name] = process
+        self._watchers.append(asyncio.create_task(self._watch(name, process)))
+
+    async def _watch(self, name: str, process: asyncio.subprocess.Process):
+        """Перезапуск воркера, завершившегося не по команде бота"""
+        returncode = await process.wait()
+        if self._stopping:
+            return
+        logger.error(f"Воркер {name} завершился с кодом {returncode}, перезапуск через {RESTART_DELAY} с")
+        try:
+            await requeue_backup_jobs([name])
+        except Exception as e:
+            logger.error(f"Ошибка возврата задач воркера {name} в очередь: {e}")
+        await asyncio.sleep(RESTART_DELAY)
+        if not self._stopping:
+            await self._spawn(name)
+
+    async def stop(self):
+        """Остановка воркеров: выполняющиеся бэкапы возвращаются в очередь"""
+        self._stopping = True
+        for watcher in self._watchers:
+            watcher.cancel()
+        self._watchers.clear()
+
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.send_signal(signal.SIGTERM)
+        for name, process in self.processes.items():
+            try:
+                await asyncio.wait_for(process.wait(), timeout=STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Воркер {name} не остановился за {STOP_TIMEOUT} с")
+                process.kill()
+                await process.wait()
+        self.processes.clear()
+
+# Глобальный менеджер фоновых бэкапов
+job_manager = JobManager()
+
+# Глобальный пул процессов-воркеров
+worker_pool = WorkerPool()
@@ -0,0 +1,36 @@
+import time
+import types
+import logging
+import importlib
+
+logger = logging.getLogger(__name__)
+
+class LazyModule(types.ModuleType):
+    """Модуль, который импортируется при первом обращении к его атрибуту.
+
+    Драйверы БД и SSH нужны не при каждом запуске: бот стартует без них,
+    а модуль загружается, когда им впервые воспользуются.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__['_module'] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__['_module']
+        if module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(self.__name__)
+            self.__dict__['_module'] = module
+            logger.debug(f"Модуль {self.__name__} загружен за {(time.perf_counter() - started) * 1000:.0f} мс")
+        return module
+
+    def __getattr__(self, name: str):
+        return getattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+def lazy_import(name: str) -> LazyModule:
+    """Отложенный импорт: import asyncpg -> asyncpg = lazy_import('asyncpg')"""
+    return LazyModule(name)
@@ -0,0 +1,183 @@
+import os
+import glob
+import shutil
+import socket
+import asyncio
+import tempfile
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждем запуска локального сервера
+STARTUP_TIMEOUT = 60
+
+def find_binary(name: str) -> Optional[str]:
+    """Поиск бинарника в PATH и стандартных каталогах PostgreSQL"""
+    path = shutil.which(name)
+    if path:
+        return path
+
+    candidates = sorted(glob.glob(f'/usr/lib/postgresql/*/bin/{name}'), reverse=True)
+    return candidates[0] if candidates else None
+
+def has_binaries(*names: str) -> bool:
+    """Проверка наличия всех бинарников"""
+    return all(find_binary(name) for name in names)
+
+def get_free_port() -> int:
+    """Получение свободного TCP порта на localhost"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def run_command(*cmd: str, stdin=None, env: Dict[str, str] = None) -> str:
+    """Запуск вспомогательной команды, при ошибке - RuntimeError"""
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=stdin,
+        env=env,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+
+    if process.returncode != 0:
+        error_msg = stderr.decode(errors='ignore').strip() or stdout.decode(errors='ignore').strip()
+        raise RuntimeError(f"{os.path.basename(cmd[0])}: {error_msg}")
+
+    return stdout.decode(errors='ignore')
+
+async def wait_for_port(port: int, process: asyncio.subprocess.Process, timeout: int = STARTUP_TIMEOUT):
+    """Ожидание, пока сервер начнет принимать TCP подключения"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    while loop.time() < deadline:
+        if process.returncode is not None:
+            raise RuntimeError(f"Сервер завершился при запуске (код {process.returncode})")
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            await writer.wait_closed()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+
+    raise RuntimeError(f"Сервер не запустился за {timeout} секунд")
+
+async def stop_process(process: asyncio.subprocess.Process, timeout: int = 30):
+    """Остановка сервера: SIGTERM, затем SIGKILL"""
+    if process.returncode is not None:
+        return
+
+    process.terminate()
+    try:
+        await asyncio.wait_for(process.wait(), timeout=timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+@asynccontextmanager
+async def local_postgres() -> AsyncIterator[Dict[str, Any]]:
+    """Временный экземпляр PostgreSQL (initdb + postgres)"""
+    initdb = find_binary('initdb')
+    postgres = find_binary('postgres')
+    if not initdb or not postgres:
+        raise RuntimeError("initdb/postgres не найдены на хосте")
+    if hasattr(os, 'geteuid') and os.geteuid() == 0:
+        raise RuntimeError("PostgreSQL нельзя запускать от root")
+
+    with tempfile.TemporaryDirectory(prefix='pg_standin_') as workdir:
+        data_dir = os.path.join(workdir, 'data')
+        port = get_free_port()
+
+        await run_command(initdb, '-D', data_dir, '-U', 'postgres', '--auth=trust', '-E', 'UTF8')
+
+        process = await asyncio.create_subprocess_exec(
+            postgres, '-D', data_dir, '-p', str(port),
+            '-k', workdir, '-c', 'listen_addresses=127.0.0.1',
+            '-c', 'fsync=off', '-c', 'full_page_writes=off',
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            await wait_for_port(port, process)
+            yield {
+                'host': '127.0.0.1',
+                'port': port,
+                'user': 'postgres',
+                'password': '',
+                'database': 'postgres',
+            }
+        finally:
+            await stop_process(process)
+
+@asynccontextmanager
+async def local_mysql() -> AsyncIterator[Dict[str, Any]]:
+    """Временный экземпляр MySQL/MariaDB (mysqld --initialize-insecure)"""
+    mysqld = find_binary('mysqld') or find_binary('mariadbd')
+    if not mysqld:
+        raise RuntimeError("mysqld не найден на хосте")
+
+    with tempfile.TemporaryDirectory(prefix='mysql_standin_') as workdir:
+        data_dir = os.path.join(workdir, 'data')
+        socket_path = os.path.join(workdir, 'mysqld.sock')
+        port = get_free_port()
+        user_args = ['--user=root'] if hasattr(os, 'geteuid') and os.geteuid() == 0 else []
+
+        install_db = find_binary('mariadb-install-db') or find_binary('mysql_install_db')
+        if os.path.basename(mysqld) == 'mariadbd' and install_db:
+            await run_command(install_db, f'--datadir={data_dir}', '--auth-root-authentication-method=normal', *user_args)
+        else:
+            await run_command(mysqld, '--no-defaults', '--initialize-insecure', f'--datadir={data_dir}', *user_args)
+
+        process = await asyncio.create_subprocess_exec(
+            mysqld, '--no-defaults', f'--datadir={data_dir}',
+            f'--socket={socket_path}', f'--port={port}', '--bind-address=127.0.0.1',
+            f'--pid-file={os.path.join(workdir, "mysqld.pid")}',
+            '--skip-log-bin', '--innodb-flush-log-at-trx-commit=0', *user_args,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            await wait_for_port(port, process)
+            yield {
+                'host': '127.0.0.1',
+                'port': port,
+                'user': 'root',
+                'password': '',
+                'database': 'mysql',
+                'socket': socket_path,
+            }
+        finally:
+            await stop_process(process)
+
+@asynccontextmanager
+async def local_mongo() -> AsyncIterator[Dict[str, Any]]:
+    """Временный экземпляр MongoDB (mongod)"""
+    mongod = find_binary('mongod')
+    if not mongod:
+        raise RuntimeError("mongod не найден на хосте")
+
+    with tempfile.TemporaryDirectory(prefix='mongo_standin_') as workdir:
+        port = get_free_port()
+
+        process = await asyncio.create_subprocess_exec(
+            mongod, '--dbpath', workdir, '--port', str(port), '--bind_ip', '127.0.0.1',
+            '--nounixsocket', '--quiet',
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            await wait_for_port(port, process)
+            yield {
+                'host': '127.0.0.1',
+                'port': port,
+                'user': None,
+                'password': None,
+                'database': 'admin',
+            }
+        finally:
+            await stop_process(process)
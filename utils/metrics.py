@@ -0,0 +1,309 @@
+import os
+import math
+import time
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм: задержки операций, длительность дампов и загрузок, скорость передачи
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+THROUGHPUT_BUCKETS = tuple(1024 * 1024 * mb for mb in (0.1, 0.5, 1, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def get_settings() -> Dict[str, Any]:
+    """Адрес HTTP эндпоинта метрик"""
+    return {
+        'enabled': os.getenv('METRICS_ENABLED', 'true').lower() == 'true',
+        'host': os.getenv('METRICS_HOST', '127.0.0.1'),
+        'port': int(os.getenv('METRICS_PORT', '9108')),
+    }
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    """Метрика с набором меток; значения хранятся по кортежу значений меток"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += self.samples()
+        return "\n".join(lines)
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("Счетчик не может уменьшаться")
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """Текущее значение; может вычисляться функцией в момент запроса метрик"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float], **labels):
+        self._functions[self._key(labels)] = function
+
+    def samples(self) -> List[str]:
+        for key, function in self._functions.items():
+            try:
+                self._values[key] = function()
+            except Exception as e:
+                logger.debug(f"Ошибка вычисления метрики {self.name}: {e}")
+        return super().samples()
+
+class Histogram(Metric):
+    """Распределение наблюдений по корзинам с суммой и количеством"""
+
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            # Счетчики по корзинам (не накопленные), сумма, количество
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[0][index] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    def time(self, **labels) -> 'Timer':
+        """Замер длительности блока: with histogram.time(...):"""
+        return Timer(self, labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Timer:
+    """Контекстный менеджер замера; метка status - ok или error по исходу блока"""
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, Any]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        labels = dict(self.labels)
+        if 'status' in self.histogram.labelnames and 'status' not in labels:
+            labels['status'] = 'ok' if exc_type is None else 'error'
+        self.histogram.observe(time.monotonic() - self.started, **labels)
+
+class MetricsRegistry:
+    """Набор метрик бота и их вывод в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+# Глобальный реестр метрик
+registry = MetricsRegistry()
+
+dump_duration = registry.histogram(
+    'backupbot_dump_duration_seconds', 'Длительность дампа базы данных',
+    ('db_type', 'status'), DURATION_BUCKETS
+)
+dump_bytes = registry.counter(
+    'backupbot_dump_bytes_total', 'Размер созданных бэкапов', ('db_type',)
+)
+upload_duration = registry.histogram(
+    'backupbot_upload_duration_seconds', 'Длительность загрузки бэкапа на резервный сервер',
+    ('status',), DURATION_BUCKETS
+)
+upload_bytes = registry.counter(
+    'backupbot_upload_bytes_total', 'Объем загруженных на резервный сервер бэкапов'
+)
+upload_throughput = registry.histogram(
+    'backupbot_upload_throughput_bytes_per_second', 'Скорость загрузки бэкапа на резервный сервер',
+    buckets=THROUGHPUT_BUCKETS
+)
+ssh_command_duration = registry.histogram(
+    'backupbot_ssh_command_duration_seconds', 'Длительность SSH команды (shell - оболочка SSH менеджера, exec - отдельный канал)',
+    ('kind', 'status')
+)
+db_query_duration = registry.histogram(
+    'backupbot_db_query_duration_seconds', 'Длительность операции со служебной БД бота', ('operation',)
+)
+cache_entries = registry.gauge(
+    'backupbot_cache_entries', 'Число записей в кэше', ('cache',)
+)
+handler_duration = registry.histogram(
+    'backupbot_handler_duration_seconds', 'Длительность обработки сообщения или нажатия кнопки',
+    ('event', 'handler', 'status')
+)
+
+def record_dump(db_type: str, success: bool, duration: float, size: int = 0):
+    """Итог одного дампа"""
+    dump_duration.observe(duration, db_type=db_type, status='ok' if success else 'error')
+    if success:
+        dump_bytes.inc(size, db_type=db_type)
+
+def record_upload(success: bool, duration: float, size: int = 0):
+    """Итог одной загрузки на резервный сервер"""
+    upload_duration.observe(duration, status='ok' if success else 'error')
+    if success:
+        upload_bytes.inc(size)
+        if duration > 0:
+            upload_throughput.observe(size / duration)
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Длительность каждого обработчика aiogram с именем функции и исходом"""
+
+    def __init__(self, event: str):
+        self.event = event
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        with handler_duration.time(event=self.event, handler=name):
+            return await handler(event, data)
+
+class MetricsServer:
+    """HTTP эндпоинт /metrics рядом с polling бота"""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.registry.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+    async def start(self, host: str = None, port: int = None) -> bool:
+        """Запуск сервера; при занятом порте бот продолжает работать без метрик"""
+        settings = get_settings()
+        host = host or settings['host']
+        port = settings['port'] if port is None else port
+
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            site = web.TCPSite(runner, host, port)
+            await site.start()
+        except OSError as e:
+            logger.error(f"Не удалось запустить эндпоинт метрик на {host}:{port}: {e}")
+            await runner.cleanup()
+            return False
+        self._runner = runner
+        logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+        return True
+
+    async def stop(self):
+        """Остановка сервера (при остановке бота)"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+# Глобальный сервер метрик
+metrics_server = MetricsServer(registry)
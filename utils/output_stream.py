@@ -0,0 +1,256 @@
+import os
+import html
+import time
+import asyncio
+import logging
+import tempfile
+from collections import OrderedDict
+from contextlib import suppress
+from typing import Hashable, List, Optional
+
+from aiogram.types import Message, BufferedInputFile, InlineKeyboardMarkup
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних символов вывода показывается в сообщении
+TAIL_CHARS = 3000
+
+# Сколько вывода держится в памяти, прежде чем временный файл уходит на диск
+SPOOL_MEMORY = 1024 * 1024
+
+def get_edit_interval() -> float:
+    """Минимальный интервал между обновлениями сообщения с выводом (секунды)"""
+    return float(os.getenv('SSH_OUTPUT_EDIT_INTERVAL', '2'))
+
+def get_max_output() -> int:
+    """Максимальный размер сохраняемого вывода команды (символы)"""
+    return int(os.getenv('SSH_OUTPUT_MAX_MB', '20')) * 1024 * 1024
+
+def get_store_settings() -> dict:
+    """Сколько результатов команд и как долго хранится для кнопок полного вывода"""
+    return {
+        'ttl': int(os.getenv('SSH_OUTPUT_TTL', '3600')),
+        'maxsize': int(os.getenv('SSH_OUTPUT_STORE_SIZE', '100')),
+    }
+
+class OutputStreamer:
+    """Потоковый вывод команды в одно сообщение.
+
+    Части вывода копятся во временном файле, а в сообщении показывается хвост,
+    который обновляется не чаще раза в интервал. Если вывод не поместился
+    в сообщение, полный вывод отправляется файлом.
+    """
+
+    def __init__(
+        self,
+        message: Message,
+        title: str,
+        reply_markup: Optional[InlineKeyboardMarkup] = None,
+        filename: str = "output.txt"
+    ):
+        self.message = message
+        # Заголовок в HTML (экранирует вызывающий)
+        self.title = title
+        self.reply_markup = reply_markup
+        self.filename = filename
+        self.interval = get_edit_interval()
+        self.max_output = get_max_output()
+        self.spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY, mode='w+', encoding='utf-8')
+        self.tail = ""
+        self.total = 0
+        self.stored = 0
+        self.last_edit = 0.0
+        self.last_text: Optional[str] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        # Файл с выводом передан в хранилище результатов
+        self._detached = False
+
+    @property
+    def truncated(self) -> bool:
+        """Вывод превысил лимит и сохранен не полностью"""
+        return self.stored < self.total
+
+    @property
+    def overflow(self) -> bool:
+        """Вывод не помещается в сообщение"""
+        return self.total > TAIL_CHARS
+
+    def feed(self, text: str):
+        """Новая часть вывода (вызывается синхронно из чтения канала)"""
+        if not text:
+            return
+        self.total += len(text)
+        if self.stored < self.max_output:
+            part = text[:self.max_output - self.stored]
+            self.spool.write(part)
+            self.stored += len(part)
+        self.tail = (self.tail + text)[-TAIL_CHARS:]
+
+        # Частые части объединяются в одно редактирование
+        if self._flush_task is None or self._flush_task.done():
+            delay = max(0.0, self.last_edit + self.interval - time.monotonic())
+            self._flush_task = asyncio.create_task(self._flush_later(delay))
+
+    def render(self, footer: str = "") -> str:
+        """Текст сообщения: заголовок, хвост вывода и подвал"""
+        tail = self.tail
+        if self.overflow:
+            # Хвост начинается с целой строки
+            _, _, rest = tail.partition('\n')
+            tail = f"… {rest or tail}"
+        tail = tail.strip()
+
+        parts = [self.title]
+        if tail:
+            parts.append(f"<pre>{html.escape(tail)}</pre>")
+        if footer:
+            parts.append(footer)
+        return "\n".join(parts)
+
+    async def _flush_later(self, delay: float):
+        await asyncio.sleep(delay)
+        await self._edit()
+
+    async def _edit(self, footer: str = "", final: bool = False):
+        text = self.render(footer)
+        if text == self.last_text:
+            return
+        self.last_edit = time.monotonic()
+        try:
+            await self.message.edit_text(text, parse_mode="HTML", reply_markup=self.reply_markup)
+            self.last_text = text
+        except TelegramRetryAfter as e:
+            if not final:
+                # Следующее обновление - не раньше, чем разрешит Telegram
+                self.last_edit = time.monotonic() + e.retry_after
+                return
+            await asyncio.sleep(e.retry_after)
+            await self._edit(footer, final)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                logger.warning(f"Вывод команды не обновлен: {e}")
+
+    async def finish(self, footer: str = "", attach: bool = True):
+        """Последнее обновление сообщения и отправка полного вывода файлом, если он не поместился"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._flush_task
+        await self._edit(footer, final=True)
+
+        if attach and self.overflow:
+            caption = f"📄 Полный вывод ({self.total} символов)"
+            if self.truncated:
+                caption += f", сохранены первые {self.stored}"
+            try:
+                await self.message.answer_document(
+                    BufferedInputFile(self.getvalue().encode('utf-8'), filename=self.filename),
+                    caption=caption
+                )
+            except Exception as e:
+                logger.error(f"Ошибка отправки полного вывода: {e}")
+
+    def getvalue(self) -> str:
+        """Весь сохраненный вывод"""
+        self.spool.seek(0)
+        value = self.spool.read()
+        self.spool.seek(0, os.SEEK_END)
+        return value
+
+    def detach(self) -> tempfile.SpooledTemporaryFile:
+        """Передача файла с выводом новому владельцу (close его больше не удаляет)"""
+        self._detached = True
+        return self.spool
+
+    def close(self):
+        """Удаление временного файла"""
+        if self._flush_task:
+            self._flush_task.cancel()
+        if not self._detached:
+            self.spool.close()
+
+class StoredOutput:
+    """Сохраненный результат команды; вывод лежит в памяти или на диске"""
+
+    def __init__(self, command: str, description: str, success: bool, spool: tempfile.SpooledTemporaryFile):
+        self.command = command
+        self.description = description
+        self.success = success
+        self.spool = spool
+        self.created = time.monotonic()
+        spool.seek(0)
+        self.line_count = sum(1 for _ in spool)
+        self.size = spool.seek(0, os.SEEK_END)
+
+    def head(self, max_lines: int) -> List[str]:
+        """Первые строки вывода"""
+        self.spool.seek(0)
+        lines = []
+        for line in self.spool:
+            if len(lines) >= max_lines:
+                break
+            lines.append(line.rstrip('\n'))
+        return lines
+
+    def read(self) -> str:
+        """Весь вывод"""
+        self.spool.seek(0)
+        return self.spool.read()
+
+    def close(self):
+        self.spool.close()
+
+class OutputStore:
+    """Ограниченное по размеру и времени хранилище выводов команд.
+
+    Записи лежат в порядке добавления, поэтому устаревшие удаляются с начала,
+    а поиск по ключу - обращение к словарю.
+    """
+
+    def __init__(self):
+        self._items: "OrderedDict[Hashable, StoredOutput]" = OrderedDict()
+
+    def put(
+        self,
+        key: Hashable,
+        command: str,
+        description: str,
+        success: bool,
+        spool: tempfile.SpooledTemporaryFile
+    ) -> StoredOutput:
+        """Сохранение вывода (файл переходит во владение хранилища)"""
+        settings = get_store_settings()
+        self._prune(settings['ttl'])
+
+        previous = self._items.pop(key, None)
+        if previous:
+            previous.close()
+        entry = StoredOutput(command, description, success, spool)
+        self._items[key] = entry
+
+        while len(self._items) > settings['maxsize']:
+            _, oldest = self._items.popitem(last=False)
+            oldest.close()
+        return entry
+
+    def get(self, key: Hashable) -> Optional[StoredOutput]:
+        """Сохраненный вывод (None, если его нет или срок хранения истек)"""
+        entry = self._items.get(key)
+        if entry and time.monotonic() - entry.created > get_store_settings()['ttl']:
+            del self._items[key]
+            entry.close()
+            return None
+        return entry
+
+    def _prune(self, ttl: int):
+        now = time.monotonic()
+        while self._items:
+            key, oldest = next(iter(self._items.items()))
+            if now - oldest.created <= ttl:
+                break
+            del self._items[key]
+            oldest.close()
+
+# Глобальное хранилище выводов команд
+output_store = OutputStore()
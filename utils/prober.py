@@ -0,0 +1,183 @@
+import os
+import time
+import random
+import socket
+import struct
+import asyncio
+import logging
+from contextlib import suppress
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+def get_probe_method() -> str:
+    """Способ проверки доступности: auto (ICMP + TCP), icmp или tcp"""
+    return os.getenv('PROBE_METHOD', 'auto').lower()
+
+def checksum(data: bytes) -> int:
+    """Контрольная сумма ICMP (RFC 1071)"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+def build_echo_request(identifier: int, sequence: int) -> bytes:
+    """Пакет ICMP Echo Request"""
+    payload = struct.pack('!d', time.monotonic())
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum(header + payload), identifier, sequence)
+    return header + payload
+
+def open_icmp_socket() -> Tuple[Optional[socket.socket], bool]:
+    """Непривилегированный ICMP сокет (SOCK_DGRAM), при root - raw сокет: (сокет, raw)"""
+    try:
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP), False
+    except (OSError, AttributeError):
+        pass
+    try:
+        return socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP), True
+    except (OSError, AttributeError):
+        return None, False
+
+async def resolve(host: str) -> Optional[str]:
+    """IPv4 адрес хоста (None, если не резолвится)"""
+    loop = asyncio.get_running_loop()
+    try:
+        infos = await loop.getaddrinfo(host, None, family=socket.AF_INET, type=socket.SOCK_STREAM)
+    except (socket.gaierror, OSError):
+        return None
+    return infos[0][4][0] if infos else None
+
+async def icmp_probe(addresses: List[str], timeout: float) -> Optional[Dict[str, float]]:
+    """Echo запросы всем адресам через один сокет: {адрес: RTT в мс}. None - ICMP недоступен"""
+    sock, raw = open_icmp_socket()
+    if sock is None:
+        return None
+
+    loop = asyncio.get_running_loop()
+    identifier = random.randint(0, 0xFFFF)
+    # Для SOCK_DGRAM идентификатор подставляет ядро, сопоставляем по номеру и адресу
+    pending: Dict[int, Tuple[str, float]] = {}
+    results: Dict[str, float] = {}
+    all_done = loop.create_future()
+
+    def on_readable():
+        while True:
+            try:
+                data, (source, _) = sock.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            if raw:
+                # Raw сокет отдает пакет вместе с IP заголовком
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < 8:
+                continue
+            icmp_type, _, _, reply_id, sequence = struct.unpack('!BBHHH', data[:8])
+            if icmp_type != ICMP_ECHO_REPLY or (raw and reply_id != identifier):
+                continue
+            entry = pending.get(sequence)
+            if not entry or entry[0] != source:
+                continue
+            del pending[sequence]
+            results[source] = (time.monotonic() - entry[1]) * 1000
+            if not pending and not all_done.done():
+                all_done.set_result(None)
+
+    try:
+        sock.setblocking(False)
+        try:
+            loop.add_reader(sock.fileno(), on_readable)
+        except NotImplementedError:
+            # Цикл событий без add_reader (например, Proactor на Windows)
+            return None
+
+        try:
+            for sequence, address in enumerate(dict.fromkeys(addresses), start=1):
+                pending[sequence] = (address, time.monotonic())
+                try:
+                    sock.sendto(build_echo_request(identifier, sequence), (address, 0))
+                except OSError as e:
+                    pending.pop(sequence, None)
+                    logger.debug(f"ICMP {address}: {e}")
+
+            if pending:
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(all_done, timeout=timeout)
+        finally:
+            loop.remove_reader(sock.fileno())
+    finally:
+        sock.close()
+
+    return results
+
+async def tcp_probe(host: str, port: int, timeout: float) -> Optional[float]:
+    """Время установки TCP соединения в мс (None - недоступен)"""
+    started = time.monotonic()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+    except (asyncio.TimeoutError, OSError):
+        return None
+    latency_ms = (time.monotonic() - started) * 1000
+    writer.close()
+    with suppress(Exception):
+        await writer.wait_closed()
+    return latency_ms
+
+async def probe_hosts(
+    targets: List[Tuple[str, int]],
+    timeout: float = 2,
+    method: str = None
+) -> Dict[str, Optional[float]]:
+    """Проверка доступности всех хостов за один таймаут: {хост: RTT в мс или None}"""
+    method = method or get_probe_method()
+    hosts = {}
+    for host, port in targets:
+        hosts.setdefault(host, port or 22)
+    if not hosts:
+        return {}
+
+    results: Dict[str, Optional[float]] = dict.fromkeys(hosts)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    async def run_icmp():
+        addresses = await asyncio.gather(*(resolve(host) for host in hosts))
+        by_address: Dict[str, List[str]] = {}
+        for host, address in zip(hosts, addresses):
+            if address:
+                by_address.setdefault(address, []).append(host)
+        if not by_address:
+            return True
+
+        replies = await icmp_probe(list(by_address), max(0.1, deadline - loop.time()))
+        if replies is None:
+            return False
+        for address, rtt in replies.items():
+            for host in by_address.get(address, []):
+                results[host] = rtt
+        return True
+
+    async def run_tcp(host: str, port: int):
+        rtt = await tcp_probe(host, port, max(0.1, deadline - loop.time()))
+        # ICMP RTT точнее, TCP - только если ICMP не ответил
+        if rtt is not None and results[host] is None:
+            results[host] = rtt
+
+    if method == 'tcp':
+        await asyncio.gather(*(run_tcp(host, port) for host, port in hosts.items()))
+    elif method == 'icmp':
+        if not await run_icmp():
+            logger.warning("ICMP сокет недоступен, проверка по TCP")
+            await asyncio.gather(*(run_tcp(host, port) for host, port in hosts.items()))
+    else:
+        # ICMP часто закрыт файрволом, поэтому параллельно проверяем порт SSH
+        await asyncio.gather(run_icmp(), *(run_tcp(host, port) for host, port in hosts.items()))
+
+    return results
@@ -0,0 +1,230 @@
+import os
+import shutil
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Tuple, List, Dict, Optional
+
+from utils.tracing import tracer
+from utils.compression import get_settings as get_compression_settings, compressed_path, open_writer, FileSink
+from utils.encryption import get_key, EncryptingSink, ENCRYPTED_EXTENSION
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+_semaphore: Optional[asyncio.Semaphore] = None
+
+# Предупреждение о квоте CPU без systemd-run выводится один раз за процесс
+_cpu_quota_warned = False
+
+def get_limits() -> Dict[str, int]:
+    """Ограничения ресурсов для процессов дампа из переменных окружения"""
+    return {
+        'concurrency': max(1, int(os.getenv('BACKUP_CONCURRENCY', '1'))),
+        'nice': int(os.getenv('BACKUP_NICE', '10')),
+        'ionice_class': int(os.getenv('BACKUP_IONICE_CLASS', '2')),
+        'ionice_level': int(os.getenv('BACKUP_IONICE_LEVEL', '7')),
+        'io_limit_mbps': float(os.getenv('BACKUP_IO_LIMIT_MBPS', '0')),
+        'max_memory_mb': int(os.getenv('BACKUP_MAX_MEMORY_MB', '0')),
+        'max_cpu_seconds': int(os.getenv('BACKUP_MAX_CPU_SECONDS', '0')),
+        'cpu_quota': int(os.getenv('BACKUP_CPU_QUOTA', '0')),
+    }
+
+def get_semaphore() -> asyncio.Semaphore:
+    """Общий семафор, ограничивающий число одновременных дампов"""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(get_limits()['concurrency'])
+    return _semaphore
+
+def limit_command(cmd: List[str], limits: Dict[str, int] = None) -> List[str]:
+    """Оборачивание команды в nice/ionice/prlimit или systemd-run (cgroup)"""
+    global _cpu_quota_warned
+    limits = limits or get_limits()
+    prefix = []
+
+    if limits['cpu_quota'] and not shutil.which('systemd-run') and not _cpu_quota_warned:
+        _cpu_quota_warned = True
+        logger.warning(
+            f"systemd-run не найден: BACKUP_CPU_QUOTA={limits['cpu_quota']}% не применяется, "
+            "действуют только nice/ionice и лимиты prlimit"
+        )
+
+    # cgroup через systemd-run: квота CPU и жесткий лимит памяти на весь процесс
+    if limits['cpu_quota'] and shutil.which('systemd-run'):
+        prefix += ['systemd-run', '--scope', '--quiet', '--collect',
+                   '-p', f"CPUQuota={limits['cpu_quota']}%"]
+        if limits['max_memory_mb']:
+            prefix += ['-p', f"MemoryMax={limits['max_memory_mb']}M"]
+        prefix.append('--')
+    elif limits['max_memory_mb'] or limits['max_cpu_seconds']:
+        if shutil.which('prlimit'):
+            prefix.append('prlimit')
+            if limits['max_memory_mb']:
+                prefix.append(f"--as={limits['max_memory_mb'] * 1024 * 1024}")
+            if limits['max_cpu_seconds']:
+                prefix.append(f"--cpu={limits['max_cpu_seconds']}")
+            prefix.append('--')
+        else:
+            logger.warning("prlimit не найден: лимиты памяти и CPU не применяются")
+
+    if limits['nice'] and shutil.which('nice'):
+        prefix += ['nice', '-n', str(limits['nice'])]
+
+    if limits['ionice_class'] and shutil.which('ionice'):
+        prefix += ['ionice', '-c', str(limits['ionice_class'])]
+        if limits['ionice_class'] in (1, 2):
+            prefix += ['-n', str(limits['ionice_level'])]
+
+    return prefix + list(cmd)
+
+class Throttle:
+    """Ограничение скорости записи (token bucket по байтам)"""
+
+    def __init__(self, bytes_per_second: float):
+        self.rate = bytes_per_second
+        self.allowance = 0.0
+        self.last = None
+
+    async def consume(self, count: int):
+        if not self.rate:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if self.last is None:
+            self.last = now
+        # Запас не больше секунды трафика, чтобы не было всплесков
+        self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+        self.last = now
+        self.allowance -= count
+        if self.allowance < 0:
+            await asyncio.sleep(-self.allowance / self.rate)
+
+async def run_dump(
+    cmd: List[str],
+    output_path: str,
+    env: Dict[str, str] = None,
+    job=None
+) -> Tuple[bool, str]:
+    """Запуск утилиты дампа с ограничением ресурсов и потоковой записью stdout в файл.
+
+    Сжатие (BACKUP_COMPRESSION), шифрование (BACKUP_ENCRYPTION_KEY) и SHA-256
+    идут в том же проходе, к имени файла добавляются их расширения;
+    возвращается фактический путь, хеш сохраняется в job.checksum.
+    """
+    limits = get_limits()
+
+    # Ожидание свободного слота BACKUP_CONCURRENCY видно отдельно от самого дампа
+    with tracer.span('wait_slot'):
+        await get_semaphore().acquire()
+    try:
+        return await _run_dump(cmd, output_path, env, job, limits)
+    finally:
+        get_semaphore().release()
+
+async def _run_dump(cmd: List[str], output_path: str, env: Dict[str, str], job, limits: Dict[str, int]) -> Tuple[bool, str]:
+    compression = get_compression_settings()
+    with tracer.span('subprocess', command=cmd[0], compression=compression['algorithm'], encrypted=bool(get_key())) as span:
+        process = await asyncio.create_subprocess_exec(
+            *limit_command(cmd, limits),
+            env=env,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        span.set_attribute('pid', process.pid)
+        if job:
+            job.attach_process(process)
+
+        stderr_task = asyncio.create_task(process.stderr.read())
+
+        async def read_stdout() -> AsyncIterator[bytes]:
+            while True:
+                chunk = await process.stdout.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+        try:
+            artifact = await write_artifact(read_stdout(), output_path, job, limits)
+            stderr = await stderr_task
+            await process.wait()
+            span.set_attributes(
+                exit_code=process.returncode, bytes=artifact['bytes'],
+                raw_bytes=artifact['raw_bytes'], sha256=artifact['sha256']
+            )
+            if process.returncode != 0:
+                span.fail(stderr.decode(errors='ignore').strip()[-500:])
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+
+    if process.returncode != 0:
+        if os.path.exists(artifact['path']):
+            os.remove(artifact['path'])
+        if job and job.cancelled:
+            return False, "Бэкап отменен"
+        return False, stderr.decode(errors='ignore').strip()
+
+    if job:
+        job.checksum = artifact['sha256']
+    return True, artifact['path']
+
+async def write_artifact(
+    chunks: AsyncIterator[bytes],
+    output_path: str,
+    job=None,
+    limits: Dict[str, int] = None
+) -> Dict[str, Any]:
+    """Запись потока в артефакт: сжатие, шифрование и SHA-256 в одном проходе.
+
+    К имени файла добавляются расширения сжатия и шифрования, недописанный
+    файл при ошибке удаляется. Возвращает путь, байты на диске, байты потока и хеш.
+    """
+    limits = limits or get_limits()
+    compression = get_compression_settings()
+    key = get_key()
+    output_path = compressed_path(output_path, compression)
+    if key:
+        output_path += ENCRYPTED_EXTENSION
+
+    throttle = Throttle(limits['io_limit_mbps'] * 1024 * 1024)
+    dumped, written = 0, 0
+    sink, writer = None, None
+
+    try:
+        # Сжатие использует все ядра; внешний компрессор получает те же nice/ionice, что и дамп
+        sink = FileSink(output_path)
+        writer = open_writer(
+            EncryptingSink(sink, key) if key else sink,
+            compression, wrap=lambda command: limit_command(command, limits)
+        )
+        async for chunk in chunks:
+            dumped += len(chunk)
+            count = await writer.write(chunk)
+            await _account(job, throttle, count)
+            written += count
+        count = await writer.close()
+        await _account(job, throttle, count)
+        written += count
+    except BaseException:
+        if writer:
+            await writer.abort()
+        elif sink:
+            # open_writer или ключ шифрования отказали до создания writer
+            await sink.abort()
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+    return {'path': output_path, 'bytes': written, 'raw_bytes': dumped, 'sha256': sink.checksum}
+
+async def _account(job, throttle: Throttle, count: int):
+    """Учет записанных на диск байт: прогресс задачи и лимит скорости записи"""
+    if not count:
+        return
+    if job:
+        job.add_bytes(count)
+    # Пока ждем, дамп упирается в заполненный pipe и притормаживает
+    await throttle.consume(count)
@@ -0,0 +1,200 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import suppress
+from typing import Dict, Optional
+
+from aiogram.types import Message
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
+
+from utils.health import probe_ssh
+from utils.prober import resolve, icmp_probe
+
+logger = logging.getLogger(__name__)
+
+# Интервал проверок, когда изменение состояния ожидается в любой момент
+FAST_INTERVAL = 0.5
+
+# Максимальный интервал, пока сервер выключен и сеть не отвечает
+SLOW_INTERVAL = 5.0
+
+# Таймаут одной проверки SSH баннера и ICMP
+PROBE_TIMEOUT = 2
+
+def get_timeouts() -> Dict[str, int]:
+    """Сколько ждать отключения и включения сервера (секунды)"""
+    return {
+        'down': int(os.getenv('REBOOT_DOWN_TIMEOUT', '300')),
+        'up': int(os.getenv('REBOOT_UP_TIMEOUT', '600')),
+    }
+
+class RebootWatch:
+    """Наблюдение за перезагрузкой одного сервера"""
+
+    def __init__(self, server: dict, message: Message):
+        self.server = server
+        self.message = message
+        self.started = time.monotonic()
+        # waiting_down -> down -> up (или failed)
+        self.phase = 'waiting_down'
+        self.address: Optional[str] = None
+        # Последняя успешная и первая неудачная проверка SSH: отключение произошло между ними
+        self.last_seen_up = self.started
+        self.down_at: Optional[float] = None
+        self.last_seen_down: Optional[float] = None
+        self.network_at: Optional[float] = None
+        self.up_at: Optional[float] = None
+        self.interval = FAST_INTERVAL
+        self.next_probe = self.started
+
+class RebootWatcher:
+    """Общий наблюдатель за перезагрузкой серверов: один цикл проверяет все серверы сразу,
+    интервал каждого подстраивается под ожидаемое событие"""
+
+    def __init__(self):
+        self.watches: Dict[int, RebootWatch] = {}
+        self._task: Optional[asyncio.Task] = None
+        # Будит цикл, когда проверка завершилась или добавлен сервер
+        self._wakeup: Optional[asyncio.Event] = None
+        self._probes = set()
+
+    def is_watching(self, server_id: int) -> bool:
+        return server_id in self.watches
+
+    def watch(self, server: dict, message: Message) -> bool:
+        """Начало наблюдения (False - за сервером уже наблюдают)"""
+        if server['id'] in self.watches:
+            return False
+        self.watches[server['id']] = RebootWatch(server, message)
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+        return True
+
+    async def stop(self):
+        """Остановка наблюдения (при остановке бота)"""
+        if self._task:
+            self._task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        for probe in list(self._probes):
+            probe.cancel()
+        self.watches.clear()
+
+    async def _loop(self):
+        while self.watches:
+            self._wakeup.clear()
+            now = time.monotonic()
+            # Проверки идут независимо: медленный недоступный сервер не задерживает остальные
+            for watch in list(self.watches.values()):
+                if watch.next_probe <= now:
+                    watch.next_probe = float('inf')
+                    probe = asyncio.create_task(self._probe(watch))
+                    self._probes.add(probe)
+                    probe.add_done_callback(self._probes.discard)
+
+            if not self.watches:
+                break
+            delay = min(watch.next_probe for watch in self.watches.values()) - time.monotonic()
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.05, min(delay, SLOW_INTERVAL)))
+
+    async def _probe(self, watch: RebootWatch):
+        try:
+            await self._check(watch)
+        except Exception as e:
+            logger.error(f"Ошибка наблюдения за перезагрузкой {watch.server['name']}: {e}")
+            watch.next_probe = time.monotonic() + SLOW_INTERVAL
+        self._wakeup.set()
+
+    async def _check(self, watch: RebootWatch):
+        server = watch.server
+        timeouts = get_timeouts()
+        ssh_up, _, _, _ = await probe_ssh(server['host'], server['port'], PROBE_TIMEOUT)
+        now = time.monotonic()
+
+        if watch.phase == 'waiting_down':
+            if ssh_up:
+                watch.last_seen_up = now
+                if now - watch.started > timeouts['down']:
+                    await self._finish(watch, "❌ Сервер не отключился в течение ожидаемого времени")
+                    return
+            else:
+                watch.phase = 'down'
+                watch.down_at = now
+                watch.last_seen_down = now
+                await self._edit(watch, "🔴 Сервер отключился. Ожидаю включения...")
+            watch.next_probe = now + FAST_INTERVAL
+            return
+
+        if ssh_up:
+            watch.up_at = now
+            await self._report_up(watch)
+            return
+
+        watch.last_seen_down = now
+        if now - watch.down_at > timeouts['up']:
+            await self._finish(watch, "❌ Сервер не включился в течение ожидаемого времени")
+            return
+
+        # Пока сеть молчит, проверяем все реже; как только отвечает ping - SSH вот-вот поднимется
+        if watch.network_at is None and await self._ping(watch):
+            watch.network_at = time.monotonic()
+            await self._edit(watch, "🟡 Сервер отвечает на ping. Ожидаю SSH...")
+        if watch.network_at is None:
+            watch.interval = min(SLOW_INTERVAL, watch.interval * 1.5)
+        else:
+            watch.interval = FAST_INTERVAL
+        watch.next_probe = now + watch.interval
+
+    async def _ping(self, watch: RebootWatch) -> bool:
+        if watch.address is None:
+            watch.address = await resolve(watch.server['host']) or ""
+        if not watch.address:
+            return False
+        replies = await icmp_probe([watch.address], PROBE_TIMEOUT)
+        return bool(replies)
+
+    async def _report_up(self, watch: RebootWatch):
+        name = watch.server['name']
+        # Отключение и включение произошли в промежутках между соседними проверками
+        downtime = watch.up_at - watch.down_at
+        precision = (watch.down_at - watch.last_seen_up) + (watch.up_at - watch.last_seen_down)
+
+        text = (
+            f"✅ Сервер {name} перезагрузился!\n"
+            f"⏱️ Время недоступности SSH: {downtime:.1f} с (±{precision / 2:.1f} с)\n"
+        )
+        if watch.network_at is not None:
+            text += f"🏓 Сеть вернулась через {watch.network_at - watch.down_at:.1f} с после отключения\n"
+        text += f"🕐 От команды до готовности: {watch.up_at - watch.started:.1f} с"
+        await self._finish(watch, text)
+
+        # Отдельное сообщение, чтобы пришло уведомление
+        try:
+            await watch.message.answer(f"🟢 {name} снова доступен по SSH")
+        except Exception as e:
+            logger.error(f"Ошибка отправки уведомления о перезагрузке {name}: {e}")
+
+    async def _finish(self, watch: RebootWatch, text: str):
+        watch.phase = 'up' if watch.up_at else 'failed'
+        self.watches.pop(watch.server['id'], None)
+        logger.info(f"Наблюдение за перезагрузкой {watch.server['name']} завершено: {watch.phase}")
+        await self._edit(watch, text)
+
+    async def _edit(self, watch: RebootWatch, text: str):
+        try:
+            await watch.message.edit_text(text)
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            with suppress(TelegramBadRequest):
+                await watch.message.edit_text(text)
+        except TelegramBadRequest:
+            pass
+
+# Глобальный наблюдатель за перезагрузками
+reboot_watcher = RebootWatcher()
@@ -0,0 +1,449 @@
+import os
+import json
+import time
+import zlib
+import shlex
+import shutil
+import tempfile
+import asyncio
+import logging
+from typing import Tuple, AsyncIterator, Optional
+
+import aiosqlite
+
+from utils.backup_transfer import backup_transfer
+from utils.ssh_pool import ssh_manager
+from utils.encryption import ENCRYPTED_EXTENSION, is_encrypted, decrypt_stream
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+# Расширения сжатых артефактов
+COMPRESSION_EXTENSIONS = ('.gz', '.zst')
+
+# SQLSTATE "объект уже существует" (таблица, объект, схема, функция)
+DUPLICATE_OBJECT_CODES = ('42P07', '42710', '42P06', '42723')
+
+def strip_compression_ext(file_name: str) -> str:
+    """Имя артефакта без расширений шифрования и сжатия"""
+    if is_encrypted(file_name):
+        file_name = file_name[:-len(ENCRYPTED_EXTENSION)]
+    for ext in COMPRESSION_EXTENSIONS:
+        if file_name.endswith(ext):
+            return file_name[:-len(ext)]
+    return file_name
+
+def is_compressed(file_name: str) -> bool:
+    """Проверка, сжат ли артефакт"""
+    return strip_compression_ext(file_name) != file_name
+
+async def read_local_file(path: str, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Чтение локального файла чанками без блокировки event loop"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+async def gunzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Потоковая распаковка gzip (в том числе многочленных файлов)"""
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        while chunk:
+            data = await asyncio.to_thread(decompressor.decompress, chunk)
+            if data:
+                yield data
+            if decompressor.eof:
+                # Следующий член gzip начинается в unused_data
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            else:
+                chunk = b''
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+async def pipe_through_process(cmd: list, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Прогон потока через внешний фильтр (например, zstd -dc)"""
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+
+    async def feed():
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            process.stdin.close()
+
+    feeder = asyncio.create_task(feed())
+    try:
+        while True:
+            data = await process.stdout.read(CHUNK_SIZE)
+            if not data:
+                break
+            yield data
+        await feeder
+        # Фильтр мог еще не завершиться после конца вывода: его код возврата нужен целиком
+        await process.wait()
+    finally:
+        if not feeder.done():
+            feeder.cancel()
+        if process.returncode is None:
+            process.kill()
+        await process.wait()
+
+    if process.returncode != 0:
+        error_msg = (await process.stderr.read()).decode(errors='ignore').strip()
+        raise RuntimeError(f"{cmd[0]}: {error_msg}")
+
+def decompress_stream(chunks: AsyncIterator[bytes], file_name: str) -> AsyncIterator[bytes]:
+    """Расшифровка и распаковка потока по расширениям артефакта"""
+    if is_encrypted(file_name):
+        chunks = decrypt_stream(chunks)
+        file_name = file_name[:-len(ENCRYPTED_EXTENSION)]
+    if file_name.endswith('.gz'):
+        return gunzip_stream(chunks)
+    if file_name.endswith('.zst'):
+        if not shutil.which('zstd'):
+            raise RuntimeError("zstd не установлен на хосте")
+        return pipe_through_process(['zstd', '-dc'], chunks)
+    return chunks
+
+class RestoreProgress:
+    """Прогресс восстановления: прочитанные байты артефакта (как есть на диске)"""
+
+    def __init__(self, total_bytes: int = None):
+        self.bytes_done = 0
+        self.total_bytes = total_bytes
+        self.started_at = time.monotonic()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def percent(self) -> Optional[float]:
+        if not self.total_bytes:
+            return None
+        return min(100.0, self.bytes_done * 100 / self.total_bytes)
+
+async def count_stream(chunks: AsyncIterator[bytes], progress: RestoreProgress) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        progress.bytes_done += len(chunk)
+        yield chunk
+
+async def open_artifact(
+    artifact_path: str,
+    backup_server: dict = None,
+    progress: RestoreProgress = None
+) -> AsyncIterator[bytes]:
+    """Распакованный поток артефакта: локального или с резервного сервера"""
+    if backup_server:
+        raw = backup_transfer.stream_backup(backup_server['id'], artifact_path)
+    else:
+        raw = read_local_file(artifact_path)
+    if progress:
+        raw = count_stream(raw, progress)
+
+    async for chunk in decompress_stream(raw, os.path.basename(artifact_path)):
+        yield chunk
+
+async def peek_stream(chunks: AsyncIterator[bytes], size: int) -> Tuple[bytes, AsyncIterator[bytes]]:
+    """Чтение первых байт потока без их потери"""
+    head = b''
+    iterator = chunks.__aiter__()
+    buffered = []
+    while len(head) < size:
+        try:
+            chunk = await iterator.__anext__()
+        except StopAsyncIteration:
+            break
+        buffered.append(chunk)
+        head += chunk
+
+    async def replay():
+        for chunk in buffered:
+            yield chunk
+        async for chunk in iterator:
+            yield chunk
+
+    return head[:size], replay()
+
+async def feed_process(cmd: list, chunks: Optional[AsyncIterator[bytes]], env: dict = None) -> Tuple[bool, str]:
+    """Запуск утилиты восстановления с подачей потока в stdin"""
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        env=env,
+        stdin=asyncio.subprocess.PIPE if chunks is not None else asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stderr_task = asyncio.create_task(process.stderr.read())
+
+    stream_error = None
+    if chunks is not None:
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # Утилита завершилась раньше - причина будет в stderr
+            pass
+        except Exception as e:
+            stream_error = e
+            process.kill()
+        finally:
+            process.stdin.close()
+
+    stderr = await stderr_task
+    await process.wait()
+
+    if stream_error:
+        return False, f"Ошибка чтения артефакта: {stream_error}"
+    if process.returncode != 0:
+        error_msg = stderr.decode(errors='ignore').strip()
+        return False, f"Ошибка {os.path.basename(cmd[0])}: {error_msg}"
+    return True, "OK"
+
+async def restore_backup(
+    conn: dict,
+    artifact_path: str,
+    backup_server: dict = None,
+    jobs: int = None,
+    progress: RestoreProgress = None,
+    no_owner: bool = False
+) -> Tuple[bool, str]:
+    """Восстановление артефакта в базу подключения.
+
+    progress - прогресс чтения артефакта; no_owner - PostgreSQL без владельцев
+    и прав из дампа (для временного экземпляра, где нет ролей исходного сервера).
+    """
+    db_type = conn['db_type']
+    jobs = jobs or int(os.getenv('RESTORE_JOBS', os.cpu_count() or 1))
+
+    try:
+        if backup_server:
+            success, message = await backup_transfer.connect(
+                server_id=backup_server['id'],
+                host=backup_server['host'],
+                port=backup_server['port'],
+                username=backup_server['username'],
+                password=backup_server['password']
+            )
+            if not success:
+                return False, message
+
+        try:
+            if db_type == 'psql':
+                return await restore_postgresql(conn, artifact_path, backup_server, jobs, progress, no_owner)
+            elif db_type == 'mysql':
+                return await restore_mysql(conn, artifact_path, backup_server, progress)
+            elif db_type == 'sqlite':
+                return await restore_sqlite(conn, artifact_path, backup_server, progress)
+            elif db_type == 'mongo':
+                return await restore_mongodb(conn, artifact_path, backup_server, progress)
+            else:
+                return False, f"Неизвестный тип БД: {db_type}"
+        finally:
+            if backup_server:
+                await backup_transfer.close_connection(backup_server['id'])
+
+    except Exception as e:
+        return False, f"Исключение: {str(e)}"
+
+async def restore_postgresql(
+    conn: dict,
+    artifact_path: str,
+    backup_server: dict,
+    jobs: int,
+    progress: RestoreProgress = None,
+    no_owner: bool = False
+) -> Tuple[bool, str]:
+    """Восстановление PostgreSQL: psql для plain дампов, pg_restore --jobs для custom/directory"""
+    env = os.environ.copy()
+    env['PGPASSWORD'] = conn['password'] or ''
+    base_args = ['-h', conn['host'], '-p', str(conn['port']), '-U', conn['user'], '--no-password']
+    if no_owner:
+        restore_args = ['--no-owner', '--no-privileges']
+    else:
+        restore_args = []
+
+    # Каталог или несжатый custom дамп на диске - параллельное восстановление
+    is_local = not backup_server
+    if is_local and os.path.isdir(artifact_path):
+        cmd = ['pg_restore', *base_args, *restore_args, '-d', conn['database'], '--clean', '--if-exists',
+               f'--jobs={jobs}', artifact_path]
+        return await feed_process(cmd, None, env)
+
+    chunks = open_artifact(artifact_path, backup_server, progress)
+    head, chunks = await peek_stream(chunks, 5)
+
+    if head == b'PGDMP':
+        if is_local and not is_compressed(artifact_path):
+            await chunks.aclose()
+            cmd = ['pg_restore', *base_args, *restore_args, '-d', conn['database'], '--clean', '--if-exists',
+                   f'--jobs={jobs}', artifact_path]
+            return await feed_process(cmd, None, env)
+
+        # Из потока pg_restore умеет только последовательно
+        cmd = ['pg_restore', *base_args, *restore_args, '-d', conn['database'], '--clean', '--if-exists']
+        return await feed_process(cmd, chunks, env)
+
+    # Одна транзакция: при ошибке база остается как была, а не восстановленной наполовину
+    if no_owner:
+        chunks = strip_ownership(chunks)
+    # VERBOSITY=verbose добавляет к ошибке SQLSTATE: код не зависит от языка сообщений сервера
+    cmd = ['psql', *base_args, '-d', conn['database'], '-v', 'ON_ERROR_STOP=1', '-v', 'VERBOSITY=verbose',
+           '-q', '--single-transaction']
+    success, message = await feed_process(cmd, chunks, env)
+    if not success and any(code in message for code in DUPLICATE_OBJECT_CODES):
+        # Дампы до pg_dump --clean не удаляют существующие объекты
+        return False, (
+            "Дамп создан без --clean и не может перезаписать непустую базу; изменения отменены. "
+            "Восстановите его в пустую базу или сделайте новый бэкап.\n" + message
+        )
+    return success, message
+
+def _is_ownership(line: bytes) -> bool:
+    if line.startswith((b'GRANT ', b'REVOKE ', b'SET SESSION AUTHORIZATION ', b'ALTER DEFAULT PRIVILEGES ')):
+        return True
+    return line.startswith(b'ALTER ') and b' OWNER TO ' in line
+
+async def strip_ownership(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Plain SQL дамп без смены владельцев и прав - аналог pg_restore --no-owner --no-privileges.
+
+    Строки данных COPY не фильтруются: в них может встретиться тот же текст.
+    """
+    buffer = b''
+    in_copy = False
+    async for chunk in chunks:
+        lines = (buffer + chunk).split(b'\n')
+        buffer = lines.pop()
+        kept = []
+        for line in lines:
+            if in_copy:
+                in_copy = line != b'\\.'
+            elif line.startswith(b'COPY ') and line.endswith(b'FROM stdin;'):
+                in_copy = True
+            elif _is_ownership(line):
+                continue
+            kept.append(line)
+        if kept:
+            yield b'\n'.join(kept) + b'\n'
+    if buffer and (in_copy or not _is_ownership(buffer)):
+        yield buffer
+
+async def restore_mysql(conn: dict, artifact_path: str, backup_server: dict, progress: RestoreProgress = None) -> Tuple[bool, str]:
+    """Восстановление MySQL: поток дампа в mysql"""
+    if conn.get('socket'):
+        cmd = ['mysql', f'--socket={conn["socket"]}', f'-u{conn["user"]}']
+    else:
+        cmd = ['mysql', f'-h{conn["host"]}', f'-P{conn["port"]}', f'-u{conn["user"]}']
+    cmd.append(conn['database'])
+
+    # Пароль в окружении, а не в argv: аргументы процесса видны в ps и /proc
+    env = os.environ.copy()
+    if conn.get('password'):
+        env['MYSQL_PWD'] = conn['password']
+    return await feed_process(cmd, open_artifact(artifact_path, backup_server, progress), env)
+
+async def restore_mongodb(conn: dict, artifact_path: str, backup_server: dict, progress: RestoreProgress = None) -> Tuple[bool, str]:
+    """Восстановление MongoDB: mongorestore --archive из потока или --dir для каталога"""
+    cmd = ['mongorestore', f'--host={conn["host"]}:{conn["port"]}', '--drop']
+    config_path = None
+    if conn.get('user') and conn.get('password'):
+        # Пароль в файле конфигурации с правами 0600, а не в argv
+        fd, config_path = tempfile.mkstemp(prefix='mongorestore_', suffix='.yaml')
+        with os.fdopen(fd, 'w') as f:
+            f.write(f"password: {json.dumps(conn['password'])}\n")
+        cmd.extend([
+            f'--username={conn["user"]}',
+            f'--config={config_path}',
+            '--authenticationDatabase=admin'
+        ])
+
+    try:
+        # Старый формат mongodump --out (каталог)
+        if not backup_server and os.path.isdir(artifact_path):
+            cmd.append(f'--dir={artifact_path}')
+            return await feed_process(cmd, None)
+
+        cmd.append('--archive')
+        return await feed_process(cmd, open_artifact(artifact_path, backup_server, progress))
+    finally:
+        if config_path:
+            os.remove(config_path)
+
+async def restore_sqlite(conn: dict, artifact_path: str, backup_server: dict, progress: RestoreProgress = None) -> Tuple[bool, str]:
+    """Восстановление SQLite через backup API (локально) или SFTP (по SSH).
+
+    Backup API читает только файл БД, поэтому сжатый, зашифрованный или
+    удаленный артефакт распаковывается во временный файл рядом с целевой
+    базой (после проверки свободного места) и удаляется после восстановления.
+    """
+    target_path = conn['file_path']
+
+    if conn.get('ssh_host'):
+        return await restore_sqlite_ssh(conn, artifact_path, backup_server, progress)
+
+    # Несжатый локальный артефакт - сразу источник для backup API
+    if not backup_server and not is_compressed(artifact_path):
+        async with aiosqlite.connect(artifact_path) as source:
+            async with aiosqlite.connect(target_path) as target:
+                await source.backup(target)
+        return True, "OK"
+
+    # backup API требует файл БД: распаковываем рядом с целевой базой
+    temp_path = f"{target_path}.restore"
+    # Размер распакованной базы заранее неизвестен: оценка - не меньше текущей базы и артефакта
+    needed = max(
+        os.path.getsize(target_path) if os.path.exists(target_path) else 0,
+        os.path.getsize(artifact_path) if not backup_server else 0
+    )
+    free = shutil.disk_usage(os.path.dirname(os.path.abspath(target_path))).free
+    if free < needed:
+        return False, f"Недостаточно места для распаковки: нужно ~{needed // 1024 // 1024} МБ, свободно {free // 1024 // 1024} МБ"
+    try:
+        with open(temp_path, 'wb') as f:
+            async for chunk in open_artifact(artifact_path, backup_server, progress):
+                await asyncio.to_thread(f.write, chunk)
+
+        async with aiosqlite.connect(temp_path) as source:
+            async with aiosqlite.connect(target_path) as target:
+                await source.backup(target)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return True, "OK"
+
+async def restore_sqlite_ssh(conn: dict, artifact_path: str, backup_server: dict, progress: RestoreProgress = None) -> Tuple[bool, str]:
+    """Восстановление SQLite на удаленный сервер: поток по SFTP и атомарная замена"""
+    remote_path = conn['file_path']
+    temp_path = f"{remote_path}.restore"
+
+    async with ssh_manager.connection(
+        conn['ssh_host'],
+        conn.get('ssh_port') or 22,
+        conn['ssh_user'],
+        conn['ssh_password']
+    ) as ssh:
+        async with ssh.start_sftp_client() as sftp:
+            async with sftp.open(temp_path, 'wb') as remote_file:
+                async for chunk in open_artifact(artifact_path, backup_server, progress):
+                    await remote_file.write(chunk)
+
+        result = await ssh.run(f"mv -f {shlex.quote(temp_path)} {shlex.quote(remote_path)}")
+        if result.exit_status != 0:
+            return False, f"Ошибка замены файла: {result.stderr}"
+
+    return True, "OK"
@@ -0,0 +1,211 @@
+import os
+import time
+import asyncio
+import logging
+import tempfile
+from typing import Tuple, Dict, Any
+
+import aiosqlite
+
+from utils.artifacts import find_latest_artifact
+from utils.db import get_enabled_connections, log_verification
+from utils.local_instances import (
+    local_postgres, local_mysql, local_mongo, find_binary, run_command
+)
+from utils.restore import restore_backup
+from utils.lazy import lazy_import
+
+asyncpg = lazy_import('asyncpg')
+pymysql = lazy_import('pymysql')
+pymongo = lazy_import('pymongo')
+
+logger = logging.getLogger(__name__)
+
+# Имя базы, в которую восстанавливается дамп на временном экземпляре
+VERIFY_DATABASE = 'restore_verify'
+
+async def verify_backup(conn: dict, artifact_path: str) -> Tuple[bool, Dict[str, Any]]:
+    """Восстановление артефакта во временный экземпляр и проверка данных"""
+    db_type = conn['db_type']
+    result = {'restore_seconds': None, 'row_counts': {}, 'error': None}
+
+    try:
+        if db_type == 'sqlite':
+            await verify_sqlite(artifact_path, result)
+        elif db_type == 'psql':
+            await verify_postgresql(conn, artifact_path, result)
+        elif db_type == 'mysql':
+            await verify_mysql(artifact_path, result)
+        elif db_type == 'mongo':
+            await verify_mongodb(conn, artifact_path, result)
+        else:
+            result['error'] = f"Неизвестный тип БД: {db_type}"
+            return False, result
+    except Exception as e:
+        result['error'] = str(e)
+        return False, result
+
+    return True, result
+
+async def verify_sqlite(artifact_path: str, result: dict):
+    """Проверка SQLite: восстановление во временный файл через backup API"""
+    with tempfile.TemporaryDirectory(prefix='sqlite_verify_') as workdir:
+        target_path = os.path.join(workdir, 'restore.db')
+
+        started = time.perf_counter()
+        success, message = await restore_backup({'db_type': 'sqlite', 'file_path': target_path}, artifact_path)
+        if not success:
+            raise RuntimeError(message)
+        result['restore_seconds'] = time.perf_counter() - started
+
+        async with aiosqlite.connect(target_path) as db:
+            cursor = await db.execute("PRAGMA integrity_check")
+            integrity = (await cursor.fetchone())[0]
+            if integrity != 'ok':
+                raise RuntimeError(f"integrity_check: {integrity}")
+
+            cursor = await db.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"
+            )
+            for (table,) in await cursor.fetchall():
+                cursor = await db.execute(f'SELECT COUNT(*) FROM "{table}"')
+                result['row_counts'][table] = (await cursor.fetchone())[0]
+
+async def verify_postgresql(conn: dict, artifact_path: str, result: dict):
+    """Проверка PostgreSQL: восстановление в локальный экземпляр"""
+    psql = find_binary('psql')
+    if not psql:
+        raise RuntimeError("psql не найден на хосте")
+
+    async with local_postgres() as instance:
+        base_args = ['-h', instance['host'], '-p', str(instance['port']), '-U', instance['user']]
+
+        await run_command(psql, *base_args, '-d', 'postgres', '-c', f'CREATE DATABASE {VERIFY_DATABASE}')
+
+        # Ролей исходного сервера здесь нет: владельцы и права из дампа не восстанавливаются
+        target = dict(instance, db_type='psql', database=VERIFY_DATABASE)
+        started = time.perf_counter()
+        success, message = await restore_backup(target, artifact_path, no_owner=True)
+        if not success:
+            raise RuntimeError(message)
+        result['restore_seconds'] = time.perf_counter() - started
+
+        db = await asyncpg.connect(
+            host=instance['host'], port=instance['port'],
+            user=instance['user'], database=VERIFY_DATABASE
+        )
+        try:
+            tables = await db.fetch("""
+                SELECT table_schema, table_name FROM information_schema.tables
+                WHERE table_type = 'BASE TABLE'
+                AND table_schema NOT IN ('pg_catalog', 'information_schema')
+            """)
+            for table in tables:
+                count = await db.fetchval(
+                    f'SELECT count(*) FROM "{table["table_schema"]}"."{table["table_name"]}"'
+                )
+                result['row_counts'][f'{table["table_schema"]}.{table["table_name"]}'] = count
+        finally:
+            await db.close()
+
+async def verify_mysql(artifact_path: str, result: dict):
+    """Проверка MySQL: восстановление в локальный экземпляр"""
+    mysql = find_binary('mysql') or find_binary('mariadb')
+    if not mysql:
+        raise RuntimeError("mysql клиент не найден на хосте")
+
+    async with local_mysql() as instance:
+        base_args = [f'--socket={instance["socket"]}', f'-u{instance["user"]}']
+
+        await run_command(mysql, *base_args, '-e', f'CREATE DATABASE {VERIFY_DATABASE}')
+
+        target = dict(instance, db_type='mysql', database=VERIFY_DATABASE)
+        started = time.perf_counter()
+        success, message = await restore_backup(target, artifact_path)
+        if not success:
+            raise RuntimeError(message)
+        result['restore_seconds'] = time.perf_counter() - started
+
+        def count_rows():
+            db = pymysql.connect(
+                unix_socket=instance['socket'], user=instance['user'],
+                database=VERIFY_DATABASE
+            )
+            try:
+                counts = {}
+                with db.cursor() as cursor:
+                    cursor.execute("SHOW FULL TABLES WHERE Table_type = 'BASE TABLE'")
+                    for table, _ in cursor.fetchall():
+                        cursor.execute(f'SELECT COUNT(*) FROM `{table}`')
+                        counts[table] = cursor.fetchone()[0]
+                return counts
+            finally:
+                db.close()
+
+        result['row_counts'] = await asyncio.to_thread(count_rows)
+
+async def verify_mongodb(conn: dict, artifact_path: str, result: dict):
+    """Проверка MongoDB: mongorestore в локальный mongod"""
+    mongorestore = find_binary('mongorestore')
+    if not mongorestore:
+        raise RuntimeError("mongorestore не найден на хосте")
+
+    async with local_mongo() as instance:
+        target = dict(instance, db_type='mongo')
+        started = time.perf_counter()
+        success, message = await restore_backup(target, artifact_path)
+        if not success:
+            raise RuntimeError(message)
+        result['restore_seconds'] = time.perf_counter() - started
+
+        def count_documents():
+            client = pymongo.MongoClient(host=instance['host'], port=instance['port'])
+            try:
+                db = client[conn['database']]
+                return {
+                    name: db[name].count_documents({})
+                    for name in db.list_collection_names()
+                }
+            finally:
+                client.close()
+
+        result['row_counts'] = await asyncio.to_thread(count_documents)
+
+async def perform_restore_verification(bot):
+    """Проверка восстановления последних бэкапов всех включенных подключений"""
+    admin_id = int(os.getenv('ADMIN_ID'))
+    backup_dir = os.getenv('BACKUP_DIR', './backups')
+
+    connections = await get_enabled_connections()
+    if not connections:
+        return
+
+    report_message = "🧪 Проверка восстановления бэкапов:\n\n"
+
+    for conn in connections:
+        artifact_path = find_latest_artifact(backup_dir, conn['name'])
+        if not artifact_path:
+            report_message += f"⚪ {conn['name']} - нет бэкапов\n"
+            continue
+
+        success, result = await verify_backup(conn, artifact_path)
+        await log_verification(
+            conn['id'], artifact_path, success,
+            result['restore_seconds'], result['row_counts'], result['error']
+        )
+
+        if success:
+            total_rows = sum(result['row_counts'].values())
+            report_message += (
+                f"✅ {conn['name']} - {result['restore_seconds']:.1f} с, "
+                f"таблиц: {len(result['row_counts'])}, строк: {total_rows}\n"
+            )
+            logger.info(f"Проверка восстановления успешна: {conn['name']}")
+        else:
+            report_message += f"❌ {conn['name']} - {result['error']}\n"
+            logger.error(f"Ошибка проверки восстановления {conn['name']}: {result['error']}")
+
+    try:
+        await bot.send_message(admin_id, report_message)
+    except Exception as e:
+        logger.error(f"Ошибка отправки отчета проверки восстановления: {e}")
@@ -1,12 +1,19 @@
 import os
+import time
 import logging
 import asyncio
+from typing import Any, AsyncIterator, Dict, List, Tuple
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from datetime import datetime
 
-from utils.db import get_enabled_connections, log_backup, get_enabled_backup_server
+from utils.db import get_enabled_connections, get_enabled_backup_servers
 from utils.backup_transfer import backup_transfer
+from utils.restore import read_local_file
+from utils.restore_verify import perform_restore_verification
+from utils.artifacts import artifact_size
+from utils.jobs import job_manager
+from utils.tracing import tracer
 from .backup_psql import backup_postgresql
 from .backup_mysql import backup_mysql
 from .backup_sqlite import backup_sqlite
@@ -14,19 +21,36 @@ from .backup_mongo import backup_mongodb
 
 logger = logging.getLogger(__name__)
 
+# Частей файла в очереди каждого резервного сервера: медленный сервер притормаживает чтение, а не копит память
+TEE_QUEUE_SIZE = 8
 
+# Пауза перед повторной загрузкой на сервер, где загрузка не удалась
+UPLOAD_RETRY_DELAY = 5
+
+def get_upload_retries() -> int:
+    """Число повторных попыток загрузки на каждый резервный сервер"""
+    return max(0, int(os.getenv('BACKUP_UPLOAD_RETRIES', '2')))
 
 async def upload_to_backup_server(local_file_path: str, backup_server: dict) -> bool:
     """Загрузка бэкапа на резервный сервер"""
+    size = artifact_size(local_file_path)
+    with tracer.span('upload', host=backup_server['host'], file=os.path.basename(local_file_path), bytes=size) as span:
+        success = await _upload_to_backup_server(local_file_path, backup_server)
+        if not success:
+            span.fail("загрузка не удалась")
+    return success
+
+async def _upload_to_backup_server(local_file_path: str, backup_server: dict) -> bool:
     try:
         # Подключаемся к резервному серверу
-        success, message = await backup_transfer.connect(
-            server_id=backup_server['id'],
-            host=backup_server['host'],
-            port=backup_server['port'],
-            username=backup_server['username'],
-            password=backup_server['password']
-        )
+        with tracer.span('ssh_connect', host=backup_server['host'], port=backup_server['port']):
+            success, message = await backup_transfer.connect(
+                server_id=backup_server['id'],
+                host=backup_server['host'],
+                port=backup_server['port'],
+                username=backup_server['username'],
+                password=backup_server['password']
+            )
         
         if not success:
             logger.error(f"Ошибка подключения к резервному серверу: {message}")
@@ -53,91 +77,217 @@ async def upload_to_backup_server(local_file_path: str, backup_server: dict) ->
         logger.error(f"Неожиданная ошибка при загрузке на резервный сервер: {e}")
         return False
 
+async def _upload_stream(backup_server: dict, chunks: AsyncIterator[bytes], file_name: str) -> Tuple[bool, str]:
+    """Загрузка потока на один резервный сервер: подключение, запись, закрытие"""
+    try:
+        with tracer.span('ssh_connect', host=backup_server['host'], port=backup_server['port']):
+            success, message = await backup_transfer.connect(
+                server_id=backup_server['id'],
+                host=backup_server['host'],
+                port=backup_server['port'],
+                username=backup_server['username'],
+                password=backup_server['password']
+            )
+        if not success:
+            return False, message
+        try:
+            return await backup_transfer.upload_stream(backup_server['id'], chunks, file_name, backup_server['remote_path'])
+        finally:
+            await backup_transfer.close_connection(backup_server['id'])
+    except Exception as e:
+        return False, f"❌ Неожиданная ошибка: {str(e)}"
+
+async def _tee_upload(local_file_path: str, backup_servers: List[dict]) -> List[Tuple[bool, str, float]]:
+    """Одно чтение файла раздается параллельным загрузкам на все серверы"""
+    file_name = os.path.basename(local_file_path)
+    queues = [asyncio.Queue(maxsize=TEE_QUEUE_SIZE) for _ in backup_servers]
+    active = [True] * len(backup_servers)
+
+    async def feed(queue: asyncio.Queue) -> AsyncIterator[bytes]:
+        while True:
+            chunk = await queue.get()
+            if chunk is None:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    async def upload(index: int, backup_server: dict) -> Tuple[bool, str, float]:
+        started = time.monotonic()
+        with tracer.span('upload', host=backup_server['host'], file=file_name) as span:
+            try:
+                success, message = await _upload_stream(backup_server, feed(queues[index]), file_name)
+            finally:
+                # Чтение файла больше не ждет этот сервер
+                active[index] = False
+                while not queues[index].empty():
+                    queues[index].get_nowait()
+            if not success:
+                span.fail(message)
+        return success, message, time.monotonic() - started
+
+    async def read():
+        end = None
+        try:
+            async for chunk in read_local_file(local_file_path):
+                for index, queue in enumerate(queues):
+                    if active[index]:
+                        await queue.put(chunk)
+        except Exception as e:
+            end = e
+        for index, queue in enumerate(queues):
+            if active[index]:
+                await queue.put(end)
+
+    uploads = [asyncio.create_task(upload(index, server)) for index, server in enumerate(backup_servers)]
+    await asyncio.gather(read(), *uploads)
+    return [task.result() for task in uploads]
+
+async def upload_to_backup_servers(local_file_path: str, backup_servers: List[dict]) -> List[Dict[str, Any]]:
+    """Загрузка бэкапа на все включенные резервные серверы.
+
+    Файл читается с диска один раз, и каждая часть раздается параллельным
+    загрузкам. Сервер, на который загрузка не удалась, получает свои
+    повторные попытки; итог возвращается по каждому серверу.
+    """
+    size = artifact_size(local_file_path)
+    with tracer.span('upload_fanout', servers=len(backup_servers), file=os.path.basename(local_file_path), bytes=size):
+        results = []
+        for server, (success, message, seconds) in zip(backup_servers, await _tee_upload(local_file_path, backup_servers)):
+            results.append({
+                'server': server['name'], 'uploaded': success, 'attempts': 1,
+                'seconds': seconds, 'error': None if success else message
+            })
+
+        async def retry(server: dict, result: Dict[str, Any]):
+            for _ in range(get_upload_retries()):
+                await asyncio.sleep(UPLOAD_RETRY_DELAY)
+                result['attempts'] += 1
+                started = time.monotonic()
+                with tracer.span('upload', host=server['host'], attempt=result['attempts']) as span:
+                    success, message = await _upload_stream(server, read_local_file(local_file_path), os.path.basename(local_file_path))
+                    if not success:
+                        span.fail(message)
+                result['seconds'] = time.monotonic() - started
+                if success:
+                    result['uploaded'], result['error'] = True, None
+                    return
+                result['error'] = message
+
+        await asyncio.gather(*(
+            retry(server, result) for server, result in zip(backup_servers, results) if not result['uploaded']
+        ))
+
+    for result in results:
+        if result['uploaded']:
+            logger.info(f"Бэкап загружен на {result['server']}: {os.path.basename(local_file_path)}")
+        else:
+            logger.error(f"Ошибка загрузки на {result['server']} (попыток: {result['attempts']}): {result['error']}")
+    return results
+
 async def perform_auto_backup(bot):
     """Выполнение автоматического бэкапа для всех включенных подключений"""
-    admin_id = int(os.getenv('ADMIN_ID'))
-    backup_dir = os.getenv('BACKUP_DIR', './backups')
+    with tracer.span('auto_backup', root=True) as run_span:
+        admin_id = int(os.getenv('ADMIN_ID'))
     
-    connections = await get_enabled_connections()
-    backup_server = await get_enabled_backup_server()
+        connections = await get_enabled_connections()
+        backup_servers = await get_enabled_backup_servers()
     
-    if not connections:
-        logger.info("Нет включенных подключений для автобэкапа")
-        return
+        run_span.set_attributes(connections=len(connections), backup_servers=[server['host'] for server in backup_servers])
+        if not connections:
+            logger.info("Нет включенных подключений для автобэкапа")
+            return
     
-    success_count = 0
-    error_count = 0
-    backup_success_count = 0
-    report_message = "📊 Отчет автобэкапа:\n\n"
+        # Бот - координатор: бэкапы и загрузку выполняют воркеры (в том числе на других узлах
+        # по меткам подключений), бот только ждет итогов в очереди
+        with tracer.span('wait_workers') as wait_span:
+            jobs = []
+            for conn in connections:
+                job, _ = await job_manager.submit(conn, upload=True)
+                jobs.append(job)
+            wait_span.set_attribute('jobs', [job.id for job in jobs])
+            await asyncio.gather(*(job.done.wait() for job in jobs))
     
-    for conn in connections:
-        try:
-            success, result = await perform_single_backup(conn, backup_dir)
-            
-            await log_backup(conn['id'], success, result if not success else None)
-            
-            if success:
-                success_count += 1
-                report_message += f"✅ {conn['name']} - Успешно\n"
-                logger.info(f"Автобэкап успешен: {conn['name']}")
-                
-                # Если есть резервный сервер, загружаем туда
-                if backup_server:
-                    backup_success = await upload_to_backup_server(result, backup_server)
-                    if backup_success:
-                        backup_success_count += 1
-                        report_message += f"  📦 Загружено на резервный сервер\n"
+        results = []
+        for job in jobs:
+            name = job.connection['name']
+            node = f" ({job.worker})" if job.worker else ""
+            if job.status == 'done':
+                report = f"✅ {name} - Успешно{node}\n"
+                # Итог загрузки по каждому резервному серверу
+                for upload in job.uploads:
+                    if upload['uploaded']:
+                        attempts = f" (попытка {upload['attempts']})" if upload['attempts'] > 1 else ""
+                        report += f"  📦 {upload['server']}: загружено{attempts}\n"
                     else:
-                        report_message += f"  ❌ Ошибка загрузки на резервный сервер\n"
-                
+                        error = upload['error'].replace('❌ ', '')
+                        report += f"  ❌ {upload['server']}: {error} (попыток: {upload['attempts']})\n"
+                results.append((True, bool(job.uploaded), report))
             else:
-                error_count += 1
-                report_message += f"❌ {conn['name']} - Ошибка: {result}\n"
-                logger.error(f"Ошибка автобэкапа {conn['name']}: {result}")
-                
-        except Exception as e:
-            error_count += 1
-            error_msg = f"Неожиданная ошибка: {str(e)}"
-            await log_backup(conn['id'], False, error_msg)
-            report_message += f"❌ {conn['name']} - Ошибка: {error_msg}\n"
-            logger.error(f"Неожиданная ошибка автобэкапа {conn['name']}: {e}")
+                logger.error(f"Ошибка автобэкапа {name}: {job.result}")
+                results.append((False, False, f"❌ {name} - Ошибка{node}: {job.result}\n"))
     
-    if backup_server and success_count > 0:
-        report_message += f"\n📦 Резервное копирование: {backup_success_count}/{success_count} успешно"
+        success_count = sum(1 for success, _, _ in results if success)
+        error_count = len(results) - success_count
+        backup_success_count = sum(1 for _, uploaded, _ in results if uploaded)
+        report_message = "📊 Отчет автобэкапа:\n\n"
+        report_message += "".join(report for _, _, report in results)
     
-    report_message += f"\n\nИтого: ✅ {success_count} | ❌ {error_count}"
+        if backup_servers and success_count > 0:
+            for server in backup_servers:
+                uploaded = sum(
+                    1 for job in jobs for upload in job.uploads
+                    if upload['server'] == server['name'] and upload['uploaded']
+                )
+                report_message += f"\n📦 {server['name']}: {uploaded}/{success_count} загружено"
     
-    # Отправка отчета админу
-    try:
-        await bot.send_message(admin_id, report_message)
-    except Exception as e:
-        logger.error(f"Ошибка отправки отчета админу: {e}")
+        report_message += f"\n\nИтого: ✅ {success_count} | ❌ {error_count}"
+    
+        run_span.set_attributes(succeeded=success_count, failed=error_count, uploaded=backup_success_count)
+    
+        # Отправка отчета админу
+        with tracer.span('notify', chat_id=admin_id) as notify_span:
+            try:
+                await bot.send_message(admin_id, report_message)
+            except Exception as e:
+                notify_span.fail(str(e))
+                logger.error(f"Ошибка отправки отчета админу: {e}")
 
-async def perform_single_backup(conn, backup_dir):
+async def perform_single_backup(conn, backup_dir, job=None):
     """Выполнение бэкапа для одного подключения"""
+    with tracer.span('dump', connection_id=conn.get('id'), name=conn['name'], db_type=conn['db_type']) as span:
+        # Метрики записывает бот по итогам задачи (JobManager), воркер их не отдает
+        success, result = await _perform_single_backup(conn, backup_dir, job)
+        if success:
+            span.set_attributes(bytes=artifact_size(result), file=os.path.basename(result))
+        else:
+            span.fail(result)
+    return success, result
+
+async def _perform_single_backup(conn, backup_dir, job=None):
     db_type = conn['db_type']
     
     if db_type == 'psql':
         return await backup_postgresql(
             conn['host'], conn['port'], conn['database'],
-            conn['user'], conn['password'], backup_dir, conn['name']
+            conn['user'], conn['password'], backup_dir, conn['name'], job
         )
     elif db_type == 'mysql':
         return await backup_mysql(
             conn['host'], conn['port'], conn['database'],
-            conn['user'], conn['password'], backup_dir, conn['name']
+            conn['user'], conn['password'], backup_dir, conn['name'], job
         )
     elif db_type == 'sqlite':
         # Для SQLite передаем SSH параметры если они есть
         return await backup_sqlite(
             conn['file_path'], backup_dir, conn['name'],
             conn.get('ssh_host'), conn.get('ssh_port', 22),
-            conn.get('ssh_user'), conn.get('ssh_password')
+            conn.get('ssh_user'), conn.get('ssh_password'), job
         )
     elif db_type == 'mongo':
         return await backup_mongodb(
             conn['host'], conn['port'], conn['database'],
-            conn['user'], conn['password'], backup_dir, conn['name']
+            conn['user'], conn['password'], backup_dir, conn['name'], job
         )
     else:
         return False, f"Неизвестный тип БД: {db_type}"
@@ -154,6 +304,16 @@ async def setup_scheduler(bot):
         id='auto_backup'
     )
     
+    # Проверка восстановления последних бэкапов ежедневно в 04:00
+    if os.getenv('RESTORE_VERIFY_ENABLED', 'true').lower() == 'true':
+        scheduler.add_job(
+            perform_restore_verification,
+            trigger=CronTrigger(hour=4, minute=0),
+            args=[bot],
+            id='restore_verify'
+        )
+        logger.info("Проверка восстановления бэкапов включена (ежедневно в 04:00)")
+    
     scheduler.start()
     logger.info("Планировщик автобэкапов запущен (ежедневно в 02:00)")
 
@@ -1,33 +1,204 @@
+import re
+import time
+import shlex
 import asyncio
-import asyncssh
-from typing import Tuple, Optional
+import logging
+import secrets
+from typing import Tuple, Optional, Callable
 import os
 
+from utils.ssh_pool import ssh_manager, get_command_timeout
+from utils.metrics import ssh_command_duration
+from utils.lazy import lazy_import
+
+asyncssh = lazy_import('asyncssh')
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждем готовности оболочки после открытия
+SHELL_START_TIMEOUT = 15
+
+# Паузы между попытками переподключения растут вдвое до максимума
+RECONNECT_BASE_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+
+# Escape-последовательности терминала (цвета, перемещение курсора)
+ANSI_ESCAPE_RE = re.compile(r'\x1b\[[0-?]*[ -/]*[@-~]|\x1b\][^\x07]*\x07|\x1b[@-Z\\-_]')
+
+def clean_output(text: str) -> str:
+    """Вывод терминала без escape-последовательностей и возвратов каретки"""
+    return ANSI_ESCAPE_RE.sub('', text).replace('\r', '')
+
+class ShellSession:
+    """Долгоживущая оболочка с PTY: команды выполняются в одном процессе, окружение и cwd сохраняются"""
+
+    def __init__(self, conn: 'asyncssh.SSHClientConnection', process: 'asyncssh.SSHClientProcess'):
+        self.conn = conn
+        self.process = process
+        self.lock = asyncio.Lock()
+        self.buffer = ""
+        self.closed = False
+
+    @classmethod
+    async def open(cls, conn: 'asyncssh.SSHClientConnection', initial_dir: str = None) -> 'ShellSession':
+        """Запуск оболочки и отключение эха, приглашения и цветного вывода"""
+        process = await conn.create_process(
+            term_type='dumb',
+            term_size=(200, 50),
+            encoding='utf-8',
+            errors='replace'
+        )
+        session = cls(conn, process)
+
+        # Эхо отключается и в терминале, и в редакторе строки bash/zsh; history expansion - чтобы "!" не раскрывался
+        setup = (
+            "stty -echo 2>/dev/null; set +o emacs 2>/dev/null; set +o vi 2>/dev/null; set +H 2>/dev/null; "
+            "unsetopt zle 2>/dev/null; unset PROMPT_COMMAND; PS1=''; PS2=''; export TERM=dumb PAGER=cat"
+        )
+        if initial_dir and initial_dir != "~":
+            setup += f"; cd {shlex.quote(initial_dir)} 2>/dev/null"
+        # Вывод настройки (приветствие, эхо до stty) отбрасывается
+        await session.run(setup, timeout=SHELL_START_TIMEOUT)
+        return session
+
+    async def run(
+        self,
+        command: str,
+        timeout: Optional[float] = None,
+        on_output: Optional[Callable[[str], None]] = None
+    ) -> Tuple[int, str, str]:
+        """Выполнение команды: (код возврата, текущая директория, вывод).
+
+        С on_output вывод передается частями по мере поступления и не накапливается,
+        а возвращаемый вывод пуст.
+        """
+        async with self.lock:
+            if self.closed:
+                raise ConnectionError("Оболочка закрыта")
+
+            # Вывод обрамляется маркерами; каждый печатается из двух частей, чтобы эхо команды их не содержало.
+            # Команда и маркеры отправляются одной составной командой: оболочка читает ее целиком
+            # до выполнения, поэтому возможное эхо ввода оказывается до начального маркера
+            token = secrets.token_hex(8)
+            start_marker = re.compile(rf'__BACKUPBOT_{token}__S\r?\n')
+            end_marker = re.compile(rf'\r?\n?__BACKUPBOT_{token}__E:(-?\d+):([^\r\n]*)\r?\n')
+            end_prefix = f'__BACKUPBOT_{token}__E'
+            self.process.stdin.write(
+                f"printf '%s%s\\n' '__BACKUPBOT_' '{token}__S'; {{ {command}\n}} </dev/null; "
+                f"printf '\\n%s%s:%s:%s\\n' '__BACKUPBOT_' '{token}__E' \"$?\" \"$PWD\"\n"
+            )
+
+            try:
+                match, output = await asyncio.wait_for(
+                    self._read_output(start_marker, end_marker, end_prefix, on_output),
+                    timeout=timeout
+                )
+            except BaseException:
+                # Состояние оболочки неизвестно (команда еще идет) - следующая команда откроет новую
+                self.close()
+                raise
+
+            return int(match.group(1)), match.group(2), output.strip()
+
+    async def _read_output(
+        self,
+        start_marker: re.Pattern,
+        end_marker: re.Pattern,
+        end_prefix: str,
+        on_output: Optional[Callable[[str], None]]
+    ) -> Tuple[re.Match, str]:
+        """Чтение до конечного маркера: (маркер, вывод между маркерами)"""
+        begin = None
+        while True:
+            if begin is None:
+                start = start_marker.search(self.buffer)
+                if start:
+                    begin = start.end()
+
+            match = end_marker.search(self.buffer, begin or 0)
+            if match:
+                output = clean_output(self.buffer[begin or 0:match.start()])
+                self.buffer = self.buffer[match.end():]
+                if on_output is None:
+                    return match, output
+                if output:
+                    on_output(output)
+                return match, ""
+
+            if on_output is not None and begin is not None:
+                # Придерживаем хвост, в котором может начинаться маркер или escape-последовательность
+                safe = len(self.buffer)
+                marker_at = self.buffer.find(end_prefix, begin)
+                if marker_at != -1:
+                    safe = marker_at - 2
+                else:
+                    for size in range(min(len(end_prefix), safe - begin), 0, -1):
+                        if end_prefix.startswith(self.buffer[-size:]):
+                            safe -= size
+                            break
+                escape_at = self.buffer.rfind('\x1b', begin)
+                if escape_at != -1 and escape_at > safe - 32:
+                    safe = min(safe, escape_at)
+                if safe > begin:
+                    on_output(clean_output(self.buffer[begin:safe]))
+                    self.buffer = self.buffer[safe:]
+                    begin = 0
+
+            chunk = await self.process.stdout.read(65536)
+            if not chunk:
+                self.closed = True
+                raise ConnectionError("Оболочка завершилась")
+            self.buffer += chunk
+
+    def close(self):
+        """Завершение оболочки"""
+        self.closed = True
+        try:
+            self.process.close()
+        except Exception:
+            pass
+
 class SSHClient:
     def __init__(self):
         self.connections = {}
         self.current_dirs = {}
-    
+        # Параметры подключения для прозрачного переподключения
+        self.params = {}
+        # Постоянные оболочки по серверам
+        self.shells = {}
+        # Серверы, соединение с которыми разорвано (по сообщению asyncssh)
+        self.lost = set()
+        # Неудачные переподключения подряд и время, раньше которого новая попытка не делается
+        self.reconnect_failures = {}
+        self.retry_at = {}
+        ssh_manager.add_lost_listener(self._on_connection_lost)
+
+    def _on_connection_lost(self, conn: 'asyncssh.SSHClientConnection'):
+        """Разрыв соединения: оболочка закрывается, следующая команда переподключится"""
+        for server_id, server_conn in list(self.connections.items()):
+            if server_conn is conn:
+                self.lost.add(server_id)
+                self.close_shell(server_id)
+                logger.info(f"SSH сессия сервера {server_id} потеряла соединение")
+
     async def connect(self, server_id: int, host: str, port: int, username: str, password: str) -> Tuple[bool, str]:
         """Подключение к SSH серверу"""
         try:
-            conn = await asyncssh.connect(
-                host=host,
-                port=port,
-                username=username,
-                password=password,
-                known_hosts=None
-            )
+            # Соединение берется из общего пула: бэкапы и команды идут каналами поверх него
+            conn = await ssh_manager.acquire(host, port, username, password)
+            if server_id in self.connections:
+                ssh_manager.release(self.connections[server_id])
+            self.close_shell(server_id)
             self.connections[server_id] = conn
-            
-            # Получаем начальную директорию
-            result = await conn.run("pwd")
-            if result.exit_status == 0:
-                initial_dir = result.stdout.strip()
-                self.current_dirs[server_id] = initial_dir
-            else:
-                self.current_dirs[server_id] = "~"
-            
+            self.params[server_id] = (host, port, username, password)
+            self.current_dirs[server_id] = "~"
+            self._reset_reconnect(server_id)
+
+            # Запускаем оболочку и получаем начальную директорию
+            shell = await self.get_shell(server_id)
+            _, initial_dir, _ = await shell.run("true", timeout=SHELL_START_TIMEOUT)
+            self.current_dirs[server_id] = initial_dir or "~"
+
             return True, "✅ Подключение успешно установлено"
         except asyncssh.PermissionDenied:
             return False, "❌ Ошибка аутентификации: неверный логин или пароль"
@@ -37,120 +208,138 @@ class SSHClient:
             return False, f"❌ Ошибка подключения: {str(e)}"
         except Exception as e:
             return False, f"❌ Неизвестная ошибка: {str(e)}"
-    
-    async def execute_command(self, server_id: int, command: str) -> Tuple[bool, str, str]:
-        """Выполнение команды на SSH сервере"""
+
+    def _reset_reconnect(self, server_id: int):
+        self.lost.discard(server_id)
+        self.reconnect_failures.pop(server_id, None)
+        self.retry_at.pop(server_id, None)
+
+    async def get_connection(self, server_id: int) -> 'asyncssh.SSHClientConnection':
+        """Соединение сервера; если оно разорвано - переподключение через пул с нарастающей паузой"""
+        conn = self.connections[server_id]
+        if server_id not in self.lost and not conn.is_closed():
+            return conn
+
+        # Недоступный сервер не держит каждую команду на таймауте подключения
+        wait = self.retry_at.get(server_id, 0) - time.monotonic()
+        if wait > 0:
+            raise ConnectionError(f"Сервер недоступен, повторное подключение через {wait:.0f} с")
+
+        try:
+            new_conn = await ssh_manager.acquire(*self.params[server_id])
+        except Exception as e:
+            failures = self.reconnect_failures.get(server_id, 0) + 1
+            self.reconnect_failures[server_id] = failures
+            delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** (failures - 1))
+            self.retry_at[server_id] = time.monotonic() + delay
+            logger.warning(f"Переподключение к серверу {server_id} не удалось ({failures}): {e}")
+            raise ConnectionError(f"Не удалось переподключиться: {e}") from e
+
+        ssh_manager.release(conn)
+        self.connections[server_id] = new_conn
+        self._reset_reconnect(server_id)
+        logger.info(f"SSH сессия сервера {server_id} переподключена")
+        return new_conn
+
+    async def get_shell(self, server_id: int) -> ShellSession:
+        """Постоянная оболочка сервера; после разрыва или таймаута открывается новая в прежней директории"""
+        conn = await self.get_connection(server_id)
+        shell = self.shells.get(server_id)
+        if shell is None or shell.closed or shell.conn is not conn:
+            if shell:
+                shell.close()
+            shell = await ShellSession.open(conn, self.current_dirs.get(server_id))
+            self.shells[server_id] = shell
+        return shell
+
+    def close_shell(self, server_id: int):
+        """Завершение оболочки сервера"""
+        shell = self.shells.pop(server_id, None)
+        if shell:
+            shell.close()
+
+    async def execute_command(
+        self,
+        server_id: int,
+        command: str,
+        timeout: Optional[float] = None,
+        on_output: Optional[Callable[[str], None]] = None
+    ) -> Tuple[bool, str, str]:
+        """Выполнение команды на SSH сервере (с on_output - с потоковой передачей вывода).
+
+        Без явного timeout действует SSH_COMMAND_TIMEOUT: зависший сервер не блокирует сессию.
+        """
         if server_id not in self.connections:
             return False, "", "❌ SSH соединение не установлено"
-        
+
+        if timeout is None:
+            timeout = get_command_timeout()
+
+        current_dir = self.current_dirs.get(server_id, "~")
+        started = time.monotonic()
         try:
-            conn = self.connections[server_id]
-            current_dir = self.current_dirs.get(server_id, "~")
-            
-            # Если команда - смена директории
-            if command.strip().startswith('cd '):
-                # Извлекаем путь из команды cd
-                path = command.strip()[3:].strip()
-                if path:
-                    # Обновляем текущую директорию
-                    if path.startswith('/'):
-                        # Абсолютный путь
-                        new_dir = path
-                    else:
-                        # Относительный путь
-                        if current_dir == "~":
-                            # Если текущая директория неизвестна, используем домашнюю
-                            result = await conn.run("echo $HOME")
-                            home_dir = result.stdout.strip() if result.exit_status == 0 else "/root"
-                            new_dir = os.path.join(home_dir, path)
-                        else:
-                            new_dir = os.path.join(current_dir, path)
-                    
-                    # Нормализуем путь
-                    new_dir = os.path.normpath(new_dir)
-                    self.current_dirs[server_id] = new_dir
-                    
-                    return True, new_dir, f"Директория изменена на: {new_dir}"
-                else:
-                    return False, current_dir, "❌ Не указан путь для cd"
-            
-            # Для обычных команд используем текущую директорию
-            # Выполняем команду в текущей директории
-            if current_dir != "~":
-                # Если известна текущая директория, добавляем cd перед командой
-                full_command = f"cd {current_dir} && {command}"
-                result = await conn.run(full_command)
-            else:
-                result = await conn.run(command)
-            
-            if result.exit_status == 0:
-                output = result.stdout.strip() if result.stdout else ""
-                stderr = result.stderr.strip() if result.stderr else ""
-                full_output = f"{output}\n{stderr}".strip()
-                return True, current_dir, full_output
+            # Переподключение и запуск оболочки входят в тот же таймаут, что и команда
+            exit_status, current_dir, output = await asyncio.wait_for(
+                self._run(server_id, command, on_output), timeout=timeout
+            )
+            ssh_command_duration.observe(time.monotonic() - started, kind='shell', status='ok')
+            self.current_dirs[server_id] = current_dir
+
+            if exit_status == 0:
+                return True, current_dir, output
             else:
-                error_msg = result.stderr.strip() if result.stderr else "Команда завершилась с ошибкой"
+                error_msg = output or f"Команда завершилась с кодом {exit_status}"
                 return False, current_dir, f"❌ {error_msg}"
-                
-        except asyncssh.Error as e:
-            return False, "", f"❌ Ошибка выполнения команды: {str(e)}"
+
+        except asyncio.TimeoutError:
+            ssh_command_duration.observe(time.monotonic() - started, kind='shell', status='timeout')
+            return False, current_dir, "❌ Таймаут выполнения команды"
+        except (asyncssh.Error, ConnectionError) as e:
+            ssh_command_duration.observe(time.monotonic() - started, kind='shell', status='error')
+            return False, current_dir, f"❌ Ошибка выполнения команды: {str(e)}"
         except Exception as e:
-            return False, "", f"❌ Неизвестная ошибка: {str(e)}"
-    
+            ssh_command_duration.observe(time.monotonic() - started, kind='shell', status='error')
+            return False, current_dir, f"❌ Неизвестная ошибка: {str(e)}"
+
+    async def _run(self, server_id: int, command: str, on_output: Optional[Callable[[str], None]]) -> Tuple[int, str, str]:
+        shell = await self.get_shell(server_id)
+        return await shell.run(command, on_output=on_output)
+
     async def close_connection(self, server_id: int) -> bool:
         """Закрытие SSH соединения"""
         try:
+            self.close_shell(server_id)
+
             if server_id in self.connections:
-                self.connections[server_id].close()
-                del self.connections[server_id]
-            
+                # Транспорт остается в пуле для других пользователей и закроется по простою
+                ssh_manager.release(self.connections.pop(server_id))
+
+            self.params.pop(server_id, None)
+            self._reset_reconnect(server_id)
+
             if server_id in self.current_dirs:
                 del self.current_dirs[server_id]
-            
+
             return True
         except:
             return False
-    
+
     async def execute_command_with_timeout(self, server_id: int, command: str, timeout: int = 30) -> Tuple[bool, str, str]:
         """Выполнение команды с таймаутом"""
-        if server_id not in self.connections:
-            return False, "", "❌ SSH соединение не установлено"
-        
-        try:
-            conn = self.connections[server_id]
-            current_dir = self.current_dirs.get(server_id, "~")
-            
-            # Выполняем команду с таймаутом
-            if current_dir != "~":
-                full_command = f"cd {current_dir} && {command}"
-            else:
-                full_command = command
-                
-            result = await asyncio.wait_for(conn.run(full_command), timeout=timeout)
-            
-            if result.exit_status == 0:
-                output = result.stdout.strip() if result.stdout else ""
-                stderr = result.stderr.strip() if result.stderr else ""
-                full_output = f"{output}\n{stderr}".strip()
-                return True, current_dir, full_output
-            else:
-                error_msg = result.stderr.strip() if result.stderr else "Команда завершилась с ошибкой"
-                return False, current_dir, f"❌ {error_msg}"
-                
-        except asyncio.TimeoutError:
-            return False, "", "❌ Таймаут выполнения команды"
-        except asyncssh.Error as e:
-            return False, "", f"❌ Ошибка выполнения команды: {str(e)}"
-        except Exception as e:
-            return False, "", f"❌ Неизвестная ошибка: {str(e)}"
-    
+        return await self.execute_command(server_id, command, timeout=timeout)
+
     def is_connected(self, server_id: int) -> bool:
-        """Проверка активного соединения"""
+        """Проверка активного соединения (разорванное не считается активным)"""
+        conn = self.connections.get(server_id)
+        return conn is not None and server_id not in self.lost and ssh_manager.is_alive(conn)
+
+    def has_session(self, server_id: int) -> bool:
+        """Сессия открыта (соединение может восстанавливаться)"""
         return server_id in self.connections
-    
+
     def get_current_dir(self, server_id: int) -> str:
         """Получение текущей директории"""
         return self.current_dirs.get(server_id, "~")
 
 # Глобальный экземпляр SSH клиента
-ssh_client = SSHClient()
\ No newline at end of file
+ssh_client = SSHClient()
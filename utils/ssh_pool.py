@@ -0,0 +1,239 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager, suppress
+from typing import Callable, Dict, List, Tuple, Optional, AsyncIterator
+
+from utils.metrics import ssh_command_duration
+from utils.tracing import tracer
+from utils.lazy import lazy_import
+
+# asyncssh загружается при первом SSH подключении
+asyncssh = lazy_import('asyncssh')
+
+logger = logging.getLogger(__name__)
+
+# Как часто проверяются простаивающие соединения
+REAP_INTERVAL = 30
+
+def get_idle_timeout() -> int:
+    """Через сколько секунд простоя закрывается неиспользуемое соединение"""
+    return int(os.getenv('SSH_POOL_IDLE_TIMEOUT', '300'))
+
+def get_keepalive() -> Tuple[int, int]:
+    """Интервал keepalive и число пропущенных ответов, после которого соединение считается потерянным"""
+    return int(os.getenv('SSH_KEEPALIVE_INTERVAL', '15')), int(os.getenv('SSH_KEEPALIVE_COUNT_MAX', '3'))
+
+def get_command_timeout() -> Optional[float]:
+    """Таймаут команды по умолчанию (0 - без ограничения)"""
+    timeout = float(os.getenv('SSH_COMMAND_TIMEOUT', '300'))
+    return timeout or None
+
+_pool_client_class = None
+
+def _pool_client(manager: 'SSHConnectionManager') -> 'asyncssh.SSHClient':
+    """Клиент asyncssh, который сообщает пулу о разрыве соединения"""
+    global _pool_client_class
+    if _pool_client_class is None:
+        # Класс наследуется от asyncssh.SSHClient, поэтому создается при первом подключении
+        class _PoolClient(asyncssh.SSHClient):
+            def __init__(self, manager: 'SSHConnectionManager'):
+                self.manager = manager
+                self.conn: Optional['asyncssh.SSHClientConnection'] = None
+
+            def connection_made(self, conn: 'asyncssh.SSHClientConnection'):
+                self.conn = conn
+
+            def connection_lost(self, exc: Optional[Exception]):
+                if self.conn is not None:
+                    self.manager._connection_lost(self.conn, exc)
+
+        _pool_client_class = _PoolClient
+    return _pool_client_class(manager)
+
+class PooledConnection:
+    """Одно аутентифицированное SSH соединение и число его пользователей"""
+
+    def __init__(self, key: Tuple[str, int, str], password: str, conn: 'asyncssh.SSHClientConnection'):
+        self.key = key
+        self.password = password
+        self.conn = conn
+        self.users = 0
+        self.last_used = time.monotonic()
+        # Выведено из пула (сменился пароль) - закрывается после последнего пользователя
+        self.retired = False
+        # Разрыв, о котором сообщил asyncssh (в том числе по keepalive)
+        self.lost = False
+
+    @property
+    def alive(self) -> bool:
+        return not self.lost and not self.conn.is_closed()
+
+class SSHConnectionManager:
+    """Одно SSH соединение на (host, port, user): сессии и SFTP открываются каналами поверх него"""
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, int, str], PooledConnection] = {}
+        self._by_conn: Dict[int, PooledConnection] = {}
+        self._locks: Dict[Tuple[str, int, str], asyncio.Lock] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        self._lost_listeners: List[Callable[['asyncssh.SSHClientConnection'], None]] = []
+
+    async def acquire(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        connect_timeout: int = 10
+    ) -> 'asyncssh.SSHClientConnection':
+        """Получение соединения из пула (новое открывается, только если живого нет)"""
+        key = (host, int(port or 22), username)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+
+        async with lock:
+            entry = self._entries.get(key)
+            if entry and not entry.alive:
+                self._retire(entry)
+                entry = None
+
+            # Другой пароль проверяется новым подключением; старое выводится из пула только после успеха
+            if entry is None or entry.password != password:
+                keepalive_interval, keepalive_count_max = get_keepalive()
+                with tracer.span('ssh_handshake', host=host, port=key[1]):
+                    conn = await asyncssh.connect(
+                        host=host,
+                        port=key[1],
+                        username=username,
+                        password=password,
+                        known_hosts=None,
+                        connect_timeout=connect_timeout,
+                        keepalive_interval=keepalive_interval,
+                        keepalive_count_max=keepalive_count_max,
+                        client_factory=lambda: _pool_client(self)
+                    )
+                if entry:
+                    self._retire(entry)
+                entry = PooledConnection(key, password, conn)
+                self._entries[key] = entry
+                self._by_conn[id(conn)] = entry
+                logger.info(f"SSH соединение открыто: {username}@{host}:{key[1]}")
+                self._start_reaper()
+
+            entry.users += 1
+            entry.last_used = time.monotonic()
+            return entry.conn
+
+    def is_alive(self, conn: 'asyncssh.SSHClientConnection') -> bool:
+        """Соединение не разорвано"""
+        entry = self._by_conn.get(id(conn))
+        return entry.alive if entry else not conn.is_closed()
+
+    def add_lost_listener(self, callback: Callable[['asyncssh.SSHClientConnection'], None]):
+        """Подписка на разрывы соединений"""
+        self._lost_listeners.append(callback)
+
+    def _connection_lost(self, conn: 'asyncssh.SSHClientConnection', exc: Optional[Exception]):
+        entry = self._by_conn.get(id(conn))
+        # Соединения, закрытые самим пулом, уже удалены из него
+        if not entry:
+            return
+        entry.lost = True
+        logger.warning(f"SSH соединение потеряно: {entry.key[2]}@{entry.key[0]}: {exc or 'закрыто сервером'}")
+        self._retire(entry)
+        for callback in self._lost_listeners:
+            try:
+                callback(conn)
+            except Exception as e:
+                logger.error(f"Ошибка обработки разрыва SSH соединения: {e}")
+
+    def release(self, conn: 'asyncssh.SSHClientConnection'):
+        """Возврат соединения в пул"""
+        entry = self._by_conn.get(id(conn))
+        if not entry:
+            return
+        entry.users = max(0, entry.users - 1)
+        entry.last_used = time.monotonic()
+        if entry.retired and entry.users == 0:
+            self._close(entry)
+
+    @asynccontextmanager
+    async def connection(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        connect_timeout: int = 10
+    ) -> AsyncIterator['asyncssh.SSHClientConnection']:
+        """Соединение из пула на время блока"""
+        conn = await self.acquire(host, port, username, password, connect_timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    async def run(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        command: str,
+        timeout: Optional[float] = None
+    ) -> 'asyncssh.SSHCompletedProcess':
+        """Выполнение команды в новом канале; при разрыве соединения - одна повторная попытка"""
+        with ssh_command_duration.time(kind='exec'):
+            for attempt in range(2):
+                async with self.connection(host, port, username, password) as conn:
+                    try:
+                        return await conn.run(command, timeout=timeout)
+                    except (asyncssh.ConnectionLost, asyncssh.ChannelOpenError, BrokenPipeError):
+                        if attempt or not conn.is_closed():
+                            raise
+                        logger.info(f"SSH соединение с {host} разорвано, переподключение")
+
+    def _retire(self, entry: PooledConnection):
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+        entry.retired = True
+        if entry.users == 0 or not entry.alive:
+            self._close(entry)
+
+    def _close(self, entry: PooledConnection):
+        self._by_conn.pop(id(entry.conn), None)
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+        with suppress(Exception):
+            entry.conn.close()
+
+    def _start_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_idle())
+
+    async def _reap_idle(self):
+        """Закрытие соединений, которыми долго никто не пользуется"""
+        while self._entries:
+            await asyncio.sleep(REAP_INTERVAL)
+            idle_timeout = get_idle_timeout()
+            now = time.monotonic()
+            for entry in list(self._entries.values()):
+                if not entry.alive:
+                    self._retire(entry)
+                elif entry.users == 0 and now - entry.last_used > idle_timeout:
+                    logger.info(f"SSH соединение закрыто по простою: {entry.key[2]}@{entry.key[0]}")
+                    self._close(entry)
+
+    async def close_all(self):
+        """Закрытие всех соединений (при остановке бота)"""
+        if self._reaper:
+            self._reaper.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._reaper
+            self._reaper = None
+        for entry in list(self._by_conn.values()):
+            self._close(entry)
+
+# Глобальный менеджер SSH соединений
+ssh_manager = SSHConnectionManager()
@@ -2,46 +2,30 @@ import asyncio
 import subprocess
 import platform
 import re
-from typing import Tuple, Optional
+from typing import Tuple, Optional, List, Dict
 
-async def ping_server(host: str, timeout: int = 2) -> bool:
+from utils.prober import probe_hosts
+from utils.ssh_pool import ssh_manager, get_command_timeout
+
+async def ping_server(host: str, timeout: int = 2, port: int = 22) -> bool:
     """
-    БЫСТРАЯ проверка доступности сервера через ping (1 пакет)
+    БЫСТРАЯ проверка доступности сервера (ICMP из процесса бота или TCP к порту SSH)
     """
     try:
-        # Определяем параметры для разных ОС
-        if platform.system().lower() == "windows":
-            param = "-n"
-            timeout_param = "-w"
-            timeout_value = str(timeout * 1000)  # Windows в миллисекундах
-        else:
-            param = "-c"
-            timeout_param = "-W"
-            timeout_value = str(timeout)  # Linux в секундах
-        
-        # Выполняем ping с ОДНИМ пакетом и коротким таймаутом
-        process = await asyncio.create_subprocess_exec(
-            "ping", param, "1", timeout_param, timeout_value, host,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        # Ждем завершения с таймаутом
-        try:
-            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout + 1)
-            return process.returncode == 0
-        except asyncio.TimeoutError:
-            # Если процесс завис, убиваем его
-            try:
-                process.kill()
-                await process.communicate()
-            except:
-                pass
-            return False
-        
+        results = await probe_hosts([(host, port)], timeout=timeout)
+        return results.get(host) is not None
     except Exception:
         return False
 
+async def ping_servers(targets: List[Tuple[str, int]], timeout: int = 2) -> Dict[str, Optional[float]]:
+    """
+    Проверка доступности многих серверов за один таймаут: {хост: RTT в мс или None}
+    """
+    try:
+        return await probe_hosts(targets, timeout=timeout)
+    except Exception:
+        return {host: None for host, _ in targets}
+
 async def measure_ping(host: str, count: int = 4) -> Tuple[bool, Optional[float], str]:
     """
     Детальное измерение пинга до сервера (для отдельной кнопки "Пинг")
@@ -185,22 +169,13 @@ async def execute_ssh_command(host: str, port: int, username: str, password: str
     Выполнение одной команды по SSH
     """
     try:
-        import asyncssh
+        # Команда выполняется в новом канале поверх соединения из пула
+        result = await ssh_manager.run(host, port, username, password, command, timeout=get_command_timeout())
         
-        async with asyncssh.connect(
-            host=host,
-            port=port,
-            username=username,
-            password=password,
-            known_hosts=None,
-            connect_timeout=10
-        ) as conn:
-            result = await conn.run(command)
-            
-            if result.exit_status == 0:
-                return True, result.stdout or "Команда выполнена успешно"
-            else:
-                return False, result.stderr or f"Команда завершилась с кодом {result.exit_status}"
+        if result.exit_status == 0:
+            return True, result.stdout or "Команда выполнена успешно"
+        else:
+            return False, result.stderr or f"Команда завершилась с кодом {result.exit_status}"
                 
     except Exception as e:
         return False, str(e)
\ No newline at end of file
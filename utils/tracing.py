@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import logging
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+def get_settings() -> Dict[str, Any]:
+    """Куда и сколько дней хранятся трассировки"""
+    return {
+        'enabled': os.getenv('TRACING_ENABLED', 'true').lower() == 'true',
+        'dir': os.getenv('TRACE_DIR', './logs/traces'),
+        'keep_days': int(os.getenv('TRACE_KEEP_DAYS', '7')),
+    }
+
+# Текущий спан задачи; дочерние задачи asyncio наследуют его при создании
+_current_span: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar('current_span', default=None)
+
+def _current_task_id() -> Optional[int]:
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        return None
+    return id(task) if task else None
+
+class Span:
+    """Интервал работы с атрибутами; вложенные спаны ссылаются на родителя"""
+
+    def __init__(self, name: str, span_id: int, parent: Optional['Span'], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = span_id
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else span_id
+        self.attributes = dict(attributes)
+        self.task_id = _current_task_id()
+        # Дорожка на временной шкале: своя у каждой задачи asyncio
+        self.lane = 0
+        self.opens_lane = False
+        self.status = 'ok'
+        self.start_us = time.time_ns() // 1000
+        self._started = time.perf_counter()
+        self.duration_us = 0
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error: str):
+        """Ошибка без исключения (функции бота возвращают (False, сообщение))"""
+        self.status = 'error'
+        self.attributes['error'] = error
+
+    def end(self):
+        self.duration_us = int((time.perf_counter() - self._started) * 1_000_000)
+
+class Tracer:
+    """Спаны бэкапов и обработчиков с записью в файл формата Chrome Trace Event.
+
+    Файл на каждый день (JSON Array без закрывающей скобки - формат это допускает),
+    открывается в chrome://tracing или ui.perfetto.dev. Параллельные задачи
+    одной трассировки выводятся отдельными дорожками. Воркеры бэкапов пишут
+    каждый в свой файл (process_name), чтобы процессы не писали в один файл.
+
+    Завершенный спан только ставится в очередь: сериализацию и запись в файл
+    выполняет отдельный поток (как QueueHandler в logging), цикл событий не ждет диска.
+    """
+
+    def __init__(self, process_name: Optional[str] = None):
+        self.process_name = process_name
+        self._ids = itertools.count(1)
+        self._lanes = itertools.count(1)
+        self._file = None
+        self._file_date = None
+        self._queue = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, /, root: bool = False, **attributes) -> Iterator[Span]:
+        """Спан вокруг блока; root=True начинает новую трассировку даже внутри другого спана"""
+        parent = None if root else _current_span.get()
+        span = Span(name, next(self._ids), parent, attributes)
+        if parent is not None and parent.task_id == span.task_id:
+            span.lane = parent.lane
+        else:
+            span.lane = next(self._lanes)
+            span.opens_lane = True
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = 'error'
+            span.attributes.setdefault('error', f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+            self._export(span)
+
+    def current(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def _export(self, span: Span):
+        settings = get_settings()
+        if not settings['enabled']:
+            return
+
+        events = []
+        if span.opens_lane:
+            # Спан начался в новой задаче: подпись дорожки
+            root = span
+            while root.parent is not None:
+                root = root.parent
+            label = span.name if root is span else f"{root.name} #{root.span_id} / {span.name}"
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': span.lane, 'args': {'name': label}})
+        events.append({
+            'name': span.name,
+            'cat': span.status,
+            'ph': 'X',
+            'ts': span.start_us,
+            'dur': span.duration_us,
+            'pid': os.getpid(),
+            'tid': span.lane,
+            'args': {
+                'trace_id': span.trace_id,
+                'span_id': span.span_id,
+                'parent_id': span.parent.span_id if span.parent else None,
+                'status': span.status,
+                **span.attributes,
+            },
+        })
+
+        self._start_writer()
+        self._queue.put((settings, events))
+
+    def _start_writer(self):
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_events, name='tracer', daemon=True)
+                self._writer.start()
+
+    def _write_events(self):
+        """Поток записи: события из очереди в файл, сброс на диск, когда очередь опустела"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            settings, events = item
+            try:
+                output = self._open(settings)
+                for event in events:
+                    output.write(json.dumps(event, ensure_ascii=False, default=str) + ",\n")
+                if self._queue.empty():
+                    output.flush()
+            except OSError as e:
+                logger.error(f"Ошибка записи трассировки: {e}")
+
+    def _open(self, settings: Dict[str, Any]):
+        today = datetime.now().date()
+        if self._file is not None and self._file_date == today:
+            return self._file
+
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(settings['dir'], exist_ok=True)
+        suffix = f"_{self.process_name}" if self.process_name else ""
+        path = os.path.join(settings['dir'], f"trace_{today.isoformat()}{suffix}.json")
+        is_new = not os.path.exists(path)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._file_date = today
+        if is_new:
+            self._file.write("[\n")
+            self._remove_old(settings, today)
+        return self._file
+
+    def _remove_old(self, settings: Dict[str, Any], today):
+        border = (today - timedelta(days=settings['keep_days'])).isoformat()
+        for file_name in os.listdir(settings['dir']):
+            if file_name.startswith('trace_') and file_name.endswith('.json') and file_name[6:16] < border:
+                try:
+                    os.remove(os.path.join(settings['dir'], file_name))
+                except OSError as e:
+                    logger.warning(f"Не удалось удалить старую трассировку {file_name}: {e}")
+
+    def close(self):
+        """Запись оставшихся в очереди спанов и закрытие файла"""
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class TracingMiddleware(BaseMiddleware):
+    """Корневой спан на каждый обработчик aiogram"""
+
+    def __init__(self, event: str):
+        self.event = event
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        user = getattr(event, 'from_user', None)
+        with tracer.span(f"handler:{name}", root=True, event=self.event, user_id=user.id if user else None):
+            return await handler(event, data)
+
+# Глобальный трассировщик
+tracer = Tracer()
@@ -0,0 +1,185 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, List, Set
+
+from utils.artifacts import find_latest_artifact, artifact_size
+from utils.process_runner import get_limits
+from utils.scheduler import perform_single_backup, upload_to_backup_servers
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Как часто воркер ищет новые задачи и сообщает прогресс выполняющихся
+POLL_INTERVAL = 1.0
+PROGRESS_INTERVAL = 1.0
+
+class QueuedJob:
+    """Задача из очереди в процессе воркера: прогресс и отмена для функций бэкапа"""
+
+    def __init__(self, row: Dict):
+        self.id = row['id']
+        self.connection_id = row['connection_id']
+        self.connection = row['connection']
+        self.backup_servers = row['backup_servers']
+        self.bytes_done = 0
+        self.total_bytes = None
+        # SHA-256 артефакта (его считает run_dump при записи)
+        self.checksum = None
+        self.cancelled = False
+        self.process = None
+
+    def attach_process(self, process):
+        """Привязка процесса дампа для отмены"""
+        self.process = process
+        if self.cancelled:
+            self._kill_process()
+
+    def add_bytes(self, count: int):
+        """Учет записанных байт"""
+        self.bytes_done += count
+
+    def _kill_process(self):
+        if self.process and self.process.returncode is None:
+            try:
+                self.process.kill()
+            except ProcessLookupError:
+                pass
+
+    def cancel(self):
+        """Отмена задачи: процесс дампа убивается, задача завершается с ошибкой"""
+        self.cancelled = True
+        self._kill_process()
+
+class BackupWorker:
+    """Воркер бэкапов: берет задачи из очереди и выполняет их.
+
+    Очередь - служебная БД бота (LocalQueue) или HTTP API бота на другом
+    узле (RemoteQueue). Метки воркера (регион, хост) определяют, какие
+    подключения он может бэкапить. Одновременно выполняется не больше
+    BACKUP_CONCURRENCY задач; прогресс служит и heartbeat задачи.
+    """
+
+    def __init__(self, queue, name: str, labels: List[str] = None, concurrency: int = None):
+        self.queue = queue
+        self.name = name
+        self.labels = list(labels or [])
+        self.concurrency = concurrency or get_limits()['concurrency']
+        self.running: Dict[int, QueuedJob] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        """Остановка после сигнала: новые задачи не берутся, текущие возвращаются в очередь"""
+        if not self._stopping.is_set():
+            logger.info(f"Воркер {self.name} останавливается")
+            self._stopping.set()
+
+    async def run(self):
+        labels = ", ".join(self.labels) or "нет"
+        logger.info(f"Воркер {self.name} запущен (метки: {labels}, одновременно задач: {self.concurrency})")
+        reporter = asyncio.create_task(self._report_progress())
+        try:
+            while not self._stopping.is_set():
+                if len(self.running) < self.concurrency and await self._claim():
+                    continue
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            reporter.cancel()
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            # Прерванные бэкапы выполнит следующий воркер
+            try:
+                requeued = await self.queue.requeue(self.name)
+                if requeued:
+                    logger.info(f"Возвращено в очередь прерванных бэкапов: {requeued}")
+            except Exception as e:
+                logger.error(f"Ошибка возврата задач в очередь: {e}")
+        logger.info(f"Воркер {self.name} остановлен")
+
+    async def _claim(self) -> bool:
+        try:
+            row = await self.queue.claim(self.name, self.labels)
+        except Exception as e:
+            logger.error(f"Ошибка чтения очереди бэкапов: {e}")
+            return False
+        if not row:
+            return False
+
+        job = QueuedJob(row)
+        self.running[job.id] = job
+        task = asyncio.create_task(self._execute(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _execute(self, job: QueuedJob):
+        backup_dir = os.getenv('BACKUP_DIR', './backups')
+        try:
+            connection = job.connection
+            if not connection:
+                await self.queue.finish(job.id, self.name, job.connection_id, 'failed', "Подключение не найдено")
+                return
+
+            previous = find_latest_artifact(backup_dir, connection['name'])
+            if previous:
+                job.total_bytes = artifact_size(previous)
+
+            uploaded, uploads, dump_seconds, upload_seconds = None, None, None, None
+            try:
+                with tracer.span('backup_job', root=True, job_id=job.id, connection_id=connection['id'], worker=self.name):
+                    started = time.monotonic()
+                    success, result = await perform_single_backup(connection, backup_dir, job=job)
+                    dump_seconds = time.monotonic() - started
+
+                    # Загрузка идет с узла воркера, рядом с базой данных, на все резервные серверы сразу
+                    if success and job.backup_servers:
+                        started = time.monotonic()
+                        uploads = await upload_to_backup_servers(result, job.backup_servers)
+                        uploaded = all(upload['uploaded'] for upload in uploads)
+                        upload_seconds = time.monotonic() - started
+            except Exception as e:
+                success, result = False, f"Неожиданная ошибка: {str(e)}"
+
+            if success:
+                status = 'done'
+                job.bytes_done = artifact_size(result)
+            elif job.cancelled:
+                status = 'cancelled'
+                result = "Бэкап отменен пользователем"
+            else:
+                status = 'failed'
+
+            accepted = await self.queue.finish(
+                job.id, self.name, connection['id'], status, result,
+                bytes_done=job.bytes_done, uploaded=uploaded, uploads=uploads,
+                dump_seconds=dump_seconds, upload_seconds=upload_seconds,
+                checksum=job.checksum if success else None
+            )
+            if accepted:
+                logger.info(f"Задача бэкапа #{job.id} ({connection['name']}) завершена: {status}")
+            else:
+                logger.warning(f"Задача бэкапа #{job.id} ({connection['name']}) передана другому воркеру, итог не сохранен")
+        except Exception as e:
+            logger.error(f"Ошибка выполнения задачи #{job.id}: {e}")
+        finally:
+            self.running.pop(job.id, None)
+
+    async def _report_progress(self):
+        """Запись прогресса в очередь и проверка запросов отмены"""
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            for job in list(self.running.values()):
+                try:
+                    stop = await self.queue.progress(job.id, self.name, job.bytes_done, job.total_bytes)
+                except Exception as e:
+                    logger.error(f"Ошибка записи прогресса задачи #{job.id}: {e}")
+                    continue
+                if stop and not job.cancelled:
+                    logger.info(f"Задача бэкапа #{job.id} отменена или передана другому воркеру")
+                    job.cancel()
@@ -0,0 +1,79 @@
+import os
+import signal
+import socket
+import asyncio
+import logging
+import logging.handlers
+import argparse
+import warnings
+from dotenv import load_dotenv
+
+# Подавление предупреждений cryptography
+warnings.filterwarnings("ignore", message=".*TripleDES.*")
+
+from utils.db import init_db
+from utils.job_queue import LocalQueue, RemoteQueue
+from utils.worker import BackupWorker
+from utils.tracing import tracer
+
+# Загрузка переменных окружения
+load_dotenv()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Воркер бэкапов: выполняет задачи из очереди бота")
+    parser.add_argument('--name', default=f"{socket.gethostname()}-{os.getpid()}", help="имя воркера в очереди, отчетах и логах")
+    parser.add_argument(
+        '--labels', default=os.getenv('WORKER_LABELS', ''),
+        help="метки узла через запятую (регион, хост): воркер берет подключения с этими метками и без меток"
+    )
+    parser.add_argument(
+        '--queue-url', default=os.getenv('WORKER_QUEUE_URL', ''),
+        help="адрес API очереди бота для воркера на другом узле (по умолчанию - служебная БД рядом)"
+    )
+    parser.add_argument('--concurrency', type=int, help="одновременных задач (по умолчанию BACKUP_CONCURRENCY)")
+    return parser.parse_args(argv)
+
+async def main(args):
+    """Запуск воркера до сигнала остановки"""
+    os.makedirs(os.getenv('BACKUP_DIR', './backups'), exist_ok=True)
+    if args.queue_url:
+        queue = RemoteQueue(args.queue_url, os.getenv('WORKER_API_TOKEN', ''))
+    else:
+        # Воркер можно запустить раньше бота: таблица очереди создается при необходимости
+        await init_db()
+        queue = LocalQueue()
+
+    tracer.process_name = args.name
+    labels = [label.strip() for label in args.labels.split(',') if label.strip()]
+    worker = BackupWorker(queue, args.name, labels, args.concurrency)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, worker.stop)
+        except NotImplementedError:
+            pass
+
+    try:
+        await worker.run()
+    finally:
+        await queue.close()
+        tracer.close()
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    # Настройка логирования: отдельный файл на воркер
+    os.makedirs('logs', exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - {args.name} - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.handlers.RotatingFileHandler(
+                f'logs/{args.name}.log', maxBytes=1024*1024, backupCount=5
+            ),
+            logging.StreamHandler()
+        ]
+    )
+
+    asyncio.run(main(args))